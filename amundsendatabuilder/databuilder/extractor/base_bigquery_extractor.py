@@ -1,13 +1,22 @@
 import json
 import logging
+import random
+import socket
+import ssl
+import threading
+import time
 from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
 import google.oauth2.service_account
 import google_auth_httplib2
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 import httplib2
 from pyhocon import ConfigTree  # noqa: F401
-from typing import List, Any  # noqa: F401
+import six
+from six.moves import zip
+from typing import List, Any, Callable, Iterable, Iterator, Optional  # noqa: F401
 
 from databuilder.extractor.base_extractor import Extractor
 
@@ -18,17 +27,89 @@ TableKey = namedtuple('TableKey', ['schema_name', 'table_name'])
 LOGGER = logging.getLogger(__name__)
 
 
+# Transport errors that googleapiclient retries
+TRANSPORT_ERRORS = (socket.timeout, ssl.SSLError, httplib2.ServerNotFoundError,
+                    ConnectionError if six.PY3 else socket.error)  # noqa: F821
+# Reasons of 403 error that BigQuery and other Google APIs respond with when rate limit is exceeded
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+def is_retryable_error(error):
+    # type: (Exception) -> bool
+    """
+    Same conditions as googleapiclient's retry.
+    :return: True if the request failed with rate limit (429, or 403 with rate limit reason), server (5xx), or
+    transport error (e.g: socket timeout), which can be retried
+    """
+    if isinstance(error, TRANSPORT_ERRORS):
+        return True
+
+    if not isinstance(error, HttpError):
+        return False
+
+    status = error.resp.status
+    if status == 429 or status >= 500:
+        return True
+
+    if status != 403 or not error.content:
+        return False
+
+    try:
+        data = json.loads(error.content.decode('utf-8'))
+        if isinstance(data, dict):
+            reason = data['error']['errors'][0]['reason']
+        else:
+            reason = data[0]['error']['errors']['reason']
+    except (UnicodeDecodeError, ValueError, KeyError, IndexError, TypeError):
+        return False
+    return reason in RATE_LIMIT_REASONS
+
+
+class _RateLimiter(object):
+    """
+    Spaces out requests across threads to at most max_per_sec per second.
+    """
+    def __init__(self, max_per_sec):
+        # type: (float) -> None
+        self._interval = 1.0 / max_per_sec
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self):
+        # type: () -> None
+        with self._lock:
+            now = time.time()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+
 class BaseBigQueryExtractor(Extractor):
+    """
+    A base extractor for bigquery, which iterates over the tables in all datasets of the project.
+
+    With num_threads more than 1, tables of the datasets are listed concurrently, and so are the requests that
+    subclasses send per table via _map_concurrently, while records are still provided in the order of the datasets
+    and tables. Each thread uses its own authorized HTTP client, as httplib2 is not thread safe. Requests can be
+    limited to max_requests_per_sec across threads including retries, and are retried up to num_retries times with
+    exponential backoff on rate limit and server errors.
+    """
     PROJECT_ID_KEY = 'project_id'
     KEY_PATH_KEY = 'key_path'
     # sometimes we don't have a key path, but only have an variable
     CRED_KEY = 'project_cred'
     PAGE_SIZE_KEY = 'page_size'
     FILTER_KEY = 'filter'
+    NUM_THREADS_KEY = 'num_threads'
+    MAX_REQUESTS_PER_SEC_KEY = 'max_requests_per_sec'
+    NUM_RETRIES_KEY = 'num_retries'
     _DEFAULT_SCOPES = ['https://www.googleapis.com/auth/bigquery.readonly', ]
     DEFAULT_PAGE_SIZE = 300
     NUM_RETRIES = 3
     DATE_LENGTH = 8
+    # Number of items in flight per thread in _map_concurrently
+    _WINDOW_SIZE_PER_THREAD = 4
 
     def init(self, conf):
         # type: (ConfigTree) -> None
@@ -58,6 +139,15 @@ class BaseBigQueryExtractor(Extractor):
         authed_http = google_auth_httplib2.AuthorizedHttp(credentials, http=http)
         self.bigquery_service = build('bigquery', 'v2', http=authed_http, cache_discovery=False)
         self.logging_service = build('logging', 'v2', http=authed_http, cache_discovery=False)
+
+        self._credentials = credentials
+        self.num_retries = conf.get_int(BaseBigQueryExtractor.NUM_RETRIES_KEY, BaseBigQueryExtractor.NUM_RETRIES)
+        max_requests_per_sec = conf.get_float(BaseBigQueryExtractor.MAX_REQUESTS_PER_SEC_KEY, 0)
+        self._rate_limiter = _RateLimiter(max_requests_per_sec) if max_requests_per_sec > 0 else None
+        self.num_threads = conf.get_int(BaseBigQueryExtractor.NUM_THREADS_KEY, 1)
+        self._thread_pool = ThreadPool(self.num_threads) if self.num_threads > 1 else None
+        self._thread_local = threading.local()
+
         self.iter = iter(self._iterate_over_tables())
 
     def extract(self):
@@ -71,12 +161,92 @@ class BaseBigQueryExtractor(Extractor):
         suffix = table_id[-BaseBigQueryExtractor.DATE_LENGTH:]
         return suffix.isdigit()
 
+    def _execute(self, request):
+        # type: (Any) -> Any
+        """
+        Executes API request, using the HTTP client of current thread when running concurrently. Rate limit, server
+        and transport errors are retried up to num_retries times with exponential backoff, where each attempt goes
+        through the rate limiter, so that retries under the rate limit errors don't exceed max_requests_per_sec.
+        :param request: googleapiclient.http.HttpRequest
+        :return: Response
+        """
+        attempt = 0
+        while True:
+            if self._rate_limiter:
+                self._rate_limiter.acquire()
+
+            try:
+                if not self._thread_pool:
+                    return request.execute()
+                return request.execute(http=self._get_thread_http())
+            except (HttpError,) + TRANSPORT_ERRORS as e:
+                if attempt >= self.num_retries or not is_retryable_error(e):
+                    raise
+
+                attempt += 1
+                delay = random.random() * 2 ** attempt
+                LOGGER.warning('Retrying request in {:.1f} seconds after error {!r} ({} of {})'
+                               .format(delay, e, attempt, self.num_retries))
+                time.sleep(delay)
+
+    def _get_thread_http(self):
+        # type: () -> Any
+        http = getattr(self._thread_local, 'http', None)
+        if not http:
+            http = google_auth_httplib2.AuthorizedHttp(self._credentials, http=httplib2.Http())
+            self._thread_local.http = http
+        return http
+
+    def _map_concurrently(self, func, items):
+        # type: (Callable, Iterable[Any]) -> Iterator[Any]
+        """
+        Applies func to items on the thread pool, a window of items at a time to bound the results in memory.
+        Without the thread pool, it's applied sequentially.
+        :return: Results in the order of items
+        """
+        if not self._thread_pool:
+            for item in items:
+                yield func(item)
+            return
+
+        window_size = self.num_threads * BaseBigQueryExtractor._WINDOW_SIZE_PER_THREAD
+        window = []  # type: List[Any]
+        for item in items:
+            window.append(item)
+            if len(window) == window_size:
+                for result in self._thread_pool.map(func, window):
+                    yield result
+                window = []
+
+        if window:
+            for result in self._thread_pool.map(func, window):
+                yield result
+
     def _iterate_over_tables(self):
         # type: () -> Any
-        for dataset in self._retrieve_datasets():
-            for entry in self._retrieve_tables(dataset):
+        datasets = self._retrieve_datasets()
+        for dataset, tables in zip(datasets, self._map_concurrently(self._list_tables, datasets)):
+            for entry in self._retrieve_tables(dataset, tables):
                 yield(entry)
 
+    def _retrieve_tables(self, dataset, tables):
+        # type: (DatasetRef, List[dict]) -> Iterator[Any]
+        """
+        Provides records from the tables of the dataset. Extractors that iterate over tables override it, and it
+        provides nothing by default.
+        :param dataset:
+        :param tables: Tables in the dataset from tables().list
+        :return:
+        """
+        return iter([])
+
+    def _list_tables(self, dataset):
+        # type: (DatasetRef) -> List[dict]
+        tables = []  # type: List[dict]
+        for page in self._page_table_list_results(dataset):
+            tables.extend(page.get('tables', []))
+        return tables
+
     def _retrieve_datasets(self):
         # type: () -> List[DatasetRef]
         datasets = []
@@ -93,47 +263,50 @@ class BaseBigQueryExtractor(Extractor):
 
     def _page_dataset_list_results(self):
         # type: () -> Any
-        response = self.bigquery_service.datasets().list(
+        response = self._execute(self.bigquery_service.datasets().list(
             projectId=self.project_id,
             all=False,  # Do not return hidden datasets
             filter=self.filter,
-            maxResults=self.pagesize).execute(
-                num_retries=BaseBigQueryExtractor.NUM_RETRIES)
+            maxResults=self.pagesize))
 
         while response:
             yield response
 
             if 'nextPageToken' in response:
-                response = self.bigquery_service.datasets().list(
+                response = self._execute(self.bigquery_service.datasets().list(
                     projectId=self.project_id,
                     all=True,
                     filter=self.filter,
-                    pageToken=response['nextPageToken']).execute(
-                        num_retries=BaseBigQueryExtractor.NUM_RETRIES)
+                    pageToken=response['nextPageToken']))
             else:
                 response = None
 
     def _page_table_list_results(self, dataset):
         # type: (DatasetRef) -> Any
-        response = self.bigquery_service.tables().list(
+        response = self._execute(self.bigquery_service.tables().list(
             projectId=dataset.projectId,
             datasetId=dataset.datasetId,
-            maxResults=self.pagesize).execute(
-                num_retries=BaseBigQueryExtractor.NUM_RETRIES)
+            maxResults=self.pagesize))
 
         while response:
             yield response
 
             if 'nextPageToken' in response:
-                response = self.bigquery_service.tables().list(
+                response = self._execute(self.bigquery_service.tables().list(
                     projectId=dataset.projectId,
                     datasetId=dataset.datasetId,
                     maxResults=self.pagesize,
-                    pageToken=response['nextPageToken']).execute(
-                        num_retries=BaseBigQueryExtractor.NUM_RETRIES)
+                    pageToken=response['nextPageToken']))
             else:
                 response = None
 
     def get_scope(self):
         # type: () -> str
         return 'extractor.bigquery_table_metadata'
+
+    def close(self):
+        # type: () -> None
+        if self._thread_pool:
+            self._thread_pool.close()
+            self._thread_pool.join()
+            self._thread_pool = None
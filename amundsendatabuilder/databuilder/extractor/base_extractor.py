@@ -1,7 +1,7 @@
 import abc
 
 from pyhocon import ConfigTree  # noqa: F401
-from typing import Any  # noqa: F401
+from typing import Any, List  # noqa: F401
 
 from databuilder import Scoped
 
@@ -24,6 +24,21 @@ class Extractor(Scoped):
         """
         return None
 
+    def extract_batch(self, batch_size):
+        # type: (int) -> List[Any]
+        """
+        Extracts up to batch_size records. Extractor can override it to extract records in batch natively.
+        :param batch_size:
+        :return: Provides records where fewer than batch_size records means no more to extract
+        """
+        records = []
+        while len(records) < batch_size:
+            record = self.extract()
+            if not record:
+                break
+            records.append(record)
+        return records
+
     def get_scope(self):
         # type: () -> str
         return 'extractor'
@@ -2,6 +2,7 @@ import logging
 from collections import namedtuple
 
 from pyhocon import ConfigTree  # noqa: F401
+from six.moves import zip
 from typing import List, Any  # noqa: F401
 
 from databuilder.extractor.base_bigquery_extractor import BaseBigQueryExtractor
@@ -31,55 +32,61 @@ class BigQueryMetadataExtractor(BaseBigQueryExtractor):
         BaseBigQueryExtractor.init(self, conf)
         self.grouped_tables = set([])
 
-    def _retrieve_tables(self, dataset):
-        # type: () -> Any
-        for page in self._page_table_list_results(dataset):
-            if 'tables' not in page:
-                continue
-
-            for table in page['tables']:
-                tableRef = table['tableReference']
-                table_id = tableRef['tableId']
-
-                # BigQuery tables that have 8 digits as last characters are
-                # considered date range tables and are grouped together in the UI.
-                # ( e.g. ga_sessions_20190101, ga_sessions_20190102, etc. )
-                if self._is_sharded_table(table_id):
-                    # If the last eight characters are digits, we assume the table is of a table date range type
-                    # and then we only need one schema definition
-                    table_prefix = table_id[:-BigQueryMetadataExtractor.DATE_LENGTH]
-                    if table_prefix in self.grouped_tables:
-                        # If one table in the date range is processed, then ignore other ones
-                        # (it adds too much metadata)
-                        continue
-
-                    table_id = table_prefix
-                    self.grouped_tables.add(table_prefix)
-
-                table = self.bigquery_service.tables().get(
-                    projectId=tableRef['projectId'],
-                    datasetId=tableRef['datasetId'],
-                    tableId=tableRef['tableId']).execute(num_retries=BigQueryMetadataExtractor.NUM_RETRIES)
-
-                # BigQuery tables also have interesting metadata about partitioning
-                # data location (EU/US), mod/create time, etc... Extract that some other time?
-                schema = table['schema']
-                cols = []
-                if 'fields' in schema:
-                    total_cols = 0
-                    for column in schema['fields']:
-                        total_cols = self._iterate_over_cols('', column, cols, total_cols + 1)
-
-                table_meta = TableMetadata(
-                    database='bigquery',
-                    cluster=tableRef['projectId'],
-                    schema_name=tableRef['datasetId'],
-                    name=table_id,
-                    description=table.get('description', ''),
-                    columns=cols,
-                    is_view=table['type'] == 'VIEW')
-
-                yield(table_meta)
+    def _retrieve_tables(self, dataset, tables):
+        # type: (DatasetRef, List[dict]) -> Any
+        table_ids = []
+        table_refs = []
+        for table in tables:
+            tableRef = table['tableReference']
+            table_id = tableRef['tableId']
+
+            # BigQuery tables that have 8 digits as last characters are
+            # considered date range tables and are grouped together in the UI.
+            # ( e.g. ga_sessions_20190101, ga_sessions_20190102, etc. )
+            if self._is_sharded_table(table_id):
+                # If the last eight characters are digits, we assume the table is of a table date range type
+                # and then we only need one schema definition
+                table_prefix = table_id[:-BigQueryMetadataExtractor.DATE_LENGTH]
+                if table_prefix in self.grouped_tables:
+                    # If one table in the date range is processed, then ignore other ones
+                    # (it adds too much metadata)
+                    continue
+
+                table_id = table_prefix
+                self.grouped_tables.add(table_prefix)
+
+            table_ids.append(table_id)
+            table_refs.append(tableRef)
+
+        # Tables of the dataset are fetched concurrently with num_threads, and provided in the listed order
+        for table_id, tableRef, table in zip(table_ids, table_refs,
+                                             self._map_concurrently(self._get_table, table_refs)):
+            # BigQuery tables also have interesting metadata about partitioning
+            # data location (EU/US), mod/create time, etc... Extract that some other time?
+            schema = table['schema']
+            cols = []
+            if 'fields' in schema:
+                total_cols = 0
+                for column in schema['fields']:
+                    total_cols = self._iterate_over_cols('', column, cols, total_cols + 1)
+
+            table_meta = TableMetadata(
+                database='bigquery',
+                cluster=tableRef['projectId'],
+                schema_name=tableRef['datasetId'],
+                name=table_id,
+                description=table.get('description', ''),
+                columns=cols,
+                is_view=table['type'] == 'VIEW')
+
+            yield(table_meta)
+
+    def _get_table(self, tableRef):
+        # type: (dict) -> dict
+        return self._execute(self.bigquery_service.tables().get(
+            projectId=tableRef['projectId'],
+            datasetId=tableRef['datasetId'],
+            tableId=tableRef['tableId']))
 
     def _iterate_over_cols(self, parent, column, cols, total_cols):
         # type: (str, str, List[ColumnMetadata()], int) -> int
@@ -1,13 +1,15 @@
 from collections import namedtuple
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 import logging
 import re
 from time import sleep
 
+from googleapiclient.errors import HttpError
 from pyhocon import ConfigTree  # noqa: F401
-from typing import Dict, Optional  # noqa: F401
+from typing import Dict, Iterator, List, Optional, Tuple  # noqa: F401
 
-from databuilder.extractor.base_bigquery_extractor import BaseBigQueryExtractor
+from databuilder.extractor.base_bigquery_extractor import BaseBigQueryExtractor, TRANSPORT_ERRORS, \
+    is_retryable_error
 
 TableColumnUsageTuple = namedtuple('TableColumnUsageTuple', ['database', 'cluster', 'schema',
                                                              'table', 'column', 'email'])
@@ -20,10 +22,28 @@ class BigQueryTableUsageExtractor(BaseBigQueryExtractor):
     An aggregate extractor for bigquery table usage. This class takes the data from
     the stackdriver logging API by filtering on timestamp, bigquery_resource and looking
     for referencedTables in the response.
+
+    With num_time_slices more than 1, the window from timestamp to end_timestamp is split into that many time
+    slices, which are fetched concurrently on the thread pool of num_threads with log_page_size, only requesting the
+    fields of the log entries that are read. Usage counted per slice is merged as each slice completes, and
+    aggregation is deferred to the first extract call instead of init.
     """
     TIMESTAMP_KEY = 'timestamp'
+    END_TIMESTAMP_KEY = 'end_timestamp'
+    NUM_TIME_SLICES_KEY = 'num_time_slices'
+    LOG_PAGE_SIZE_KEY = 'log_page_size'
     _DEFAULT_SCOPES = ('https://www.googleapis.com/auth/cloud-platform',)
     EMAIL_PATTERN = 'email_pattern'
+    # Maximum page size of the logging API
+    DEFAULT_LOG_PAGE_SIZE = 1000
+    # Seconds to wait before retrying, when the logging API quota is exceeded
+    DELAY_TIME = 10
+    TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+    # Partial response of entries().list with only the fields read by _count_entry_usage
+    ENTRY_FIELDS = ('nextPageToken,'
+                    'entries(protoPayload/authenticationInfo/principalEmail,'
+                    'protoPayload/serviceData/jobCompletedEvent/job('
+                    'jobName/jobId,jobStatus,jobStatistics(referencedTables,totalTablesProcessed)))')
 
     def init(self, conf):
         # type: (ConfigTree) -> None
@@ -35,10 +55,19 @@ class BigQueryTableUsageExtractor(BaseBigQueryExtractor):
         self.email_pattern = conf.get_string(BigQueryTableUsageExtractor.EMAIL_PATTERN, None)
 
         self.table_usage_counts = {}
-        self._count_usage()
-        self.iter = iter(self.table_usage_counts)
+        self.num_time_slices = conf.get_int(BigQueryTableUsageExtractor.NUM_TIME_SLICES_KEY, 1)
+        if self.num_time_slices > 1:
+            self.end_timestamp = conf.get_string(BigQueryTableUsageExtractor.END_TIMESTAMP_KEY,
+                                                 datetime.utcnow().strftime(
+                                                     BigQueryTableUsageExtractor.TIMESTAMP_FORMAT))
+            self.log_pagesize = conf.get_int(BigQueryTableUsageExtractor.LOG_PAGE_SIZE_KEY,
+                                             BigQueryTableUsageExtractor.DEFAULT_LOG_PAGE_SIZE)
+            self.iter = self._iterate_over_sliced_usage()
+        else:
+            self._count_usage()
+            self.iter = iter(self.table_usage_counts)
 
-    def _count_usage(self):  # noqa: C901
+    def _count_usage(self):
         # type: () -> None
         count = 0
         for entry in self._retrieve_records():
@@ -46,49 +75,126 @@ class BigQueryTableUsageExtractor(BaseBigQueryExtractor):
             if count % self.pagesize == 0:
                 LOGGER.info('Aggregated {} records'.format(count))
 
-            try:
-                job = entry['protoPayload']['serviceData']['jobCompletedEvent']['job']
-            except Exception:
-                # Skip the record if the record missing certain fields
-                continue
-            if job['jobStatus']['state'] != 'DONE':
-                # This job seems not to have finished yet, so we ignore it.
-                continue
-            if len(job['jobStatus'].get('error', {})) > 0:
-                # This job has errors, so we ignore it
-                continue
-
-            email = entry['protoPayload']['authenticationInfo']['principalEmail']
-            refTables = job['jobStatistics'].get('referencedTables', None)
-
-            if not refTables:
-                # Query results can be cached and if the source tables remain untouched,
-                # bigquery will return it from a 24 hour cache result instead. In that
-                # case, referencedTables has been observed to be empty:
-                # https://cloud.google.com/logging/docs/reference/audit/bigquery/rest/Shared.Types/AuditData#JobStatistics
-                continue
-
-            # if email filter is provided, only the email matched with filter will be recorded.
-            if self.email_pattern:
-                if not re.match(self.email_pattern, email):
-                    # the usage account not match email pattern
-                    continue
-
-            numTablesProcessed = job['jobStatistics']['totalTablesProcessed']
-            if len(refTables) != numTablesProcessed:
-                LOGGER.warn('The number of tables listed in job {job_id} is not consistent'
-                            .format(job_id=job['jobName']['jobId']))
-
-            for refTable in refTables:
-                key = TableColumnUsageTuple(database='bigquery',
-                                            cluster=refTable['projectId'],
-                                            schema=refTable['datasetId'],
-                                            table=refTable['tableId'],
-                                            column='*',
-                                            email=email)
-
-                new_count = self.table_usage_counts.get(key, 0) + 1
-                self.table_usage_counts[key] = new_count
+            self._count_entry_usage(entry, self.table_usage_counts)
+
+    def _count_entry_usage(self, entry, table_usage_counts):
+        # type: (Dict, Dict[TableColumnUsageTuple, int]) -> None
+        """
+        Counts usage of the tables referenced by the log entry of a completed job.
+        :param entry: Log entry
+        :param table_usage_counts: Usage counts to add to
+        """
+        try:
+            job = entry['protoPayload']['serviceData']['jobCompletedEvent']['job']
+        except Exception:
+            # Skip the record if the record missing certain fields
+            return
+        if job['jobStatus']['state'] != 'DONE':
+            # This job seems not to have finished yet, so we ignore it.
+            return
+        if len(job['jobStatus'].get('error', {})) > 0:
+            # This job has errors, so we ignore it
+            return
+
+        email = entry['protoPayload']['authenticationInfo']['principalEmail']
+        refTables = job['jobStatistics'].get('referencedTables', None)
+
+        if not refTables:
+            # Query results can be cached and if the source tables remain untouched,
+            # bigquery will return it from a 24 hour cache result instead. In that
+            # case, referencedTables has been observed to be empty:
+            # https://cloud.google.com/logging/docs/reference/audit/bigquery/rest/Shared.Types/AuditData#JobStatistics
+            return
+
+        # if email filter is provided, only the email matched with filter will be recorded.
+        if self.email_pattern:
+            if not re.match(self.email_pattern, email):
+                # the usage account not match email pattern
+                return
+
+        numTablesProcessed = job['jobStatistics']['totalTablesProcessed']
+        if len(refTables) != numTablesProcessed:
+            LOGGER.warn('The number of tables listed in job {job_id} is not consistent'
+                        .format(job_id=job['jobName']['jobId']))
+
+        for refTable in refTables:
+            key = TableColumnUsageTuple(database='bigquery',
+                                        cluster=refTable['projectId'],
+                                        schema=refTable['datasetId'],
+                                        table=refTable['tableId'],
+                                        column='*',
+                                        email=email)
+
+            new_count = table_usage_counts.get(key, 0) + 1
+            table_usage_counts[key] = new_count
+
+    def _iterate_over_sliced_usage(self):
+        # type: () -> Iterator[TableColumnUsageTuple]
+        """
+        Counts usage per time slice, and merges it as each slice completes. The usage of a table is final only after
+        all slices are merged, as any log entry in the window can reference the table, so keys are provided from then.
+        """
+        time_slices = self._get_time_slices()
+        if self._thread_pool:
+            slice_usage_counts = self._thread_pool.imap_unordered(self._count_slice_usage, time_slices)
+        else:
+            slice_usage_counts = (self._count_slice_usage(time_slice) for time_slice in time_slices)
+
+        for i, usage_counts in enumerate(slice_usage_counts, 1):
+            for key, count in usage_counts.items():
+                self.table_usage_counts[key] = self.table_usage_counts.get(key, 0) + count
+            LOGGER.info('Merged {} of {} time slices, with {} table usages'
+                        .format(i, len(time_slices), len(self.table_usage_counts)))
+
+        for key in self.table_usage_counts:
+            yield key
+
+    def _get_time_slices(self):
+        # type: () -> List[Tuple[str, str]]
+        """
+        Splits the window from timestamp to end_timestamp into num_time_slices even time slices, of which bounds are
+        in seconds. Timestamps are in UTC, and fraction of seconds is ignored.
+        :return: (start, end) timestamp per time slice
+        """
+        start = datetime.strptime(self.timestamp[:19], BigQueryTableUsageExtractor.TIMESTAMP_FORMAT[:-1])
+        end = datetime.strptime(self.end_timestamp[:19], BigQueryTableUsageExtractor.TIMESTAMP_FORMAT[:-1])
+        if end <= start:
+            raise ValueError('End timestamp {} should be after timestamp {}'.format(self.end_timestamp,
+                                                                                    self.timestamp))
+
+        step = (end - start) // self.num_time_slices
+        bounds = [(start + step * i).strftime(BigQueryTableUsageExtractor.TIMESTAMP_FORMAT)
+                  for i in range(self.num_time_slices)]
+        bounds.append(end.strftime(BigQueryTableUsageExtractor.TIMESTAMP_FORMAT))
+        # Bounds can be duplicated when the window is shorter than the number of slices in seconds
+        return [(bounds[i], bounds[i + 1]) for i in range(self.num_time_slices) if bounds[i] < bounds[i + 1]]
+
+    def _count_slice_usage(self, time_slice):
+        # type: (Tuple[str, str]) -> Dict[TableColumnUsageTuple, int]
+        """
+        :param time_slice: (start, end) timestamp
+        :return: Usage counts of the log entries in the time slice
+        """
+        start, end = time_slice
+        body = {
+            'resourceNames': [
+                'projects/{project_id}'.format(project_id=self.project_id)
+            ],
+            'pageSize': self.log_pagesize,
+            'filter': 'resource.type="bigquery_resource" AND '
+                      'protoPayload.methodName="jobservice.jobcompleted" AND '
+                      'timestamp >= "{start}" AND timestamp < "{end}"'.format(start=start, end=end)
+        }
+
+        table_usage_counts = {}  # type: Dict[TableColumnUsageTuple, int]
+        count = 0
+        for page in self._page_over_results(body, fields=BigQueryTableUsageExtractor.ENTRY_FIELDS):
+            for entry in page['entries']:
+                self._count_entry_usage(entry, table_usage_counts)
+            count += len(page['entries'])
+
+        LOGGER.info('Aggregated {} records from {} to {}'.format(count, start, end))
+        return table_usage_counts
 
     def _retrieve_records(self):
         # type: () -> Optional[Dict]
@@ -119,22 +225,43 @@ class BigQueryTableUsageExtractor(BaseBigQueryExtractor):
         except StopIteration:
             return None
 
-    def _page_over_results(self, body):
-        # type: (Dict) -> Optional[Dict]
-        response = self.logging_service.entries().list(body=body).execute(
-            num_retries=BigQueryTableUsageExtractor.NUM_RETRIES)
+    def _page_over_results(self, body, fields=None):
+        # type: (Dict, Optional[str]) -> Optional[Dict]
+        """
+        :param body: Body of entries().list
+        :param fields: Partial response to request, or None for full log entries
+        """
+        response = self._list_entries(body, fields)
         while response:
             if 'entries' in response:
                 yield response
 
+            if 'nextPageToken' not in response:
+                return
+
+            body['pageToken'] = response['nextPageToken']
+            response = self._list_entries(body, fields)
+
+    def _list_entries(self, body, fields):
+        # type: (Dict, Optional[str]) -> Dict
+        """
+        Requests a page of log entries. Each request is retried with short backoff by _execute. As the logging API
+        quota is per minute, a page that still fails with rate limit, server or transport error is retried after
+        DELAY_TIME up to num_retries times. Other errors (e.g: invalid filter or field mask) are raised as is, so that
+        a worker thread of a time slice doesn't hang on them.
+        """
+        kwargs = {'fields': fields} if fields else {}
+        attempt = 0
+        while True:
             try:
-                if 'nextPageToken' in response:
-                    body['pageToken'] = response['nextPageToken']
-                    response = self.logging_service.entries().list(body=body).execute(
-                        num_retries=BigQueryTableUsageExtractor.NUM_RETRIES)
-                else:
-                    response = None
-            except Exception:
+                return self._execute(self.logging_service.entries().list(body=body, **kwargs))
+            except (HttpError,) + TRANSPORT_ERRORS as e:
+                if attempt >= self.num_retries or not is_retryable_error(e):
+                    raise
+
+                attempt += 1
+                LOGGER.warning('Retrying page of log entries in {} seconds after error {!r}'
+                               .format(BigQueryTableUsageExtractor.DELAY_TIME, e))
                 # Add a delay when BQ quota exceeds limitation
                 sleep(BigQueryTableUsageExtractor.DELAY_TIME)
 
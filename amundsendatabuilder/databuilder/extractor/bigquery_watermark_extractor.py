@@ -5,6 +5,7 @@ import datetime
 import textwrap
 
 from pyhocon import ConfigTree  # noqa: F401
+from six.moves import zip
 from typing import List, Any  # noqa: F401
 
 from databuilder.extractor.base_bigquery_extractor import BaseBigQueryExtractor
@@ -28,62 +29,67 @@ class BigQueryWatermarkExtractor(BaseBigQueryExtractor):
         # type: () -> str
         return 'extractor.bigquery_watermarks'
 
-    def _retrieve_tables(self, dataset):
-        # type: () -> Any
+    def _retrieve_tables(self, dataset, tables):
+        # type: (DatasetRef, List[dict]) -> Any
         sharded_table_watermarks = {}
-
-        for page in self._page_table_list_results(dataset):
-            if 'tables' not in page:
-                continue
-
-            for table in page['tables']:
-                tableRef = table['tableReference']
-                table_id = tableRef['tableId']
-
-                # BigQuery tables that have 8 digits as last characters are
-                # considered date range tables and are grouped together in the UI.
-                # ( e.g. ga_sessions_20190101, ga_sessions_20190102, etc. )
-                # We use these suffixes to determine high and low watermarks
-                if self._is_sharded_table(table_id):
-                    suffix = table_id[-BigQueryWatermarkExtractor.DATE_LENGTH:]
-                    prefix = table_id[:-BigQueryWatermarkExtractor.DATE_LENGTH]
-
-                    if prefix in sharded_table_watermarks:
-                        sharded_table_watermarks[prefix]['low'] = min(sharded_table_watermarks[prefix]['low'], suffix)
-                        sharded_table_watermarks[prefix]['high'] = max(sharded_table_watermarks[prefix]['high'], suffix)
-                    else:
-                        sharded_table_watermarks[prefix] = {'high': suffix, 'low': suffix, 'table': table}
+        partitioned_tables = []
+
+        for table in tables:
+            tableRef = table['tableReference']
+            table_id = tableRef['tableId']
+
+            # BigQuery tables that have 8 digits as last characters are
+            # considered date range tables and are grouped together in the UI.
+            # ( e.g. ga_sessions_20190101, ga_sessions_20190102, etc. )
+            # We use these suffixes to determine high and low watermarks
+            if self._is_sharded_table(table_id):
+                suffix = table_id[-BigQueryWatermarkExtractor.DATE_LENGTH:]
+                prefix = table_id[:-BigQueryWatermarkExtractor.DATE_LENGTH]
+
+                if prefix in sharded_table_watermarks:
+                    sharded_table_watermarks[prefix]['low'] = min(sharded_table_watermarks[prefix]['low'], suffix)
+                    sharded_table_watermarks[prefix]['high'] = max(sharded_table_watermarks[prefix]['high'], suffix)
                 else:
-                    partitions = self._get_partitions(table, tableRef)
-                    if not partitions:
-                        continue
-                    low, high = self._get_partition_watermarks(table, tableRef, partitions)
-                    yield low
-                    yield high
-
-            for prefix, td in sharded_table_watermarks.items():
-                table = td['table']
-                tableRef = table['tableReference']
-
-                yield Watermark(
-                    datetime.datetime.fromtimestamp(float(table['creationTime']) / 1000).strftime('%Y-%m-%d %H:%M:%S'),
-                    'bigquery',
-                    tableRef['datasetId'],
-                    prefix,
-                    '__table__={partition_id}'.format(partition_id=td['low']),
-                    part_type="low_watermark",
-                    cluster=tableRef['projectId']
-                )
-
-                yield Watermark(
-                    datetime.datetime.fromtimestamp(float(table['creationTime']) / 1000).strftime('%Y-%m-%d %H:%M:%S'),
-                    'bigquery',
-                    tableRef['datasetId'],
-                    prefix,
-                    '__table__={partition_id}'.format(partition_id=td['high']),
-                    part_type="high_watermark",
-                    cluster=tableRef['projectId']
-                )
+                    sharded_table_watermarks[prefix] = {'high': suffix, 'low': suffix, 'table': table}
+            elif 'timePartitioning' in table:
+                partitioned_tables.append(table)
+
+        # Partitions are queried concurrently with num_threads, and provided in the listed order
+        for table, partitions in zip(partitioned_tables,
+                                     self._map_concurrently(self._get_table_partitions, partitioned_tables)):
+            if not partitions:
+                continue
+            low, high = self._get_partition_watermarks(table, table['tableReference'], partitions)
+            yield low
+            yield high
+
+        for prefix, td in sharded_table_watermarks.items():
+            table = td['table']
+            tableRef = table['tableReference']
+
+            yield Watermark(
+                datetime.datetime.fromtimestamp(float(table['creationTime']) / 1000).strftime('%Y-%m-%d %H:%M:%S'),
+                'bigquery',
+                tableRef['datasetId'],
+                prefix,
+                '__table__={partition_id}'.format(partition_id=td['low']),
+                part_type="low_watermark",
+                cluster=tableRef['projectId']
+            )
+
+            yield Watermark(
+                datetime.datetime.fromtimestamp(float(table['creationTime']) / 1000).strftime('%Y-%m-%d %H:%M:%S'),
+                'bigquery',
+                tableRef['datasetId'],
+                prefix,
+                '__table__={partition_id}'.format(partition_id=td['high']),
+                part_type="high_watermark",
+                cluster=tableRef['projectId']
+            )
+
+    def _get_table_partitions(self, table):
+        # type: (dict) -> Any
+        return self._get_partitions(table, table['tableReference'])
 
     def _get_partitions(self, table, tableRef):
         if 'timePartitioning' not in table:
@@ -103,7 +109,7 @@ class BigQueryWatermarkExtractor(BaseBigQueryExtractor):
                 table=tableRef['tableId']),
             'useLegacySql': True
         }
-        result = self.bigquery_service.jobs().query(projectId=self.project_id, body=body).execute()
+        result = self._execute(self.bigquery_service.jobs().query(projectId=self.project_id, body=body))
 
         if 'rows' not in result:
             return
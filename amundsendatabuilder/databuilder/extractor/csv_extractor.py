@@ -5,6 +5,7 @@ from pyhocon import ConfigTree  # noqa: F401
 from typing import Any, Iterator  # noqa: F401
 
 from databuilder.extractor.base_extractor import Extractor
+from databuilder.utils.compression import open_file
 
 
 class CsvExtractor(Extractor):
@@ -12,7 +13,8 @@ class CsvExtractor(Extractor):
     FILE_LOCATION = 'file_location'
 
     """
-    An Extractor that extracts records via CSV.
+    An Extractor that extracts records via CSV. CSV file compressed by gzip (.gz) or zstd (.zst) is read
+    transparently.
     """
     def init(self, conf):
         # type: (ConfigTree) -> None
@@ -35,7 +37,7 @@ class CsvExtractor(Extractor):
         Create an iterator to execute sql.
         """
         if not hasattr(self, 'results'):
-            with open(self.file_location, 'r') as fin:
+            with open_file(self.file_location, 'r') as fin:
                 self.results = [dict(i) for i in csv.DictReader(fin)]
 
         if hasattr(self, 'model_class'):
@@ -1,8 +1,9 @@
 import importlib
+import itertools
 from sqlalchemy import create_engine
 
-from pyhocon import ConfigTree  # noqa: F401
-from typing import Any, Iterator  # noqa: F401
+from pyhocon import ConfigFactory, ConfigTree  # noqa: F401
+from typing import Any, Iterator, List  # noqa: F401
 
 from databuilder.extractor.base_extractor import Extractor
 
@@ -11,6 +12,14 @@ class SQLAlchemyExtractor(Extractor):
     # Config keys
     CONN_STRING = 'conn_string'
     EXTRACT_SQL = 'extract_sql'
+    # Streams the result via server-side cursor instead of buffering the whole result in client
+    STREAM_RESULTS = 'stream_results'
+    # Number of rows fetched from the cursor at a time when streaming
+    FETCH_SIZE = 'fetch_size'
+
+    DEFAULT_CONFIG = ConfigFactory.from_dict({STREAM_RESULTS: False,
+                                              FETCH_SIZE: 1000})
+
     """
     An Extractor that extracts records via SQLAlchemy. Database that supports SQLAlchemy can use this extractor
     """
@@ -20,11 +29,13 @@ class SQLAlchemyExtractor(Extractor):
         Establish connections and import data model class if provided
         :param conf:
         """
-        self.conf = conf
+        self.conf = conf.with_fallback(SQLAlchemyExtractor.DEFAULT_CONFIG)
         self.conn_string = conf.get_string(SQLAlchemyExtractor.CONN_STRING)
         self.connection = self._get_connection()
 
         self.extract_sql = conf.get_string(SQLAlchemyExtractor.EXTRACT_SQL)
+        self.stream_results = self.conf.get_bool(SQLAlchemyExtractor.STREAM_RESULTS)
+        self.fetch_size = self.conf.get_int(SQLAlchemyExtractor.FETCH_SIZE)
 
         model_class = conf.get('model_class', None)
         if model_class:
@@ -46,16 +57,35 @@ class SQLAlchemyExtractor(Extractor):
         # type: () -> None
         """
         Create an iterator to execute sql.
+        When streaming, rows are fetched from server-side cursor fetch_size rows at a time.
+        Model objects are created lazily as the rows are consumed.
         """
         if not hasattr(self, 'results'):
-            self.results = self.connection.execute(self.extract_sql)
+            if self.stream_results:
+                self.results = self.connection.execution_options(stream_results=True).execute(self.extract_sql)
+            else:
+                self.results = self.connection.execute(self.extract_sql)
 
-        if hasattr(self, 'model_class'):
-            results = [self.model_class(**result)
-                       for result in self.results]
+        if self.stream_results and hasattr(self.results, 'fetchmany'):
+            results = self._fetch_many()  # type: Iterator[Any]
         else:
-            results = self.results
-        self.iter = iter(results)
+            results = iter(self.results)
+
+        if hasattr(self, 'model_class'):
+            results = (self.model_class(**result) for result in results)
+        self.iter = results
+
+    def _fetch_many(self):
+        # type: () -> Iterator[Any]
+        """
+        Iterates the result fetching fetch_size rows at a time.
+        """
+        while True:
+            rows = self.results.fetchmany(self.fetch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row
 
     def extract(self):
         # type: () -> Any
@@ -70,6 +100,13 @@ class SQLAlchemyExtractor(Extractor):
         except Exception as e:
             raise e
 
+    def extract_batch(self, batch_size):
+        # type: (int) -> List[Any]
+        """
+        Provides up to batch_size sql results at once.
+        """
+        return list(itertools.islice(self.iter, batch_size))
+
     def get_scope(self):
         # type: () -> str
         return 'extractor.sqlalchemy'
@@ -1,8 +1,12 @@
 from collections import namedtuple
+import csv
 import logging
+import os
+import shutil
+import tempfile
 
 from pyhocon import ConfigTree  # noqa: F401
-from typing import Dict, List, Any, Optional  # noqa: F401
+from typing import Dict, Iterator, List, Any, Optional  # noqa: F401
 
 from databuilder import Scoped
 from databuilder.transformer.base_transformer import NoopTransformer
@@ -20,6 +24,18 @@ LOGGER = logging.getLogger(__name__)
 
 # Config keys:
 RAW_EXTRACTOR = 'raw_extractor'
+# Number of keys aggregated in memory before spilling them to disk. 0 to aggregate everything in memory.
+SPILL_THRESHOLD = 'spill_threshold'
+# Number of hash partitions (spill files) where spilled keys are distributed
+NUM_PARTITIONS = 'num_partitions'
+# Directory where spill files are created. System temp directory if not set.
+SPILL_DIR = 'spill_dir'
+# Maximum number of ColumnReader in a TableColumnUsage record. 0 for no limit.
+CHUNK_SIZE = 'chunk_size'
+
+DEFAULT_SPILL_THRESHOLD = 0
+DEFAULT_NUM_PARTITIONS = 16
+DEFAULT_CHUNK_SIZE = 0
 
 
 class TblColUsgAggExtractor(Extractor):
@@ -31,6 +47,11 @@ class TblColUsgAggExtractor(Extractor):
     All usage will be aggregated in memory and on last record, it will return aggregated TableColumnUsage
     Note that this extractor will do all the transformation and aggregation so that no more transformation is needed,
     after this.
+
+    With spill_threshold set, aggregation becomes external: once the number of keys in memory reaches the threshold,
+    they are hash partitioned into num_partitions spill files on disk, and each partition is merged separately at the
+    end. This bounds memory to the threshold or the size of a partition, whichever is bigger. With chunk_size set,
+    aggregated usage is provided in multiple TableColumnUsage records of at most chunk_size ColumnReaders.
     """
 
     def init(self, conf):
@@ -48,39 +69,165 @@ class TblColUsgAggExtractor(Extractor):
         sql_to_usage_transformer = SqlToTblColUsageTransformer()
         sql_to_usage_transformer.init(Scoped.get_scoped_conf(conf, sql_to_usage_transformer.get_scope()))
 
+        self._regex_transformer = regex_transformer
+        self._sql_to_usage_transformer = sql_to_usage_transformer
         self._transformer = ChainedTransformer((regex_transformer, sql_to_usage_transformer))
 
+        self._spill_threshold = conf.get_int(SPILL_THRESHOLD, DEFAULT_SPILL_THRESHOLD)
+        self._num_partitions = conf.get_int(NUM_PARTITIONS, DEFAULT_NUM_PARTITIONS)
+        if self._num_partitions < 1:
+            raise ValueError('{} should be positive: {}'.format(NUM_PARTITIONS, self._num_partitions))
+        self._spill_dir = conf.get_string(SPILL_DIR, None)
+        self._chunk_size = conf.get_int(CHUNK_SIZE, DEFAULT_CHUNK_SIZE)
+
+        self._spill_path = None  # type: Optional[str]
+        self._spill_count = 0
+        self._iter = None  # type: Optional[Iterator[TableColumnUsage]]
+
     def extract(self):
         # type: () -> Optional[TableColumnUsage]
         """
-        It aggregates all count per table and user in memory. Table level aggregation don't expect to occupy much
-        memory.
+        It aggregates all count per table and user, in memory or in spill files when spill_threshold is reached.
         :return: Provides a record or None if no more to extract
         """
-        count_map = {}  # type: Dict[TableColumnUsageTuple, int]
-        record = self._extractor.extract()
+        if not self._iter:
+            self._iter = self._get_extract_iter()
 
-        count = 0
-        while record:
-            count += 1
-            if count % 1000 == 0:
-                LOGGER.info('Aggregated {} records'.format(count))
+        try:
+            return next(self._iter)
+        except StopIteration:
+            return None
 
-            tbl_col_usg = self._transformer.transform(record=record)
-            record = self._extractor.extract()
-            # filtered case
-            if not tbl_col_usg:
-                continue
+    def _get_extract_iter(self):
+        # type: () -> Iterator[TableColumnUsage]
+        count_map = self._aggregate()
+
+        if not self._spill_path:
+            for record in self._get_chunks(count_map):
+                yield record
+            return
+
+        # Keys aggregated in memory are spilled as well, so that all counts of a key are in the same partition
+        self._spill(count_map)
+        LOGGER.info('Spilled {} times into {} partitions. Merging partitions'
+                    .format(self._spill_count, self._num_partitions))
+        try:
+            for partition in range(self._num_partitions):
+                for record in self._get_chunks(self._merge_partition(partition)):
+                    yield record
+        finally:
+            self._remove_spill_files()
+
+    def _aggregate(self):
+        # type: () -> Dict[TableColumnUsageTuple, int]
+        """
+        Aggregates usage from raw extractor. Keys are spilled to disk whenever spill_threshold is reached.
+        :return: Counts aggregated in memory, which are not spilled
+        """
+        count_map = {}  # type: Dict[TableColumnUsageTuple, int]
 
+        for tbl_col_usg in self._transform_all():
             for col_rdr in tbl_col_usg.col_readers:
                 key = TableColumnUsageTuple(database=col_rdr.database, cluster=col_rdr.cluster, schema=col_rdr.schema,
                                             table=col_rdr.table, column=col_rdr.column, email=col_rdr.user_email)
                 new_count = count_map.get(key, 0) + col_rdr.read_count
                 count_map[key] = new_count
 
-        if not len(count_map):
-            return None
+            if self._spill_threshold > 0 and len(count_map) >= self._spill_threshold:
+                self._spill(count_map)
+
+        return count_map
 
+    def _transform_all(self):
+        # type: () -> Iterator[TableColumnUsage]
+        """
+        Transforms records from raw extractor into TableColumnUsage, in batches so that SqlToTblColUsageTransformer
+        can parse statements in parallel.
+        :return:
+        """
+        batch_size = self._sql_to_usage_transformer.get_batch_size()
+        count = 0
+        record = self._extractor.extract()
+        while record:
+            batch = []
+            while record and len(batch) < batch_size:
+                count += 1
+                if count % 1000 == 0:
+                    LOGGER.info('Aggregated {} records'.format(count))
+
+                transformed = self._regex_transformer.transform(record)
+                # filtered case
+                if transformed:
+                    batch.append(transformed)
+                record = self._extractor.extract()
+
+            for tbl_col_usg in self._sql_to_usage_transformer.transform_batch(batch):
+                # filtered case
+                if tbl_col_usg:
+                    yield tbl_col_usg
+
+    def _spill(self, count_map):
+        # type: (Dict[TableColumnUsageTuple, int]) -> None
+        """
+        Appends counts into spill file of the partition of each key, and empties the count map.
+        The same key can be in a spill file multiple times, which is summed up on merge.
+        :param count_map:
+        :return:
+        """
+        if not self._spill_path:
+            if self._spill_dir and not os.path.exists(self._spill_dir):
+                os.makedirs(self._spill_dir)
+            self._spill_path = tempfile.mkdtemp(prefix='tbl_col_usg_agg_', dir=self._spill_dir)
+            LOGGER.info('Spilling aggregation into {}'.format(self._spill_path))
+
+        self._spill_count += 1
+        LOGGER.info('Spilling {} keys'.format(len(count_map)))
+
+        files = [open(self._get_partition_file(partition), 'a') for partition in range(self._num_partitions)]
+        try:
+            writers = [csv.writer(f) for f in files]
+            while len(count_map):
+                key, count = count_map.popitem()
+                writers[hash(key) % self._num_partitions].writerow(key + (count,))
+        finally:
+            for f in files:
+                f.close()
+
+    def _merge_partition(self, partition):
+        # type: (int) -> Dict[TableColumnUsageTuple, int]
+        """
+        Sums up counts of the keys in spill file of the partition, and removes the spill file.
+        :param partition:
+        :return:
+        """
+        count_map = {}  # type: Dict[TableColumnUsageTuple, int]
+        path = self._get_partition_file(partition)
+        with open(path, 'r') as f:
+            for row in csv.reader(f):
+                key = TableColumnUsageTuple(*row[:-1])
+                count_map[key] = count_map.get(key, 0) + int(row[-1])
+        os.remove(path)
+
+        LOGGER.info('Merged {} keys from partition {}'.format(len(count_map), partition))
+        return count_map
+
+    def _get_partition_file(self, partition):
+        # type: (int) -> str
+        return os.path.join(self._spill_path, 'partition_{}.csv'.format(partition))
+
+    def _remove_spill_files(self):
+        # type: () -> None
+        if self._spill_path:
+            shutil.rmtree(self._spill_path, ignore_errors=True)
+            self._spill_path = None
+
+    def _get_chunks(self, count_map):
+        # type: (Dict[TableColumnUsageTuple, int]) -> Iterator[TableColumnUsage]
+        """
+        Provides aggregated counts as TableColumnUsage records, each with at most chunk_size ColumnReaders.
+        :param count_map: Aggregated counts, which is emptied as ColumnReaders are created
+        :return:
+        """
         col_readers = []  # type: List[ColumnReader]
 
         while len(count_map):
@@ -89,8 +236,12 @@ class TblColUsgAggExtractor(Extractor):
                                             schema=tbl_col_rdr_tuple.schema, table=tbl_col_rdr_tuple.table,
                                             column=tbl_col_rdr_tuple.column, user_email=tbl_col_rdr_tuple.email,
                                             read_count=count))
+            if len(col_readers) == self._chunk_size:
+                yield TableColumnUsage(col_readers=col_readers)
+                col_readers = []
 
-        return TableColumnUsage(col_readers=col_readers)
+        if col_readers:
+            yield TableColumnUsage(col_readers=col_readers)
 
     def get_scope(self):
         # type: () -> str
@@ -98,4 +249,5 @@ class TblColUsgAggExtractor(Extractor):
 
     def close(self):
         # type: () -> None
+        self._remove_spill_files()
         self._transformer.close()
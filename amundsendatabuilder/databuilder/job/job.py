@@ -5,9 +5,11 @@ from statsd import StatsClient
 
 from databuilder import Scoped
 from databuilder.job.base_job import Job
+from databuilder.models.neo4j_csv_serde import VALIDATION_MODE_CACHED, reset_validation, set_validation_mode
 from databuilder.publisher.base_publisher import NoopPublisher
 from databuilder.publisher.base_publisher import Publisher  # noqa: F401
 from databuilder.task.base_task import Task  # noqa: F401
+from databuilder.utils.dedup_cache import create_dedup_cache, reset_dedup_cache, set_dedup_cache
 
 LOGGER = logging.getLogger(__name__)
 
@@ -16,6 +18,8 @@ class DefaultJob(Job):
     # Config keys
     IS_STATSD_ENABLED = 'is_statsd_enabled'
     JOB_IDENTIFIER = 'identifier'
+    # Validation mode of the rows serialized by the models: cached, strict, or trusted
+    VALIDATION_MODE = 'validation_mode'
 
     """
     Default job that expects a task, and optional publisher
@@ -23,6 +27,10 @@ class DefaultJob(Job):
     amundsen.databuilder.job.[identifier] .
     Note that job.identifier is part of metrics prefix and choose unique & readable identifier for the job.
 
+    While the job runs, nodes and relations serialized by the models are deduped by the cache configured in
+    job.dedup_cache (see databuilder.utils.dedup_cache), which is discarded when the job is finished.
+    Rows are validated based on job.validation_mode (see databuilder.models.neo4j_csv_serde).
+
     To configure statsd itself, use environment variable: https://statsd.readthedocs.io/en/v3.2.1/configure.html
     """
 
@@ -49,6 +57,10 @@ class DefaultJob(Job):
 
     def _init(self):
         # type: () -> None
+        set_dedup_cache(create_dedup_cache(self.conf))
+        Job.closer.register(reset_dedup_cache)
+        set_validation_mode(self.scoped_conf.get_string(DefaultJob.VALIDATION_MODE, VALIDATION_MODE_CACHED))
+        Job.closer.register(reset_validation)
         self.task.init(self.conf)
 
     def launch(self):
@@ -0,0 +1,158 @@
+import logging
+import multiprocessing
+import os
+import shutil
+
+from pyhocon import ConfigFactory, ConfigTree  # noqa: F401
+from typing import Any, Callable, Dict, Tuple  # noqa: F401
+
+from databuilder import Scoped
+from databuilder.job.base_job import Job
+from databuilder.job.job import DefaultJob
+from databuilder.loader.file_system_neo4j_csv_loader import FsNeo4jCSVLoader
+from databuilder.publisher.base_publisher import NoopPublisher
+from databuilder.publisher.base_publisher import Publisher  # noqa: F401
+from databuilder.task.base_task import Task
+
+LOGGER = logging.getLogger(__name__)
+
+_LOADER_SCOPE = 'loader.filesystem_csv_neo4j'
+
+
+class ParallelJob(DefaultJob):
+    """
+    A job that shards extraction across worker processes and publishes once.
+
+    Each shard runs its own task created by task_factory, with the config overrides returned by
+    shard_func(shard_index, num_shards), e.g: where_clause_suffix of the extractor that selects the range of the
+    schemas (see where_clause_shard_func). FsNeo4jCSVLoader of each shard writes into shard_{index} sub-directory
+    of the configured node and relationship directories, and Neo4jCsvPublisher publishes all the sub-directories at
+    once after all shards are finished.
+
+    As task is created in the worker process, task_factory and shard_func need to be picklable, e.g: module level
+    functions.
+    """
+    # Config keys
+    NUM_SHARDS = 'num_shards'
+
+    def __init__(self,
+                 conf,
+                 task_factory,
+                 shard_func,
+                 publisher=NoopPublisher()):
+        # type: (ConfigTree, Callable[[], Task], Callable[[int, int], Dict[str, Any]], Publisher) -> None
+        super(ParallelJob, self).__init__(conf=conf,
+                                          task=_ShardedTask(task_factory=task_factory, shard_func=shard_func),
+                                          publisher=publisher)
+
+
+class _ShardedTask(Task):
+    """
+    A task that runs shards of a task in a process pool.
+    """
+    def __init__(self, task_factory, shard_func):
+        # type: (Callable[[], Task], Callable[[int, int], Dict[str, Any]]) -> None
+        self._task_factory = task_factory
+        self._shard_func = shard_func
+
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        self._conf = conf
+        self._num_shards = conf.get_int('job.{}'.format(ParallelJob.NUM_SHARDS), multiprocessing.cpu_count())
+
+        loader_conf = Scoped.get_scoped_conf(conf, _LOADER_SCOPE).with_fallback(FsNeo4jCSVLoader._DEFAULT_CONFIG)
+        self._loader_dir_keys = ['{}.{}'.format(_LOADER_SCOPE, key)
+                                 for key in (FsNeo4jCSVLoader.NODE_DIR_PATH, FsNeo4jCSVLoader.RELATION_DIR_PATH)
+                                 if key in loader_conf]
+        for key in self._loader_dir_keys:
+            self._create_directory(path=conf.get_string(key),
+                                   force_create=loader_conf.get_bool(FsNeo4jCSVLoader.FORCE_CREATE_DIR),
+                                   delete_created=loader_conf.get_bool(FsNeo4jCSVLoader.SHOULD_DELETE_CREATED_DIR))
+
+    def _create_directory(self, path, force_create, delete_created):
+        # type: (str, bool, bool) -> None
+        """
+        Creates the directory where each shard creates its sub-directory. Same as FsNeo4jCSVLoader, it's deleted
+        after publish, as shard's loader does not delete its sub-directory.
+        """
+        if os.path.exists(path):
+            if force_create:
+                LOGGER.info('Directory exist. Deleting directory {}'.format(path))
+                shutil.rmtree(path)
+            else:
+                raise RuntimeError('Directory should not exist: {}'.format(path))
+
+        os.makedirs(path)
+
+        def _delete_dir():
+            # type: () -> None
+            if not delete_created:
+                LOGGER.warn('Skip Deleting directory {}'.format(path))
+                return
+
+            LOGGER.info('Deleting directory {}'.format(path))
+            shutil.rmtree(path)
+
+        Job.closer.register(_delete_dir)
+
+    def _get_shard_conf(self, shard_index):
+        # type: (int) -> ConfigTree
+        overrides = dict(self._shard_func(shard_index, self._num_shards))
+        for key in self._loader_dir_keys:
+            overrides[key] = os.path.join(self._conf.get_string(key), 'shard_{}'.format(shard_index))
+
+        overrides['{}.{}'.format(_LOADER_SCOPE, FsNeo4jCSVLoader.SHOULD_DELETE_CREATED_DIR)] = False
+        overrides['{}.{}'.format(_LOADER_SCOPE, FsNeo4jCSVLoader.FORCE_CREATE_DIR)] = False
+        return ConfigFactory.from_dict(overrides).with_fallback(self._conf)
+
+    def run(self):
+        # type: () -> None
+        LOGGER.info('Running {} shards'.format(self._num_shards))
+        pool = multiprocessing.Pool(processes=self._num_shards)
+        try:
+            pool.map(_run_shard, [(self._task_factory, self._get_shard_conf(i), i) for i in range(self._num_shards)],
+                     chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        LOGGER.info('All {} shards are finished'.format(self._num_shards))
+
+
+def _run_shard(args):
+    # type: (Tuple[Callable[[], Task], ConfigTree, int]) -> None
+    task_factory, conf, shard_index = args
+    LOGGER.info('Running shard {}'.format(shard_index))
+    task = task_factory()
+    task.init(conf)
+    try:
+        task.run()
+    finally:
+        task.close()
+    LOGGER.info('Shard {} is finished'.format(shard_index))
+
+
+def where_clause_shard_func(conf_key, template):
+    # type: (str, str) -> Callable[[int, int], Dict[str, Any]]
+    """
+    Creates picklable shard function that sets a where clause suffix formatted with shard_index and num_shards.
+    e.g: where_clause_shard_func('extractor.hive_table_metadata.where_clause_suffix',
+                                 'WHERE MOD(CRC32(d.NAME), {num_shards}) = {shard_index}')
+    :param conf_key: Full config key of the where clause suffix
+    :param template: Where clause suffix with {shard_index} and {num_shards} placeholders
+    :return:
+    """
+    return _WhereClauseShardFunc(conf_key=conf_key, template=template)
+
+
+class _WhereClauseShardFunc(object):
+    """
+    Picklable shard function that formats where clause suffix
+    """
+    def __init__(self, conf_key, template):
+        # type: (str, str) -> None
+        self._conf_key = conf_key
+        self._template = template
+
+    def __call__(self, shard_index, num_shards):
+        # type: (int, int) -> Dict[str, Any]
+        return {self._conf_key: self._template.format(shard_index=shard_index, num_shards=num_shards)}
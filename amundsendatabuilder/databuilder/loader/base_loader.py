@@ -3,7 +3,7 @@ import abc
 from pyhocon import ConfigTree  # noqa: F401
 
 from databuilder import Scoped
-from typing import Any  # noqa: F401
+from typing import Any, List  # noqa: F401
 
 
 class Loader(Scoped):
@@ -20,6 +20,16 @@ class Loader(Scoped):
         # type: (Any) -> None
         pass
 
+    def load_batch(self, records):
+        # type: (List[Any]) -> None
+        """
+        Loads records. Loader can override it to load records in batch natively.
+        :param records:
+        :return:
+        """
+        for record in records:
+            self.load(record)
+
     def get_scope(self):
         # type: () -> str
         return 'loader'
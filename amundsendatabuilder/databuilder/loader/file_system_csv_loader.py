@@ -2,7 +2,7 @@ import csv
 import logging
 
 from pyhocon import ConfigTree  # noqa: F401
-from typing import Any  # noqa: F401
+from typing import Any, Dict  # noqa: F401
 
 from databuilder.loader.base_loader import Loader
 
@@ -33,12 +33,13 @@ class FileSystemCSVLoader(Loader):
         if not record:
             return
 
+        record_dict = _get_fields(record)
         if not hasattr(self, 'writer'):
             self.writer = csv.DictWriter(self.file_handler,
-                                         fieldnames=vars(record).keys())
+                                         fieldnames=record_dict.keys())
             self.writer.writeheader()
 
-        self.writer.writerow(vars(record))
+        self.writer.writerow(record_dict)
         self.file_handler.flush()
 
     def close(self):
@@ -56,3 +57,15 @@ class FileSystemCSVLoader(Loader):
     def get_scope(self):
         # type: () -> str
         return "loader.filesystem.csv"
+
+
+def _get_fields(record):
+    # type: (Any) -> Dict[str, Any]
+    """
+    Same as vars(record), including the record that defines __slots__
+    """
+    if hasattr(record, '__dict__'):
+        return vars(record)
+
+    return {name: getattr(record, name) for cls in reversed(type(record).__mro__)
+            for name in cls.__dict__.get('__slots__', ())}
@@ -1,6 +1,7 @@
 import os
 
 from pyhocon import ConfigTree  # noqa: F401
+from typing import List  # noqa: F401
 
 from databuilder.loader.base_loader import Loader
 from databuilder.models.elasticsearch_document import ElasticsearchDocument
@@ -56,6 +57,21 @@ class FSElasticsearchJSONLoader(Loader):
         self.file_handler.write(record.to_json())
         self.file_handler.flush()
 
+    def load_batch(self, records):
+        # type: (List[ElasticsearchDocument]) -> None
+        """
+        Write records in json format to file with single write and flush
+        :param records:
+        :return:
+        """
+        records = [record for record in records if record]
+        for record in records:
+            if not isinstance(record, ElasticsearchDocument):
+                raise Exception("Record not of type 'ElasticsearchDocument'!")
+
+        self.file_handler.write(''.join(record.to_json() for record in records))
+        self.file_handler.flush()
+
     def close(self):
         # type: () -> None
         """
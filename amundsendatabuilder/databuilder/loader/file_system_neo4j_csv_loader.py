@@ -1,43 +1,84 @@
 import csv
+import json
 import logging
 import os
 import shutil
-from csv import DictWriter  # noqa: F401
 
 from pyhocon import ConfigTree, ConfigFactory  # noqa: F401
-from typing import Dict, Any  # noqa: F401
+from typing import Dict, Any, IO, List, Tuple  # noqa: F401
 
 from databuilder.job.base_job import Job
 from databuilder.loader.base_loader import Loader
 from databuilder.models.neo4j_csv_serde import NODE_LABEL, \
     RELATION_START_LABEL, RELATION_END_LABEL, RELATION_TYPE
 from databuilder.models.neo4j_csv_serde import Neo4jCsvSerializable  # noqa: F401
+from databuilder.publisher.neo4j_csv_publisher import MANIFEST_FILE_NAME
 from databuilder.utils.closer import Closer
+from databuilder.utils.compression import get_extension, open_file
 
 LOGGER = logging.getLogger(__name__)
 
 
+class _CsvRowWriter(object):
+    """
+    Writes dict rows into CSV with the field order fixed by the header. The output is same as csv.DictWriter,
+    without its per row dict handling.
+    """
+    def __init__(self, file_out, fieldnames):
+        # type: (IO, List[str]) -> None
+        self._fieldnames = fieldnames
+        self._writer = csv.writer(file_out, quoting=csv.QUOTE_NONNUMERIC)
+
+    def writeheader(self):
+        # type: () -> None
+        self._writer.writerow(self._fieldnames)
+
+    def writerow(self, row_dict):
+        # type: (Dict[str, Any]) -> None
+        self._writer.writerow([row_dict[field] for field in self._fieldnames])
+
+    def writerows(self, row_dicts):
+        # type: (List[Dict[str, Any]]) -> None
+        fieldnames = self._fieldnames
+        self._writer.writerows([row_dict[field] for field in fieldnames] for row_dict in row_dicts)
+
+
 class FsNeo4jCSVLoader(Loader):
     """
     Write node and relationship CSV file(s) that can be consumed by
     Neo4jCsvPublisher.
     It assumes that the record it consumes is instance of Neo4jCsvSerializable
+
+    When closed, it also writes a manifest in each directory that describes
+    each CSV file with labels, headers, row count and byte size.
+
+    For a large amount of records, write buffer size can be increased, and
+    CSV files can be compressed by gzip or zstd which Neo4jCsvPublisher reads
+    transparently.
     """
     # Config keys
     NODE_DIR_PATH = 'node_dir_path'
     RELATION_DIR_PATH = 'relationship_dir_path'
     FORCE_CREATE_DIR = 'force_create_directory'
     SHOULD_DELETE_CREATED_DIR = 'delete_created_directories'
+    # Size of write buffer per CSV file in bytes. Negative number uses the default size.
+    WRITE_BUFFER_SIZE = 'write_buffer_size'
+    # Compression of CSV files: gzip, zstd, or empty for no compression
+    COMPRESSION = 'compression'
 
     _DEFAULT_CONFIG = ConfigFactory.from_dict({
         SHOULD_DELETE_CREATED_DIR: True,
-        FORCE_CREATE_DIR: False
+        FORCE_CREATE_DIR: False,
+        WRITE_BUFFER_SIZE: -1,
+        COMPRESSION: ''
     })
 
     def __init__(self):
         # type: () -> None
-        self._node_file_mapping = {}  # type: Dict[Any, DictWriter]
-        self._relation_file_mapping = {}  # type: Dict[Any, DictWriter]
+        self._node_file_mapping = {}  # type: Dict[Any, _CsvRowWriter]
+        self._relation_file_mapping = {}  # type: Dict[Any, _CsvRowWriter]
+        # Manifest entry per writer key
+        self._manifest_entries = {}  # type: Dict[Any, Dict[str, Any]]
         self._closer = Closer()
 
     def init(self, conf):
@@ -58,9 +99,14 @@ class FsNeo4jCSVLoader(Loader):
         self._delete_created_dir = \
             conf.get_bool(FsNeo4jCSVLoader.SHOULD_DELETE_CREATED_DIR)
         self._force_create_dir = conf.get_bool(FsNeo4jCSVLoader.FORCE_CREATE_DIR)
+        self._write_buffer_size = conf.get_int(FsNeo4jCSVLoader.WRITE_BUFFER_SIZE)
+        self._file_extension = '.csv{}'.format(get_extension(conf.get_string(FsNeo4jCSVLoader.COMPRESSION)))
         self._create_directory(self._node_dir)
         self._create_directory(self._relation_dir)
 
+        # Registered first so that manifest is written after all files are closed
+        self._closer.register(self._write_manifests)
+
     def _create_directory(self, path):
         # type: (str) -> None
         """
@@ -110,40 +156,86 @@ class FsNeo4jCSVLoader(Loader):
 
         node_dict = csv_serializable.next_node()
         while node_dict:
-            key = (node_dict[NODE_LABEL], len(node_dict))
-            file_suffix = '{}_{}'.format(*key)
-            node_writer = self._get_writer(node_dict,
-                                           self._node_file_mapping,
-                                           key,
-                                           self._node_dir,
-                                           file_suffix)
+            key = self._get_node_writer_key(node_dict)
+            node_writer = self._get_node_writer(node_dict, key)
             node_writer.writerow(node_dict)
+            self._manifest_entries[key]['row_count'] += 1
             node_dict = csv_serializable.next_node()
 
         relation_dict = csv_serializable.next_relation()
         while relation_dict:
-            key2 = (relation_dict[RELATION_START_LABEL],
-                    relation_dict[RELATION_END_LABEL],
-                    relation_dict[RELATION_TYPE],
-                    len(relation_dict))
-
-            file_suffix = '{}_{}_{}'.format(key2[0], key2[1], key2[2])
-            relation_writer = self._get_writer(relation_dict,
-                                               self._relation_file_mapping,
-                                               key2,
-                                               self._relation_dir,
-                                               file_suffix)
+            key2 = self._get_relation_writer_key(relation_dict)
+            relation_writer = self._get_relation_writer(relation_dict, key2)
             relation_writer.writerow(relation_dict)
+            self._manifest_entries[key2]['row_count'] += 1
             relation_dict = csv_serializable.next_relation()
 
+    def load_batch(self, csv_serializables):
+        # type: (List[Neo4jCsvSerializable]) -> None
+        """
+        Writes Neo4jCsvSerializables into CSV files. Rows are grouped by CSV file and written at once per file.
+        :param csv_serializables:
+        :return:
+        """
+        rows_per_key = {}  # type: Dict[Any, Tuple[_CsvRowWriter, List[Dict[str, Any]]]]
+        for csv_serializable in csv_serializables:
+            node_dict = csv_serializable.next_node()
+            while node_dict:
+                key = self._get_node_writer_key(node_dict)
+                if key not in rows_per_key:
+                    rows_per_key[key] = (self._get_node_writer(node_dict, key), [])
+                rows_per_key[key][1].append(node_dict)
+                node_dict = csv_serializable.next_node()
+
+            relation_dict = csv_serializable.next_relation()
+            while relation_dict:
+                key2 = self._get_relation_writer_key(relation_dict)
+                if key2 not in rows_per_key:
+                    rows_per_key[key2] = (self._get_relation_writer(relation_dict, key2), [])
+                rows_per_key[key2][1].append(relation_dict)
+                relation_dict = csv_serializable.next_relation()
+
+        for key, (writer, rows) in rows_per_key.items():
+            writer.writerows(rows)
+            self._manifest_entries[key]['row_count'] += len(rows)
+
+    @staticmethod
+    def _get_node_writer_key(node_dict):
+        # type: (Dict[str, Any]) -> Tuple[str, int]
+        return node_dict[NODE_LABEL], len(node_dict)
+
+    @staticmethod
+    def _get_relation_writer_key(relation_dict):
+        # type: (Dict[str, Any]) -> Tuple[str, str, str, int]
+        return (relation_dict[RELATION_START_LABEL],
+                relation_dict[RELATION_END_LABEL],
+                relation_dict[RELATION_TYPE],
+                len(relation_dict))
+
+    def _get_node_writer(self, node_dict, key):
+        # type: (Dict[str, Any], Tuple[str, int]) -> _CsvRowWriter
+        return self._get_writer(node_dict,
+                                self._node_file_mapping,
+                                key,
+                                self._node_dir,
+                                '{}_{}'.format(*key))
+
+    def _get_relation_writer(self, relation_dict, key):
+        # type: (Dict[str, Any], Tuple[str, str, str, int]) -> _CsvRowWriter
+        return self._get_writer(relation_dict,
+                                self._relation_file_mapping,
+                                key,
+                                self._relation_dir,
+                                '{}_{}_{}'.format(key[0], key[1], key[2]))
+
     def _get_writer(self,
                     csv_record_dict,  # type: Dict[str, Any]
-                    file_mapping,  # type: Dict[Any, DictWriter]
+                    file_mapping,  # type: Dict[Any, _CsvRowWriter]
                     key,  # type: Any
                     dir_path,  # type: str
                     file_suffix  # type: str
                     ):
-        # type: (...) -> DictWriter
+        # type: (...) -> _CsvRowWriter
         """
         Finds a writer based on csv record, key.
         If writer does not exist, it's creates a csv writer and update the
@@ -160,7 +252,8 @@ class FsNeo4jCSVLoader(Loader):
             return writer
 
         LOGGER.info('Creating file for {}'.format(key))
-        file_out = open('{}/{}.csv'.format(dir_path, file_suffix), 'w')
+        file_name = '{}{}'.format(file_suffix, self._file_extension)
+        file_out = open_file('{}/{}'.format(dir_path, file_name), 'w', self._write_buffer_size)
 
         def file_out_close():
             # type: () -> None
@@ -168,13 +261,46 @@ class FsNeo4jCSVLoader(Loader):
             file_out.close()
         self._closer.register(file_out_close)
 
-        writer = csv.DictWriter(file_out, fieldnames=csv_record_dict.keys(),
-                                quoting=csv.QUOTE_NONNUMERIC)
+        writer = _CsvRowWriter(file_out, fieldnames=list(csv_record_dict.keys()))
         writer.writeheader()
         file_mapping[key] = writer
 
+        if NODE_LABEL in csv_record_dict:
+            labels = [csv_record_dict[NODE_LABEL]]
+        else:
+            labels = [csv_record_dict[RELATION_START_LABEL], csv_record_dict[RELATION_END_LABEL]]
+        self._manifest_entries[key] = {'dir_path': dir_path,
+                                       'file_name': file_name,
+                                       'labels': labels,
+                                       'headers': list(csv_record_dict.keys()),
+                                       'row_count': 0}
+
         return writer
 
+    def _write_manifests(self):
+        # type: () -> None
+        """
+        Writes manifest into node directory and relation directory.
+        Manifest is a JSON file that has an entry per CSV file.
+        e.g: {"files": {"Column_5.csv": {"labels": ["Column"], "headers": ["KEY", "LABEL", ...],
+                                         "row_count": 100, "byte_size": 12345}}}
+        :return:
+        """
+        manifests = {self._node_dir: {}, self._relation_dir: {}}  # type: Dict[str, Dict[str, Any]]
+        for entry in self._manifest_entries.values():
+            path = '{}/{}'.format(entry['dir_path'], entry['file_name'])
+            manifests[entry['dir_path']][entry['file_name']] = {'labels': entry['labels'],
+                                                                'headers': entry['headers'],
+                                                                'row_count': entry['row_count'],
+                                                                'byte_size': os.path.getsize(path)}
+
+        for dir_path, files in manifests.items():
+            if not os.path.exists(dir_path):
+                continue
+
+            with open('{}/{}'.format(dir_path, MANIFEST_FILE_NAME), 'w') as manifest_file:
+                json.dump({'files': files}, manifest_file)
+
     def close(self):
         # type: () -> None
         """
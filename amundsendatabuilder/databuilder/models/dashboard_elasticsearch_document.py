@@ -7,6 +7,8 @@ class DashboardESDocument(ElasticsearchDocument):
     """
     Schema for the Search index document
     """
+    __slots__ = ('dashboard_group', 'dashboard_name', 'description', 'last_reload_time', 'user_id', 'user_name', 'tags')
+
     def __init__(self,
                  dashboard_group,  # type: str
                  dashboard_name,  # type: str
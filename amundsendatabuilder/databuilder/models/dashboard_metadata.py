@@ -4,6 +4,7 @@ from typing import Iterable, Any, Union, Iterator, Dict, Set  # noqa: F401
 
 # TODO: We could separate TagMetadata from table_metadata to own module
 from databuilder.models.table_metadata import TagMetadata
+from databuilder.utils.dedup_cache import is_new_shared_row
 from databuilder.models.neo4j_csv_serde import (
     Neo4jCsvSerializable, NODE_LABEL, NODE_KEY, RELATION_START_KEY, RELATION_END_KEY, RELATION_START_LABEL,
     RELATION_END_LABEL, RELATION_TYPE, RELATION_REVERSE_TYPE)
@@ -53,9 +54,6 @@ class DashboardMetadata(Neo4jCsvSerializable):
     DASHBOARD_TAG_RELATION_TYPE = 'TAG'
     TAG_DASHBOARD_RELATION_TYPE = 'TAG_OF'
 
-    serialized_nodes = set()  # type: Set[Any]
-    serialized_rels = set()  # type: Set[Any]
-
     def __init__(self,
                  dashboard_group,  # type: str
                  dashboard_name,  # type: str
@@ -214,9 +212,9 @@ class DashboardMetadata(Neo4jCsvSerializable):
                      reverse_type=DashboardMetadata.OWNER_DASHBOARD_RELATION_TYPE)
         ]
 
+        # Deduped across the records by the job's dedup cache, or by the process outside of a job
         for rel_tuple in others:
-            if rel_tuple not in DashboardMetadata.serialized_rels:
-                DashboardMetadata.serialized_rels.add(rel_tuple)
+            if is_new_shared_row(rel_tuple):
                 yield {
                     RELATION_START_LABEL: rel_tuple.start_label,
                     RELATION_END_LABEL: rel_tuple.end_label,
@@ -1,13 +1,16 @@
 import json
 from abc import ABCMeta
 
+from typing import List  # noqa: F401
+
 
 class ElasticsearchDocument:
     """
     Base class for ElasticsearchDocument
-    Each different resource ESDoc will be a subclass
+    Each different resource ESDoc will be a subclass, which defines its fields in __slots__
     """
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     def to_json(self):
         # type: () -> str
@@ -15,6 +18,21 @@ class ElasticsearchDocument:
         Convert object to json
         :return:
         """
-        obj_dict = {k: v for k, v in sorted(self.__dict__.items())}
+        obj_dict = {k: getattr(self, k) for k in sorted(self._get_field_names())}
         data = json.dumps(obj_dict) + "\n"
         return data
+
+    def _get_field_names(self):
+        # type: () -> List[str]
+        """
+        Names of the fields from __slots__ of the class hierarchy, and from __dict__ if a subclass does not
+        define __slots__
+        :return:
+        """
+        names = []  # type: List[str]
+        for cls in type(self).__mro__:
+            slots = cls.__dict__.get('__slots__', ())
+            names.extend([slots] if isinstance(slots, str) else slots)
+        if hasattr(self, '__dict__'):
+            names.extend(self.__dict__)
+        return names
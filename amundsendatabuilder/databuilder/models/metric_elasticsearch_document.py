@@ -7,6 +7,8 @@ class MetricESDocument(ElasticsearchDocument):
     """
     Schema for the Search index document
     """
+    __slots__ = ('name', 'description', 'type', 'dashboards', 'tags')
+
     def __init__(self,
                  name,  # type: str
                  description,  # type: str
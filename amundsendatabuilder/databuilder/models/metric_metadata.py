@@ -4,6 +4,7 @@ from typing import Iterable, Any, Union, Iterator, Dict, Set  # noqa: F401
 
 # TODO: We could separate TagMetadata from table_metadata to own module
 from databuilder.models.table_metadata import TagMetadata
+from databuilder.utils.dedup_cache import is_new_shared_row
 from databuilder.models.neo4j_csv_serde import (
     Neo4jCsvSerializable, NODE_LABEL, NODE_KEY, RELATION_START_KEY, RELATION_END_KEY, RELATION_START_LABEL,
     RELATION_END_LABEL, RELATION_TYPE, RELATION_REVERSE_TYPE)
@@ -58,9 +59,6 @@ class MetricMetadata(Neo4jCsvSerializable):
     METRIC_TAG_RELATION_TYPE = 'TAG'
     TAG_METRIC_RELATION_TYPE = 'TAG_OF'
 
-    serialized_nodes = set()  # type: Set[Any]
-    serialized_rels = set()  # type: Set[Any]
-
     def __init__(self,
                  dashboard_group,  # type: str
                  dashboard_name,  # type: str
@@ -153,9 +151,9 @@ class MetricMetadata(Neo4jCsvSerializable):
 
         others = []
 
+        # Deduped across the records by the job's dedup cache, or by the process outside of a job
         for node_tuple in others:
-            if node_tuple not in MetricMetadata.serialized_nodes:
-                MetricMetadata.serialized_nodes.add(node_tuple)
+            if is_new_shared_row(node_tuple):
                 yield {
                     NODE_LABEL: node_tuple.label,
                     NODE_KEY: node_tuple.key,
@@ -218,9 +216,9 @@ class MetricMetadata(Neo4jCsvSerializable):
 
         others = []
 
+        # Deduped across the records by the job's dedup cache, or by the process outside of a job
         for rel_tuple in others:
-            if rel_tuple not in MetricMetadata.serialized_rels:
-                MetricMetadata.serialized_rels.add(rel_tuple)
+            if is_new_shared_row(rel_tuple):
                 yield {
                     RELATION_START_LABEL: rel_tuple.start_label,
                     RELATION_END_LABEL: rel_tuple.end_label,
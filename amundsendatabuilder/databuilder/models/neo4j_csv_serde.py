@@ -1,11 +1,15 @@
 import abc
+import hashlib
+from operator import itemgetter
 
 import six
-from typing import Dict, Set, Any, Union  # noqa: F401
+from typing import Dict, FrozenSet, Set, Any, Union  # noqa: F401
+
+from databuilder.utils.dedup_cache import NoopDedupCache, get_dedup_cache
 
 NODE_KEY = 'KEY'
 NODE_LABEL = 'LABEL'
-NODE_REQUIRED_HEADERS = {NODE_LABEL, NODE_KEY}
+NODE_REQUIRED_HEADERS = frozenset({NODE_LABEL, NODE_KEY})
 
 RELATION_START_KEY = 'START_KEY'
 RELATION_START_LABEL = 'START_LABEL'
@@ -13,13 +17,49 @@ RELATION_END_KEY = 'END_KEY'
 RELATION_END_LABEL = 'END_LABEL'
 RELATION_TYPE = 'TYPE'
 RELATION_REVERSE_TYPE = 'REVERSE_TYPE'
-RELATION_REQUIRED_HEADERS = {RELATION_START_KEY, RELATION_START_LABEL,
-                             RELATION_END_KEY, RELATION_END_LABEL,
-                             RELATION_TYPE, RELATION_REVERSE_TYPE}
+RELATION_REQUIRED_HEADERS = frozenset({RELATION_START_KEY, RELATION_START_LABEL,
+                                       RELATION_END_KEY, RELATION_END_LABEL,
+                                       RELATION_TYPE, RELATION_REVERSE_TYPE})
 
 LABELS = {NODE_LABEL, RELATION_START_LABEL, RELATION_END_LABEL}
 TYPES = {RELATION_TYPE, RELATION_REVERSE_TYPE}
 
+# Validation modes
+# Validates each shape of the row (headers, labels, and types) once
+VALIDATION_MODE_CACHED = 'cached'
+# Validates every row
+VALIDATION_MODE_STRICT = 'strict'
+# Skips validation, for the models that are known to be valid
+VALIDATION_MODE_TRUSTED = 'trusted'
+VALIDATION_MODES = {VALIDATION_MODE_CACHED, VALIDATION_MODE_STRICT, VALIDATION_MODE_TRUSTED}
+
+_validation_mode = VALIDATION_MODE_CACHED
+# Shapes of the rows that passed validation
+_validated_shapes = set()  # type: Set[Any]
+
+
+def set_validation_mode(mode):
+    # type: (str) -> None
+    """
+    Sets how Neo4jCsvSerializable validates the rows. DefaultJob sets it from job.validation_mode.
+    :param mode: cached, strict, or trusted
+    :return:
+    """
+    if mode not in VALIDATION_MODES:
+        raise ValueError('Unsupported validation mode {}. Supported: {}'.format(mode, sorted(VALIDATION_MODES)))
+
+    global _validation_mode
+    _validation_mode = mode
+
+
+def reset_validation():
+    # type: () -> None
+    """
+    Sets validation mode back to the default and clears validated shapes.
+    """
+    set_validation_mode(VALIDATION_MODE_CACHED)
+    _validated_shapes.clear()
+
 
 @six.add_metaclass(abc.ABCMeta)
 class Neo4jCsvSerializable(object):
@@ -28,7 +68,15 @@ class Neo4jCsvSerializable(object):
     next relation in dict form so that it can be serialized to CSV file.
 
     Any model class that needs to be pushed to Neo4j should inherit this class.
+
+    Within a job, a node or a relation that is identical to the one already
+    serialized in the job is skipped (see databuilder.utils.dedup_cache).
+
+    Subclasses that are held in memory in large numbers can define __slots__
+    to avoid per instance dict.
     """
+    __slots__ = ()
+
     def __init__(self):
         # type: () -> None
         pass
@@ -77,12 +125,14 @@ class Neo4jCsvSerializable(object):
         :return: Non-nested dict where key is CSV header and each value
         is a column
         """
-        node_dict = self.create_next_node()
-        if not node_dict:
-            return None
+        while True:
+            node_dict = self.create_next_node()
+            if not node_dict:
+                return None
 
-        self._validate(NODE_REQUIRED_HEADERS, node_dict)
-        return node_dict
+            self._validate_row(NODE_REQUIRED_HEADERS, node_dict)
+            if self._is_new(node_dict):
+                return node_dict
 
     def next_relation(self):
         # type: () -> Union[Dict[str, Any], None]
@@ -94,12 +144,54 @@ class Neo4jCsvSerializable(object):
         :return: Non-nested dict where key is CSV header and each value
         is a column
         """
-        relation_dict = self.create_next_relation()
-        if not relation_dict:
-            return None
+        while True:
+            relation_dict = self.create_next_relation()
+            if not relation_dict:
+                return None
+
+            self._validate_row(RELATION_REQUIRED_HEADERS, relation_dict)
+            if self._is_new(relation_dict):
+                return relation_dict
+
+    def _is_new(self, val_dict):
+        # type: (Dict[str, Any]) -> bool
+        """
+        Checks whether the row is not serialized yet in the job.
+        :param val_dict:
+        :return:
+        """
+        dedup_cache = get_dedup_cache()
+        if isinstance(dedup_cache, NoopDedupCache):
+            return True
 
-        self._validate(RELATION_REQUIRED_HEADERS, relation_dict)
-        return relation_dict
+        return dedup_cache.add(_hash_row(val_dict))
+
+    def _validate_row(self, required_set, val_dict):
+        # type: (FrozenSet[str], Dict[str, Any]) -> None
+        """
+        Validates the row based on validation mode. In cached mode, a model emits
+        the same few shapes of rows, so only the first row of each shape, which
+        is headers with the values of labels and types, is validated.
+        :param required_set:
+        :param val_dict:
+        :return:
+        """
+        if _validation_mode == VALIDATION_MODE_TRUSTED:
+            return
+
+        if _validation_mode == VALIDATION_MODE_STRICT:
+            self._validate(required_set, val_dict)
+            return
+
+        # Spelled out rather than a loop as this runs for every row
+        shape = (required_set, tuple(val_dict), val_dict.get(NODE_LABEL),
+                 val_dict.get(RELATION_START_LABEL), val_dict.get(RELATION_END_LABEL),
+                 val_dict.get(RELATION_TYPE), val_dict.get(RELATION_REVERSE_TYPE))
+        if shape in _validated_shapes:
+            return
+
+        self._validate(required_set, val_dict)
+        _validated_shapes.add(shape)
 
     def _validate(self, required_set, val_dict):
         # type: (Set[str], Dict[str, Any]) -> None
@@ -133,3 +225,16 @@ class Neo4jCsvSerializable(object):
             raise RuntimeError(
                 'Required header missing. Required: {} , Header: {}'.format(
                     required_set, val_dict.keys()))
+
+
+def _hash_row(row_dict):
+    # type: (Dict[str, Any]) -> int
+    """
+    128 bit digest of the row regardless of the order of its columns. Unlike built-in hash, which is 64 bit and
+    collides for e.g. -1 and -2, different rows practically never share the digest, so the dedup cache does not drop
+    a row for a collision.
+    """
+    serialized = repr(sorted(six.iteritems(row_dict), key=itemgetter(0)))
+    if isinstance(serialized, six.text_type):
+        serialized = serialized.encode('utf-8')
+    return int(hashlib.md5(serialized).hexdigest(), 16)
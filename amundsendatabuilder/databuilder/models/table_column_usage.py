@@ -1,4 +1,4 @@
-from typing import Iterable, Union, Dict, Any, Iterator  # noqa: F401
+from typing import Iterable, Union, Dict, Any, Iterator, Optional  # noqa: F401
 
 from databuilder.models.neo4j_csv_serde import (
     Neo4jCsvSerializable, RELATION_START_KEY, RELATION_END_KEY,
@@ -13,6 +13,8 @@ class ColumnReader(object):
     """
     A class represent user's read action on column. Implicitly assumes that read count is one.
     """
+    __slots__ = ('database', 'cluster', 'schema', 'table', 'column', 'user_email', 'read_count')
+
     def __init__(self,
                  database,  # type: str
                  cluster,  # type: str
@@ -52,6 +54,8 @@ class TableColumnUsage(Neo4jCsvSerializable):
     # Property key for relationship read, readby relationship
     READ_RELATION_COUNT = 'read_count{}'.format(UNQUOTED_SUFFIX)
 
+    __slots__ = ('col_readers', '_node_iterator', '_rel_iter')
+
     def __init__(self,
                  col_readers,  # type: Iterable[ColumnReader]
                  ):
@@ -61,12 +65,15 @@ class TableColumnUsage(Neo4jCsvSerializable):
                 raise NotImplementedError('Column is not supported yet {}'.format(col_readers))
 
         self.col_readers = col_readers
-        self._node_iterator = self._create_node_iterator()
-        self._rel_iter = self._create_rel_iterator()
+        # Created on first use, as a generator holds a frame for each record
+        self._node_iterator = None  # type: Optional[Iterator[Any]]
+        self._rel_iter = None  # type: Optional[Iterator[Any]]
 
     def create_next_node(self):
         # type: () -> Union[Dict[str, Any], None]
 
+        if self._node_iterator is None:
+            self._node_iterator = self._create_node_iterator()
         try:
             return next(self._node_iterator)
         except StopIteration:
@@ -82,6 +89,8 @@ class TableColumnUsage(Neo4jCsvSerializable):
     def create_next_relation(self):
         # type: () -> Union[Dict[str, Any], None]
 
+        if self._rel_iter is None:
+            self._rel_iter = self._create_rel_iterator()
         try:
             return next(self._rel_iter)
         except StopIteration:
@@ -7,6 +7,9 @@ class TableESDocument(ElasticsearchDocument):
     """
     Schema for the Search index document
     """
+    __slots__ = ('database', 'cluster', 'schema_name', 'name', 'key', 'description', 'last_updated_epoch',
+                 'column_names', 'column_descriptions', 'total_usage', 'unique_usage', 'tags')
+
     def __init__(self,
                  database,  # type: str
                  cluster,  # type: str
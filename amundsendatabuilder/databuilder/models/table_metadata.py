@@ -1,8 +1,9 @@
 import copy
 from collections import namedtuple
 
-from typing import Iterable, Any, Union, Iterator, Dict, Set  # noqa: F401
+from typing import Iterable, Any, Union, Iterator, Dict, Optional, Set  # noqa: F401
 
+from databuilder.utils.dedup_cache import is_new_shared_row
 from databuilder.models.neo4j_csv_serde import (
     Neo4jCsvSerializable, NODE_LABEL, NODE_KEY, RELATION_START_KEY, RELATION_END_KEY, RELATION_START_LABEL,
     RELATION_END_LABEL, RELATION_TYPE, RELATION_REVERSE_TYPE)
@@ -11,11 +12,13 @@ from databuilder.publisher.neo4j_csv_publisher import UNQUOTED_SUFFIX
 DESCRIPTION_NODE_LABEL = 'Description'
 
 
-class TagMetadata:
+class TagMetadata(object):
     TAG_NODE_LABEL = 'Tag'
     TAG_KEY_FORMAT = '{tag}'
     TAG_TYPE = 'tag_type'
 
+    __slots__ = ('_name', '_tag_type')
+
     def __init__(self,
                  name,  # type: str,
                  tag_type='default',  # type: str
@@ -31,7 +34,7 @@ class TagMetadata:
         return TagMetadata.TAG_KEY_FORMAT.format(tag=name)
 
 
-class ColumnMetadata:
+class ColumnMetadata(object):
     COLUMN_NODE_LABEL = 'Column'
     COLUMN_KEY_FORMAT = '{db}://{cluster}.{schema}/{tbl}/{col}'
     COLUMN_NAME = 'name'
@@ -48,6 +51,8 @@ class ColumnMetadata:
     COL_TAG_RELATION_TYPE = 'TAGGED_BY'
     TAG_COL_RELATION_TYPE = 'TAG'
 
+    __slots__ = ('name', 'description', 'type', 'sort_order', 'tags')
+
     def __init__(self,
                  name,  # type: str
                  description,  # type: Union[str, None]
@@ -124,9 +129,8 @@ class TableMetadata(Neo4jCsvSerializable):
     TABLE_TAG_RELATION_TYPE = 'TAGGED_BY'
     TAG_TABLE_RELATION_TYPE = 'TAG'
 
-    # Only for deduping database, cluster, and schema (table and column will be always processed)
-    serialized_nodes = set()  # type: Set[Any]
-    serialized_rels = set()  # type: Set[Any]
+    __slots__ = ('database', 'cluster', 'schema_name', 'name', 'description', 'columns', 'is_view', 'attrs', 'tags',
+                 '_node_iterator', '_relation_iterator')
 
     def __init__(self,
                  database,  # type: str
@@ -168,8 +172,9 @@ class TableMetadata(Neo4jCsvSerializable):
         if kwargs:
             self.attrs = copy.deepcopy(kwargs)
 
-        self._node_iterator = self._create_next_node()
-        self._relation_iterator = self._create_next_relation()
+        # Created on first use, as a generator holds a frame for each record
+        self._node_iterator = None  # type: Optional[Iterator[Any]]
+        self._relation_iterator = None  # type: Optional[Iterator[Any]]
 
     def __repr__(self):
         # type: () -> str
@@ -230,6 +235,8 @@ class TableMetadata(Neo4jCsvSerializable):
 
     def create_next_node(self):
         # type: () -> Union[Dict[str, Any], None]
+        if self._node_iterator is None:
+            self._node_iterator = self._create_next_node()
         try:
             return next(self._node_iterator)
         except StopIteration:
@@ -296,9 +303,9 @@ class TableMetadata(Neo4jCsvSerializable):
                             label=TableMetadata.SCHEMA_NODE_LABEL)
                   ]
 
+        # Deduped across the records by the job's dedup cache, or by the process outside of a job
         for node_tuple in others:
-            if node_tuple not in TableMetadata.serialized_nodes:
-                TableMetadata.serialized_nodes.add(node_tuple)
+            if is_new_shared_row(node_tuple):
                 yield {
                     NODE_LABEL: node_tuple.label,
                     NODE_KEY: node_tuple.key,
@@ -307,6 +314,8 @@ class TableMetadata(Neo4jCsvSerializable):
 
     def create_next_relation(self):
         # type: () -> Union[Dict[str, Any], None]
+        if self._relation_iterator is None:
+            self._relation_iterator = self._create_next_relation()
         try:
             return next(self._relation_iterator)
         except StopIteration:
@@ -395,9 +404,9 @@ class TableMetadata(Neo4jCsvSerializable):
                      reverse_type=TableMetadata.SCHEMA_CLUSTER_RELATION_TYPE)
         ]
 
+        # Deduped across the records by the job's dedup cache, or by the process outside of a job
         for rel_tuple in others:
-            if rel_tuple not in TableMetadata.serialized_rels:
-                TableMetadata.serialized_rels.add(rel_tuple)
+            if is_new_shared_row(rel_tuple):
                 yield {
                     RELATION_START_LABEL: rel_tuple.start_label,
                     RELATION_END_LABEL: rel_tuple.end_label,
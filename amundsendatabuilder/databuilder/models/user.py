@@ -1,5 +1,5 @@
 import copy
-from typing import Union, Dict, Any  # noqa: F401
+from typing import Union, Dict, Any, Iterator, Optional  # noqa: F401
 
 from databuilder.models.neo4j_csv_serde import Neo4jCsvSerializable, NODE_KEY, \
     NODE_LABEL, RELATION_START_KEY, RELATION_START_LABEL, RELATION_END_KEY, \
@@ -29,6 +29,9 @@ class User(Neo4jCsvSerializable):
     USER_MANAGER_RELATION_TYPE = 'MANAGE_BY'
     MANAGER_USER_RELATION_TYPE = 'MANAGE'
 
+    __slots__ = ('first_name', 'last_name', 'name', 'email', 'github_username', 'team_name', 'manager_email',
+                 'employee_type', 'slack_id', 'is_active', 'updated_at', 'attrs', '_node_iter', '_rel_iter')
+
     def __init__(self,
                  email,  # type: str
                  first_name='',  # type: str
@@ -79,12 +82,15 @@ class User(Neo4jCsvSerializable):
         if kwargs:
             self.attrs = copy.deepcopy(kwargs)
 
-        self._node_iter = iter(self.create_nodes())
-        self._rel_iter = iter(self.create_relation())
+        # Created on first use
+        self._node_iter = None  # type: Optional[Iterator[Dict[str, Any]]]
+        self._rel_iter = None  # type: Optional[Iterator[Dict[str, Any]]]
 
     def create_next_node(self):
         # type: (...) -> Union[Dict[str, Any], None]
         # return the string representation of the data
+        if self._node_iter is None:
+            self._node_iter = iter(self.create_nodes())
         try:
             return next(self._node_iter)
         except StopIteration:
@@ -95,6 +101,8 @@ class User(Neo4jCsvSerializable):
         """
         :return:
         """
+        if self._rel_iter is None:
+            self._rel_iter = iter(self.create_relation())
         try:
             return next(self._rel_iter)
         except StopIteration:
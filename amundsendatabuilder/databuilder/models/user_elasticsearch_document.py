@@ -5,6 +5,9 @@ class UserESDocument(ElasticsearchDocument):
     """
     Schema for the Search index document for user
     """
+    __slots__ = ('email', 'first_name', 'last_name', 'name', 'github_username', 'team_name', 'employee_type',
+                 'manager_email', 'slack_id', 'is_active', 'total_read', 'total_own', 'total_follow')
+
     def __init__(self,
                  email,  # type: str
                  first_name,  # type: str
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Union  # noqa: F401
+from typing import Any, Dict, Iterator, List, Optional, Union  # noqa: F401
 
 from databuilder.models.neo4j_csv_serde import Neo4jCsvSerializable, NODE_KEY, \
     NODE_LABEL, RELATION_START_KEY, RELATION_START_LABEL, RELATION_END_KEY, \
@@ -17,6 +17,9 @@ class Watermark(Neo4jCsvSerializable):
     WATERMARK_TABLE_RELATION_TYPE = 'BELONG_TO_TABLE'
     TABLE_WATERMARK_RELATION_TYPE = 'WATERMARK'
 
+    __slots__ = ('create_time', 'database', 'schema', 'table', 'parts', 'part_type', 'cluster', '_node_iter',
+                 '_relation_iter')
+
     def __init__(self,
                  create_time,  # type: str
                  database,  # type: str
@@ -42,12 +45,15 @@ class Watermark(Neo4jCsvSerializable):
         self.parts = [(name, value)]
         self.part_type = part_type.lower()
         self.cluster = cluster.lower()
-        self._node_iter = iter(self.create_nodes())
-        self._relation_iter = iter(self.create_relation())
+        # Created on first use
+        self._node_iter = None  # type: Optional[Iterator[Dict[str, Any]]]
+        self._relation_iter = None  # type: Optional[Iterator[Dict[str, Any]]]
 
     def create_next_node(self):
         # type: (...) -> Union[Dict[str, Any], None]
         # return the string representation of the data
+        if self._node_iter is None:
+            self._node_iter = iter(self.create_nodes())
         try:
             return next(self._node_iter)
         except StopIteration:
@@ -55,6 +61,8 @@ class Watermark(Neo4jCsvSerializable):
 
     def create_next_relation(self):
         # type: (...) -> Union[Dict[str, Any], None]
+        if self._relation_iter is None:
+            self._relation_iter = iter(self.create_relation())
         try:
             return next(self._relation_iter)
         except StopIteration:
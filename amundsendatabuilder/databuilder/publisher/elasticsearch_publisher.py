@@ -1,10 +1,18 @@
+import hashlib
+import itertools
 import json
 import logging
 import textwrap
-from typing import List  # noqa: F401
+import time
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import six
+from typing import Any, Dict, Iterable, Iterator, List, Tuple  # noqa: F401
 
 from pyhocon import ConfigTree  # noqa: F401
-from elasticsearch.exceptions import NotFoundError
+from elasticsearch.exceptions import NotFoundError, TransportError
+from elasticsearch.helpers import scan
 
 from databuilder.publisher.base_publisher import Publisher
 
@@ -19,6 +27,21 @@ class ElasticsearchPublisher(Publisher):
     and traffic is routed to new index.
 
     Old index is deleted after the alias swap is complete
+
+    If bulk_chunk_size is configured, documents are streamed from the JSON file and uploaded with multiple
+    bulk requests that are bounded by the number of documents and the byte size, where bulk_thread_count
+    requests are in flight at once. Documents rejected by Elasticsearch due to back pressure (429) are
+    retried with exponential backoff and any other failure fails the publish before the alias swap.
+
+    If index_build_profile is enabled, the new index is created without replica and refresh so that documents are
+    neither replicated nor refreshed during the upload. After the upload, the index is refreshed and force-merged,
+    and replicas and refresh interval are restored. The alias is swapped once the index is green.
+
+    If incremental is enabled, the documents are compared with the index behind the alias by the key field and the
+    content hash stored in each document, and only changed documents are indexed and only missing documents are
+    deleted through the alias. If there's no index behind the alias, it falls back to building new index.
+    Content hash is stored when building new index only if content_hash_field is set explicitly, so that the
+    incremental publish after a full rebuild only indexes the changes.
     """
     FILE_PATH_CONFIG_KEY = 'file_path'
     FILE_MODE_CONFIG_KEY = 'mode'
@@ -29,6 +52,34 @@ class ElasticsearchPublisher(Publisher):
     ELASTICSEARCH_ALIAS_CONFIG_KEY = 'alias'
     ELASTICSEARCH_MAPPING_CONFIG_KEY = 'mapping'
 
+    # Max number of documents per bulk request. 0 (default) uploads all documents with single bulk request.
+    ELASTICSEARCH_BULK_CHUNK_SIZE_CONFIG_KEY = 'bulk_chunk_size'
+    # Max size of bulk request in bytes
+    ELASTICSEARCH_BULK_MAX_CHUNK_BYTES_CONFIG_KEY = 'bulk_max_chunk_bytes'
+    # Number of bulk requests in flight
+    ELASTICSEARCH_BULK_THREAD_COUNT_CONFIG_KEY = 'bulk_thread_count'
+    # Number of retries for the documents rejected with 429 (Too Many Requests)
+    ELASTICSEARCH_BULK_MAX_RETRIES_CONFIG_KEY = 'bulk_max_retries'
+    # Backoff before first retry, doubled for each retry
+    ELASTICSEARCH_BULK_INITIAL_BACKOFF_SECONDS_CONFIG_KEY = 'bulk_initial_backoff_seconds'
+
+    # Build new index with number_of_replicas 0 and refresh_interval -1 and restore them after upload
+    ELASTICSEARCH_INDEX_BUILD_PROFILE_CONFIG_KEY = 'index_build_profile'
+    # Number of segments the new index is force-merged into
+    ELASTICSEARCH_INDEX_BUILD_MAX_NUM_SEGMENTS_CONFIG_KEY = 'index_build_max_num_segments'
+    # Timeout for force-merge and waiting for green health
+    ELASTICSEARCH_INDEX_BUILD_TIMEOUT_SECONDS_CONFIG_KEY = 'index_build_timeout_seconds'
+
+    # Publish only the changes against the index behind the alias instead of building new index
+    ELASTICSEARCH_INCREMENTAL_CONFIG_KEY = 'incremental'
+    # Field that identifies a document
+    ELASTICSEARCH_DOC_KEY_FIELD_CONFIG_KEY = 'doc_key_field'
+    # Field where content hash of a document is stored. 'content_hash' by default for incremental publish. Empty by
+    # default for building new index, where setting it stores the hash for incremental publish to follow.
+    ELASTICSEARCH_CONTENT_HASH_FIELD_CONFIG_KEY = 'content_hash_field'
+
+    DEFAULT_INCREMENTAL_BULK_CHUNK_SIZE = 1000
+
     # Specifying default mapping for elasticsearch index
     # Documentation: https://www.elastic.co/guide/en/elasticsearch/reference/current/mapping.html
     # Setting type to "text" for all fields that would be used in search
@@ -131,6 +182,31 @@ class ElasticsearchPublisher(Publisher):
         self.elasticsearch_mapping = self.conf.get(ElasticsearchPublisher.ELASTICSEARCH_MAPPING_CONFIG_KEY,
                                                    ElasticsearchPublisher.DEFAULT_ELASTICSEARCH_INDEX_MAPPING)
 
+        self.bulk_chunk_size = self.conf.get_int(ElasticsearchPublisher.ELASTICSEARCH_BULK_CHUNK_SIZE_CONFIG_KEY, 0)
+        self.bulk_max_chunk_bytes = \
+            self.conf.get_int(ElasticsearchPublisher.ELASTICSEARCH_BULK_MAX_CHUNK_BYTES_CONFIG_KEY, 100 * 1024 * 1024)
+        self.bulk_thread_count = self.conf.get_int(ElasticsearchPublisher.ELASTICSEARCH_BULK_THREAD_COUNT_CONFIG_KEY, 1)
+        self.bulk_max_retries = self.conf.get_int(ElasticsearchPublisher.ELASTICSEARCH_BULK_MAX_RETRIES_CONFIG_KEY, 5)
+        self.bulk_initial_backoff_seconds = \
+            self.conf.get_float(ElasticsearchPublisher.ELASTICSEARCH_BULK_INITIAL_BACKOFF_SECONDS_CONFIG_KEY, 2.0)
+
+        self.index_build_profile = \
+            self.conf.get_bool(ElasticsearchPublisher.ELASTICSEARCH_INDEX_BUILD_PROFILE_CONFIG_KEY, False)
+        self.index_build_max_num_segments = \
+            self.conf.get_int(ElasticsearchPublisher.ELASTICSEARCH_INDEX_BUILD_MAX_NUM_SEGMENTS_CONFIG_KEY, 1)
+        self.index_build_timeout_seconds = \
+            self.conf.get_int(ElasticsearchPublisher.ELASTICSEARCH_INDEX_BUILD_TIMEOUT_SECONDS_CONFIG_KEY, 3600)
+        self._restore_settings = {}  # type: Dict[str, Any]
+
+        self.incremental = self.conf.get_bool(ElasticsearchPublisher.ELASTICSEARCH_INCREMENTAL_CONFIG_KEY, False)
+        self.doc_key_field = self.conf.get_string(ElasticsearchPublisher.ELASTICSEARCH_DOC_KEY_FIELD_CONFIG_KEY, 'key')
+        self.content_hash_field = \
+            self.conf.get_string(ElasticsearchPublisher.ELASTICSEARCH_CONTENT_HASH_FIELD_CONFIG_KEY,
+                                 'content_hash' if self.incremental else '')
+        if self.incremental and not self.content_hash_field:
+            raise Exception('{} is required for incremental publish'
+                            .format(ElasticsearchPublisher.ELASTICSEARCH_CONTENT_HASH_FIELD_CONFIG_KEY))
+
         self.file_handler = open(self.file_path, self.file_mode)
 
     def _fetch_old_index(self):
@@ -155,6 +231,34 @@ class ElasticsearchPublisher(Publisher):
         After upload, swap alias from {old_index} to {new_index} in a atomic operation
         to route traffic to {new_index}
         """
+        if self.incremental:
+            live_indices = list(self._fetch_old_index())
+            if len(live_indices) > 1:
+                raise Exception('Alias {} has more than one index: {}'.format(self.elasticsearch_alias, live_indices))
+            if live_indices:
+                self._publish_incremental()
+                return
+            LOGGER.info('No index behind alias {}. Building new index'.format(self.elasticsearch_alias))
+
+        if self.bulk_chunk_size > 0:
+            docs = self._read_docs()
+            first_doc = next(docs, None)
+            # ensure new data exists
+            if first_doc is None:
+                LOGGER.warning("received no data to upload to Elasticsearch!")
+                return
+
+            self._create_index()
+            action_line = self._bulk_action_line()
+            docs = itertools.chain([first_doc], docs)
+            if self.content_hash_field:
+                docs = (json.dumps(self._add_content_hash(json.loads(doc))) for doc in docs)
+            self._bulk_upload_in_chunks(entries=('{}\n{}\n'.format(action_line, doc) for doc in docs),
+                                        chunk_size=self.bulk_chunk_size)
+            self._finish_index_build()
+            self._swap_alias()
+            return
+
         actions = [json.loads(l) for l in self.file_handler.readlines()]
         # ensure new data exists
         if not actions:
@@ -169,14 +273,73 @@ class ElasticsearchPublisher(Publisher):
             index_row = dict(index=dict(_index=self.elasticsearch_new_index,
                                         _type=self.elasticsearch_type))
             bulk_actions.append(index_row)
-            bulk_actions.append(action)
+            bulk_actions.append(self._add_content_hash(action) if self.content_hash_field else action)
 
-        # create new index with mapping
-        self.elasticsearch_client.indices.create(index=self.elasticsearch_new_index, body=self.elasticsearch_mapping)
+        self._create_index()
 
         # bulk upload data
         self.elasticsearch_client.bulk(bulk_actions)
 
+        self._finish_index_build()
+        self._swap_alias()
+
+    def _create_index(self):
+        # type: () -> None
+        """
+        Creates new index with mapping. With index build profile, replica and refresh are disabled on the new
+        index, and the settings given by the mapping are kept to be restored after the upload.
+        """
+        if not self.index_build_profile:
+            # create new index with mapping
+            self.elasticsearch_client.indices.create(index=self.elasticsearch_new_index,
+                                                     body=self.elasticsearch_mapping)
+            return
+
+        body = json.loads(self.elasticsearch_mapping) if isinstance(self.elasticsearch_mapping, six.string_types) \
+            else dict(self.elasticsearch_mapping)
+        settings = dict(body.get('settings', {}))
+        # None resets the setting to Elasticsearch default when restored
+        self._restore_settings = {name: _pop_index_setting(settings, name)
+                                  for name in ('number_of_replicas', 'refresh_interval')}
+        settings['number_of_replicas'] = 0
+        settings['refresh_interval'] = '-1'
+        body['settings'] = settings
+
+        LOGGER.info('Creating index {} with build profile. Settings to restore: {}'
+                    .format(self.elasticsearch_new_index, self._restore_settings))
+        self.elasticsearch_client.indices.create(index=self.elasticsearch_new_index, body=body)
+
+    def _finish_index_build(self):
+        # type: () -> None
+        """
+        Refreshes and force-merges new index, restores replicas and refresh interval, and waits for green health.
+        Force-merge is done before replicas are restored so that replicas copy merged segments instead of each
+        merging on its own.
+        """
+        if not self.index_build_profile:
+            return
+
+        index = self.elasticsearch_new_index
+        timeout = self.index_build_timeout_seconds
+        self.elasticsearch_client.indices.refresh(index=index)
+
+        LOGGER.info('Force-merging index {} into {} segments'.format(index, self.index_build_max_num_segments))
+        self.elasticsearch_client.indices.forcemerge(index=index,
+                                                     max_num_segments=self.index_build_max_num_segments,
+                                                     request_timeout=timeout)
+
+        self.elasticsearch_client.indices.put_settings(index=index, body={'index': self._restore_settings})
+
+        LOGGER.info('Waiting for index {} to be green'.format(index))
+        health = self.elasticsearch_client.cluster.health(index=index,
+                                                          wait_for_status='green',
+                                                          timeout='{}s'.format(timeout),
+                                                          request_timeout=timeout)
+        if health.get('timed_out') or health.get('status') != 'green':
+            raise Exception('Index {} is not green after {} seconds. Health: {}'.format(index, timeout, health))
+
+    def _swap_alias(self):
+        # type: () -> None
         # fetch indices that have {elasticsearch_alias} as alias
         elasticsearch_old_indices = self._fetch_old_index()
 
@@ -192,6 +355,235 @@ class ElasticsearchPublisher(Publisher):
         # perform alias update and index delete in single atomic operation
         self.elasticsearch_client.indices.update_aliases(update_action)
 
+    def _read_docs(self):
+        # type: () -> Iterator[str]
+        """
+        Lazily reads JSON documents from the file, one per line. Documents are not deserialized as bulk request
+        body is built from JSON string as is.
+        :return:
+        """
+        for line in self.file_handler:
+            line = line.strip()
+            if line:
+                yield line
+
+    def _chunk_entries(self, entries, chunk_size):
+        # type: (Iterable[str], int) -> Iterator[List[str]]
+        """
+        Groups bulk entries into chunks that are bounded by chunk_size entries and bulk_max_chunk_bytes bytes.
+        An entry larger than bulk_max_chunk_bytes is sent alone.
+        :param entries: Bulk entries where each is an action line followed by optional document line
+        :param chunk_size:
+        :return:
+        """
+        chunk = []  # type: List[str]
+        chunk_bytes = 0
+        for entry in entries:
+            entry_bytes = len(entry.encode('utf-8') if isinstance(entry, six.text_type) else entry)
+            if chunk and (len(chunk) >= chunk_size or chunk_bytes + entry_bytes > self.bulk_max_chunk_bytes):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+
+            chunk.append(entry)
+            chunk_bytes += entry_bytes
+
+        if chunk:
+            yield chunk
+
+    def _bulk_action_line(self):
+        # type: () -> str
+        return json.dumps({'index': {'_index': self.elasticsearch_new_index, '_type': self.elasticsearch_type}})
+
+    def _bulk_upload_in_chunks(self, entries, chunk_size):
+        # type: (Iterable[str], int) -> None
+        """
+        Uploads bulk entries with multiple bulk requests. At most bulk_thread_count requests are in flight so that
+        only that many chunks are held in memory.
+        :param entries:
+        :param chunk_size:
+        :return:
+        """
+        pool = ThreadPool(processes=self.bulk_thread_count)
+        pending = deque()  # type: deque
+        total = 0
+        try:
+            for chunk in self._chunk_entries(entries, chunk_size):
+                if len(pending) >= self.bulk_thread_count:
+                    total += pending.popleft().get()
+                pending.append(pool.apply_async(self._send_bulk, (chunk,)))
+
+            while pending:
+                total += pending.popleft().get()
+        finally:
+            pool.close()
+            pool.join()
+
+        LOGGER.info('Sent {} bulk entries'.format(total))
+
+    def _send_bulk(self, docs):
+        # type: (List[str]) -> int
+        """
+        Sends a bulk request and checks the result of each entry. Entries rejected with 429 are retried with
+        exponential backoff, up to bulk_max_retries times.
+        :param docs: Bulk entries
+        :return: Number of entries sent
+        """
+        doc_count = len(docs)
+        retry_count = 0
+        while True:
+            body = ''.join(docs)
+            try:
+                response = self.elasticsearch_client.bulk(body)
+                rejected_docs = self._get_rejected_docs(docs, response)
+            except TransportError as e:
+                if e.status_code != 429:
+                    raise
+                rejected_docs = docs
+
+            if not rejected_docs:
+                return doc_count
+
+            if retry_count >= self.bulk_max_retries:
+                raise Exception('{} documents are rejected by Elasticsearch after {} retries'
+                                .format(len(rejected_docs), retry_count))
+
+            backoff = self.bulk_initial_backoff_seconds * (2 ** retry_count)
+            LOGGER.warning('{} documents are rejected by Elasticsearch. Retrying in {} seconds'
+                           .format(len(rejected_docs), backoff))
+            time.sleep(backoff)
+            retry_count += 1
+            docs = rejected_docs
+
+    def _get_rejected_docs(self, docs, response):
+        # type: (List[str], dict) -> List[str]
+        """
+        Returns the documents rejected with 429. Raises if any document failed with other error.
+        :param docs:
+        :param response: Bulk API response where items are in the order of the request
+        :return:
+        """
+        if not response.get('errors'):
+            return []
+
+        rejected_docs = []
+        for doc, item in zip(docs, response['items']):
+            op_type, result = next(six.iteritems(item))
+            status = result.get('status', 200)
+            if status == 429:
+                rejected_docs.append(doc)
+            elif status == 404 and op_type == 'delete':
+                # Already deleted
+                continue
+            elif status >= 300:
+                raise Exception('Failed to upload document into Elasticsearch. status: {}, error: {}'
+                                .format(status, result.get('error')))
+        return rejected_docs
+
+    def _publish_incremental(self):
+        # type: () -> None
+        """
+        Compares documents with the index behind the alias, and sends index action for new or changed documents and
+        delete action for the documents that no longer exist. Changed documents keep their document id.
+        """
+        live_docs, keyless_doc_ids = self._fetch_live_docs()
+        LOGGER.info('Fetched {} documents from alias {}'.format(len(live_docs), self.elasticsearch_alias))
+
+        stats = {'unchanged': 0, 'indexed': 0, 'deleted': 0}
+
+        def entries():
+            # type: () -> Iterator[str]
+            for line in self._read_docs():
+                doc = json.loads(line)
+                if self.doc_key_field not in doc:
+                    raise Exception('Document does not have {} field: {}'.format(self.doc_key_field, line))
+
+                self._add_content_hash(doc)
+                action = {'_index': self.elasticsearch_alias, '_type': self.elasticsearch_type}
+                live_doc = live_docs.pop(doc[self.doc_key_field], None)
+                if live_doc:
+                    doc_id, content_hash = live_doc
+                    if content_hash == doc[self.content_hash_field]:
+                        stats['unchanged'] += 1
+                        continue
+                    action['_id'] = doc_id
+
+                stats['indexed'] += 1
+                yield '{}\n{}\n'.format(json.dumps({'index': action}), json.dumps(doc))
+
+            deleted_doc_ids = itertools.chain((doc_id for doc_id, _ in six.itervalues(live_docs)), keyless_doc_ids)
+            for doc_id in deleted_doc_ids:
+                stats['deleted'] += 1
+                yield '{}\n'.format(json.dumps({'delete': {'_index': self.elasticsearch_alias,
+                                                           '_type': self.elasticsearch_type,
+                                                           '_id': doc_id}}))
+
+        self._bulk_upload_in_chunks(entries=entries(),
+                                    chunk_size=self.bulk_chunk_size or self.DEFAULT_INCREMENTAL_BULK_CHUNK_SIZE)
+        LOGGER.info('Published changes into alias {}: {}'.format(self.elasticsearch_alias, stats))
+
+    def _add_content_hash(self, doc):
+        # type: (Dict[str, Any]) -> Dict[str, Any]
+        """
+        Stores content hash of the document in content_hash_field of the document
+        :param doc:
+        :return: The document
+        """
+        doc[self.content_hash_field] = _content_hash(doc, excludes=(self.content_hash_field,))
+        return doc
+
+    def _fetch_live_docs(self):
+        # type: () -> Tuple[Dict[str, Tuple[str, str]], List[str]]
+        """
+        Fetches key, document id and content hash of all documents behind the alias
+        :return: Dictionary of key to (document id, content hash), and ids of documents without key
+        """
+        live_docs = {}
+        keyless_doc_ids = []
+        for hit in scan(self.elasticsearch_client,
+                        index=self.elasticsearch_alias,
+                        query={'_source': [self.doc_key_field, self.content_hash_field]}):
+            source = hit.get('_source', {})
+            if self.doc_key_field in source:
+                live_docs[source[self.doc_key_field]] = (hit['_id'], source.get(self.content_hash_field))
+            else:
+                LOGGER.warning('Deleting document {} without {} field'.format(hit['_id'], self.doc_key_field))
+                keyless_doc_ids.append(hit['_id'])
+        return live_docs, keyless_doc_ids
+
     def get_scope(self):
         # type: () -> str
         return 'publisher.elasticsearch'
+
+
+def _pop_index_setting(settings, name):
+    # type: (dict, str) -> Any
+    """
+    Pops index setting from settings of index creation body, which can be given either as
+    {"number_of_replicas": 1}, {"index.number_of_replicas": 1} or {"index": {"number_of_replicas": 1}}
+    :param settings:
+    :param name:
+    :return: Value of the setting or None if not found
+    """
+    value = None
+    index_settings = settings.get('index')
+    if isinstance(index_settings, dict) and name in index_settings:
+        index_settings = dict(index_settings)
+        value = index_settings.pop(name)
+        settings['index'] = index_settings
+    for key in (name, 'index.{}'.format(name)):
+        if key in settings:
+            value = settings.pop(key)
+    return value
+
+
+def _content_hash(doc, excludes=()):
+    # type: (Dict[str, Any], Iterable[str]) -> str
+    """
+    Returns hash of the document that doesn't depend on the order of the fields
+    :param doc:
+    :param excludes: Fields excluded from hash
+    :return:
+    """
+    content = {k: v for k, v in six.iteritems(doc) if k not in excludes}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
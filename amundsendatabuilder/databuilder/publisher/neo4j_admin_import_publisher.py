@@ -0,0 +1,336 @@
+import csv
+import logging
+import os
+import shutil
+import subprocess
+import time
+from os.path import join
+
+import six
+from pyhocon import ConfigFactory  # noqa: F401
+from pyhocon import ConfigTree  # noqa: F401
+from typing import Any, Dict, List, Optional, Set, Tuple  # noqa: F401
+
+from databuilder.publisher.base_publisher import Publisher
+from databuilder.publisher.neo4j_csv_publisher import NODE_FILES_DIR, RELATION_FILES_DIR, JOB_PUBLISH_TAG, \
+    PUBLISHED_TAG_PROPERTY_NAME, LAST_UPDATED_EPOCH_MS, UNQUOTED_SUFFIX, NODE_LABEL_KEY, NODE_KEY_KEY, \
+    NODE_REQUIRED_KEYS, RELATION_START_LABEL, RELATION_START_KEY, RELATION_END_LABEL, RELATION_END_KEY, \
+    RELATION_TYPE, RELATION_REVERSE_TYPE, RELATION_REQUIRED_KEYS, list_files, parse_unquoted_value
+from databuilder.utils.closer import Closer
+from databuilder.utils.compression import open_file
+
+LOGGER = logging.getLogger(__name__)
+
+# neo4j-admin import property types that a value of UNQUOTED header is mapped into
+STRING_TYPE = 'string'
+LONG_TYPE = 'long'
+DOUBLE_TYPE = 'double'
+BOOLEAN_TYPE = 'boolean'
+
+
+class _ImportFileWriter(object):
+    """
+    Writes a data file for neo4j-admin import, and writes its header into separate file once all the rows are written.
+    Header is written at the end because type of a property from UNQUOTED header is inferred from all of its values.
+    """
+
+    def __init__(self,
+                 path_prefix,  # type: str
+                 id_headers,  # type: List[str]
+                 prop_headers,  # type: List[str]
+                 ):
+        # type: (...) -> None
+        self.header_path = '{}_header.csv'.format(path_prefix)
+        self.data_path = '{}.csv'.format(path_prefix)
+        self._id_headers = id_headers
+        self._prop_headers = prop_headers
+        # Inferred type per UNQUOTED header. None until it sees non-empty value.
+        self._types = {h: None for h in prop_headers if h.endswith(UNQUOTED_SUFFIX)}  # type: Dict[str, Optional[str]]
+        self._file = open(self.data_path, 'w')
+        self._writer = csv.writer(self._file)
+        self.count = 0
+
+    def write(self, id_values, record_dict, suffix_values):
+        # type: (List[str], Dict[str, str], List[Any]) -> None
+        row = list(id_values)
+        for header in self._prop_headers:
+            val = record_dict[header]
+            if header in self._types:
+                val = parse_unquoted_value(val)
+                self._types[header] = _merge_type(self._types[header], val)
+                val = _to_import_value(val)
+            row.append(val)
+        row.extend(suffix_values)
+        self._writer.writerow(row)
+        self.count += 1
+
+    def close(self):
+        # type: () -> None
+        self._file.close()
+
+        headers = list(self._id_headers)
+        for header in self._prop_headers:
+            if header not in self._types:
+                headers.append(header)
+                continue
+
+            prop_type = self._types[header]
+            name = header[:-len(UNQUOTED_SUFFIX)]
+            headers.append('{}:{}'.format(name, prop_type) if prop_type and prop_type != STRING_TYPE else name)
+
+        headers.extend([PUBLISHED_TAG_PROPERTY_NAME, '{}:{}'.format(LAST_UPDATED_EPOCH_MS, LONG_TYPE)])
+        with open(self.header_path, 'w') as header_file:
+            csv.writer(header_file).writerow(headers)
+
+
+class Neo4jAdminImportPublisher(Publisher):
+    """
+    A Publisher that bootstraps an empty Neo4j database with neo4j-admin import (offline bulk load) instead of
+    merging CSV rows one by one.
+    https://neo4j.com/docs/operations-manual/3.5/tools/import/
+
+    It takes the same node and relation CSV directories that FsNeo4jCSVLoader writes, and converts them into
+    header / data files that neo4j-admin import expects:
+     - Keys are de-duped across files. For the duplicated keys, first one wins.
+     - A relation becomes two relationships, TYPE and REVERSE_TYPE, same as Neo4jCsvPublisher.
+     - A relation whose start or end node is not in node files is skipped, same as MATCH in Neo4jCsvPublisher.
+     - published_tag and publisher_last_updated_epoch_ms are added into all nodes and relationships.
+
+    If neo4j_admin_command is configured, it runs neo4j-admin import. Otherwise, it only logs the command so that it
+    can be run where Neo4j is installed. Note that neo4j-admin import only works on empty database while Neo4j is
+    stopped, and it does not create unique constraints. Unique constraints will be created when Neo4jCsvPublisher
+    publishes on top of the database.
+    """
+    # A directory where files for neo4j-admin import will be written into. It should not exist.
+    IMPORT_DIR = 'import_directory'
+    # A path of neo4j-admin command. e.g: /var/lib/neo4j/bin/neo4j-admin
+    NEO4J_ADMIN_COMMAND = 'neo4j_admin_command'
+    # A name of the database to import into
+    DATABASE_NAME = 'database_name'
+
+    DEFAULT_CONFIG = ConfigFactory.from_dict({NEO4J_ADMIN_COMMAND: '',
+                                              DATABASE_NAME: 'graph.db'})
+
+    def __init__(self):
+        # type: () -> None
+        super(Neo4jAdminImportPublisher, self).__init__()
+
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        conf = conf.with_fallback(Neo4jAdminImportPublisher.DEFAULT_CONFIG)
+
+        self._node_files = self._list_files(conf, NODE_FILES_DIR)
+        self._relation_files = self._list_files(conf, RELATION_FILES_DIR)
+        self._import_dir = conf.get_string(Neo4jAdminImportPublisher.IMPORT_DIR)
+        self._neo4j_admin_command = conf.get_string(Neo4jAdminImportPublisher.NEO4J_ADMIN_COMMAND)
+        self._database_name = conf.get_string(Neo4jAdminImportPublisher.DATABASE_NAME)
+
+        self.publish_tag = conf.get_string(JOB_PUBLISH_TAG)  # type: str
+        if not self.publish_tag:
+            raise Exception('{} should not be empty'.format(JOB_PUBLISH_TAG))
+
+        # Keys of nodes that are already written per label
+        self._node_keys = {}  # type: Dict[str, Set[str]]
+        # Relations that are already written
+        self._relation_keys = set()  # type: Set[Tuple[str, str, str, str, str]]
+
+    def _list_files(self, conf, path_key):
+        # type: (ConfigTree, str) -> List[str]
+        if path_key not in conf:
+            return []
+
+        return list_files(conf.get_string(path_key))
+
+    def publish_impl(self):
+        # type: () -> None
+        """
+        Converts node files first, as relations are validated against the node keys, and then relation files.
+        :return:
+        """
+        start = time.time()
+
+        if os.path.exists(self._import_dir):
+            raise RuntimeError('Directory should not exist: {}'.format(self._import_dir))
+        os.makedirs(self._import_dir)
+
+        self._publish_epoch_ms = int(start * 1000)
+        try:
+            node_writers = []  # type: List[_ImportFileWriter]
+            for i, node_file in enumerate(self._node_files):
+                node_writers.extend(self._convert_node_file(node_file, i))
+
+            relation_writers = []  # type: List[_ImportFileWriter]
+            for i, relation_file in enumerate(self._relation_files):
+                relation_writers.extend(self._convert_relation_file(relation_file, i))
+        except Exception as e:
+            LOGGER.exception('Failed to convert CSV files. Deleting {}'.format(self._import_dir))
+            shutil.rmtree(self._import_dir)
+            raise e
+
+        LOGGER.info('Converted {} nodes and {} relationships'.format(sum(w.count for w in node_writers),
+                                                                     sum(w.count for w in relation_writers)))
+
+        command = self._create_command(node_writers, relation_writers)
+        if not self._neo4j_admin_command:
+            LOGGER.info('{} is not configured. Run following command where Neo4j is installed: {}'
+                        .format(Neo4jAdminImportPublisher.NEO4J_ADMIN_COMMAND, ' '.join(command)))
+            return
+
+        LOGGER.info('Running {}'.format(' '.join(command)))
+        subprocess.check_call(command)
+        LOGGER.info('Successfully imported. Elapsed: {} seconds'.format(time.time() - start))
+
+    def _convert_node_file(self, node_file, index):
+        # type: (str, int) -> List[_ImportFileWriter]
+        """
+        Converts a node file into import file(s), one per label as ID space is defined per label.
+        Header of node import file: key:ID(Label),:LABEL,prop1,prop2:long,...,published_tag,
+        publisher_last_updated_epoch_ms:long
+        :param node_file:
+        :param index: index of the file to make file name unique
+        :return:
+        """
+        writers = {}  # type: Dict[str, _ImportFileWriter]
+        duplicate_count = 0
+        # Writers are closed even if conversion fails, so that import directory can be deleted
+        closer = Closer()
+        try:
+            with open_file(node_file, 'r') as node_csv:
+                reader = csv.DictReader(node_csv)
+                prop_headers = [h for h in reader.fieldnames if h not in NODE_REQUIRED_KEYS]
+                for node_record in reader:
+                    label = node_record[NODE_LABEL_KEY]
+                    key = node_record[NODE_KEY_KEY]
+
+                    keys = self._node_keys.setdefault(label, set())
+                    if key in keys:
+                        duplicate_count += 1
+                        continue
+                    keys.add(key)
+
+                    writer = writers.get(label)
+                    if not writer:
+                        path_prefix = join(self._import_dir, 'nodes_{}_{}'.format(index, label))
+                        writer = _ImportFileWriter(path_prefix=path_prefix,
+                                                   id_headers=['key:ID({})'.format(label), ':LABEL'],
+                                                   prop_headers=prop_headers)
+                        closer.register(writer.close)
+                        writers[label] = writer
+
+                    writer.write([key, label], node_record, [self.publish_tag, self._publish_epoch_ms])
+        finally:
+            closer.close()
+
+        LOGGER.info('Converted {}. Skipped {} duplicated nodes'.format(node_file, duplicate_count))
+        return list(writers.values())
+
+    def _convert_relation_file(self, relation_file, index):
+        # type: (str, int) -> List[_ImportFileWriter]
+        """
+        Converts a relation file into import files, one per (START_LABEL, END_LABEL, TYPE) and one more for reverse
+        relationship as ID spaces are defined per label.
+        Header of relationship import file: :START_ID(StartLabel),:END_ID(EndLabel),:TYPE,prop1,...,published_tag,
+        publisher_last_updated_epoch_ms:long
+        :param relation_file:
+        :param index: index of the file to make file name unique
+        :return:
+        """
+        writers = {}  # type: Dict[Tuple[str, str, str], _ImportFileWriter]
+        duplicate_count = 0
+        missing_node_count = 0
+        # Writers are closed even if conversion fails, so that import directory can be deleted
+        closer = Closer()
+        try:
+            with open_file(relation_file, 'r') as relation_csv:
+                reader = csv.DictReader(relation_csv)
+                prop_headers = [h for h in reader.fieldnames if h not in RELATION_REQUIRED_KEYS]
+                for rel_record in reader:
+                    start_label, start_key = rel_record[RELATION_START_LABEL], rel_record[RELATION_START_KEY]
+                    end_label, end_key = rel_record[RELATION_END_LABEL], rel_record[RELATION_END_KEY]
+
+                    if start_key not in self._node_keys.get(start_label, ()) \
+                            or end_key not in self._node_keys.get(end_label, ()):
+                        missing_node_count += 1
+                        continue
+
+                    relation_key = (start_label, start_key, end_label, end_key, rel_record[RELATION_TYPE])
+                    if relation_key in self._relation_keys:
+                        duplicate_count += 1
+                        continue
+                    self._relation_keys.add(relation_key)
+
+                    suffix_values = [self.publish_tag, self._publish_epoch_ms]
+                    for (from_label, from_key, to_label, to_key, rel_type) in \
+                            ((start_label, start_key, end_label, end_key, rel_record[RELATION_TYPE]),
+                             (end_label, end_key, start_label, start_key, rel_record[RELATION_REVERSE_TYPE])):
+                        writer_key = (from_label, to_label, rel_type)
+                        writer = writers.get(writer_key)
+                        if not writer:
+                            path_prefix = join(self._import_dir,
+                                               'relationships_{}_{}_{}_{}'.format(index, *writer_key))
+                            writer = _ImportFileWriter(path_prefix=path_prefix,
+                                                       id_headers=[':START_ID({})'.format(from_label),
+                                                                   ':END_ID({})'.format(to_label),
+                                                                   ':TYPE'],
+                                                       prop_headers=prop_headers)
+                            closer.register(writer.close)
+                            writers[writer_key] = writer
+
+                        writer.write([from_key, to_key, rel_type], rel_record, suffix_values)
+        finally:
+            closer.close()
+
+        LOGGER.info('Converted {}. Skipped {} duplicated relations and {} relations without node'
+                    .format(relation_file, duplicate_count, missing_node_count))
+        return list(writers.values())
+
+    def _create_command(self, node_writers, relation_writers):
+        # type: (List[_ImportFileWriter], List[_ImportFileWriter]) -> List[str]
+        command = [self._neo4j_admin_command or 'neo4j-admin',
+                   'import',
+                   '--database={}'.format(self._database_name),
+                   '--id-type=STRING',
+                   '--multiline-fields=true']
+        command.extend(['--nodes={},{}'.format(w.header_path, w.data_path) for w in node_writers])
+        command.extend(['--relationships={},{}'.format(w.header_path, w.data_path) for w in relation_writers])
+        return command
+
+    def get_scope(self):
+        # type: () -> str
+        return 'publisher.neo4j_admin_import'
+
+
+def _merge_type(current_type, val):
+    # type: (Optional[str], Any) -> Optional[str]
+    """
+    Infers neo4j-admin import property type from the current inferred type and a new value.
+    :param current_type:
+    :param val:
+    :return:
+    """
+    if val is None:
+        return current_type
+
+    if isinstance(val, bool):
+        val_type = BOOLEAN_TYPE
+    elif isinstance(val, six.integer_types):
+        val_type = LONG_TYPE
+    elif isinstance(val, float):
+        val_type = DOUBLE_TYPE
+    else:
+        val_type = STRING_TYPE
+
+    if current_type is None or current_type == val_type:
+        return val_type
+    if {current_type, val_type} == {LONG_TYPE, DOUBLE_TYPE}:
+        return DOUBLE_TYPE
+    return STRING_TYPE
+
+
+def _to_import_value(val):
+    # type: (Any) -> Any
+    if val is None:
+        return ''
+    if isinstance(val, bool):
+        return 'true' if val else 'false'
+    return val
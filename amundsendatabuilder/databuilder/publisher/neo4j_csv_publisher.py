@@ -1,20 +1,30 @@
-import copy
 import csv
 import ctypes
+import io
+import json
+import locale
 import logging
+import os
+import threading
 import time
+from functools import partial
+from multiprocessing.pool import ThreadPool
 from os import listdir
-from os.path import isfile, join
+from os.path import basename, dirname, isdir, isfile, join
 from string import Template
 
 import six
-from neo4j.v1 import GraphDatabase, Transaction  # noqa: F401
+from neo4j.exceptions import TransientError
+from neo4j.v1 import GraphDatabase, Session, Transaction  # noqa: F401
 from pyhocon import ConfigFactory  # noqa: F401
 from pyhocon import ConfigTree  # noqa: F401
-from typing import Set, List  # noqa: F401
+from retrying import Retrying
+from six.moves.queue import Queue
+from typing import Set, List, Dict, Any, Tuple, FrozenSet, Callable, Iterator, Optional  # noqa: F401
 
 from databuilder.publisher.base_publisher import Publisher
 from databuilder.publisher.neo4j_preprocessor import NoopRelationPreprocessor
+from databuilder.utils.compression import open_file
 
 
 # Setting field_size_limit to solve the error below
@@ -41,6 +51,25 @@ NEO4J_MAX_CONN_LIFE_TIME_SEC = 'neo4j_max_conn_life_time_sec'
 # list of nodes that are create only, and not updated if match exists
 NEO4J_CREATE_ONLY_NODES = 'neo4j_create_only_nodes'
 
+# A number of CSV rows sent in one parameterized UNWIND statement. When set to positive number, publisher groups
+# nodes by (LABEL, header set) and relations by (START_LABEL, END_LABEL, TYPE) and merges each group in batch.
+# Note that transaction size counts statements, and each statement carries up to this number of rows.
+# 0 (default) publishes one MERGE statement per CSV row.
+NEO4J_UNWIND_BATCH_SIZE = 'neo4j_unwind_batch_size'
+
+# A number of worker threads, each with its own session, publishing CSV files concurrently. Node files are published
+# first, and relation files are published once all node files are published.
+# Each worker commits its own transaction per neo4j_transaction_size statements and at the end of each file.
+# 1 (default) publishes all files sequentially within a single session.
+NEO4J_PUBLISH_PARALLELISM = 'neo4j_publish_parallelism'
+# Max attempts to publish a file in parallel mode when Neo4j raises transient error (e.g: deadlock)
+NEO4J_TRANSIENT_ERROR_MAX_ATTEMPTS = 'neo4j_transient_error_max_attempts'
+
+# A local file path where publisher records, after each commit, how many CSV records of each file are committed and
+# the byte position in the file right after them. If publisher is restarted with the same job_publish_tag, it seeks to
+# the position and resumes from there. The file is deleted once publish succeeds. Empty (default) disables checkpoint.
+NEO4J_CHECKPOINT_FILE = 'neo4j_checkpoint_file'
+
 NEO4J_USER = 'neo4j_user'
 NEO4J_PASSWORD = 'neo4j_password'
 
@@ -55,6 +84,10 @@ LAST_UPDATED_EPOCH_MS = 'publisher_last_updated_epoch_ms'
 
 RELATION_PREPROCESSOR = 'relation_preprocessor'
 
+# A manifest file that FsNeo4jCSVLoader writes next to CSV files. It describes each CSV file with labels, headers,
+# row count and byte size so that publisher does not need to scan CSV files to find out labels.
+MANIFEST_FILE_NAME = '_manifest.json'
+
 # CSV HEADER
 # A header with this suffix will be pass to Neo4j statement without quote
 UNQUOTED_SUFFIX = ':UNQUOTED'
@@ -87,23 +120,182 @@ DEFAULT_CONFIG = ConfigFactory.from_dict({NEO4J_TRANSCATION_SIZE: 500,
                                           NEO4J_PROGRESS_REPORT_FREQUENCY: 500,
                                           NEO4J_RELATIONSHIP_CREATION_CONFIRM: False,
                                           NEO4J_MAX_CONN_LIFE_TIME_SEC: 50,
+                                          NEO4J_UNWIND_BATCH_SIZE: 0,
+                                          NEO4J_PUBLISH_PARALLELISM: 1,
+                                          NEO4J_TRANSIENT_ERROR_MAX_ATTEMPTS: 5,
+                                          NEO4J_CHECKPOINT_FILE: '',
                                           RELATION_PREPROCESSOR: NoopRelationPreprocessor()})
 
-NODE_MERGE_TEMPLATE = Template("""MERGE (node:$LABEL {key: '${KEY}'})
+# Statements are parameterized so that statement text is same for the same label(s) and Neo4j can reuse query plan
+NODE_MERGE_TEMPLATE = Template("""MERGE (node:$LABEL {key: $$key})
 ON CREATE SET ${create_prop_body}
 ${update_statement}""")
 
 NODE_UPDATE_TEMPLATE = Template("""ON MATCH SET ${update_prop_body}""")
 
-RELATION_MERGE_TEMPLATE = Template("""MATCH (n1:$START_LABEL {key: '${START_KEY}'}),
-(n2:$END_LABEL {key: '${END_KEY}'})
+RELATION_MERGE_TEMPLATE = Template("""MATCH (n1:$START_LABEL {key: $$start_key}),
+(n2:$END_LABEL {key: $$end_key})
+MERGE (n1)-[r1:$TYPE]->(n2)-[r2:$REVERSE_TYPE]->(n1)
+ON CREATE SET ${prop_body}
+ON MATCH SET ${prop_body}
+RETURN n1.key, n2.key""")
+
+NODE_UNWIND_MERGE_TEMPLATE = Template("""UNWIND $$batch AS row
+MERGE (node:$LABEL {key: row.KEY})
+ON CREATE SET ${create_prop_body}
+${update_statement}""")
+
+RELATION_UNWIND_MERGE_TEMPLATE = Template("""UNWIND $$batch AS row
+MATCH (n1:$START_LABEL {key: row.START_KEY}),
+(n2:$END_LABEL {key: row.END_KEY})
 MERGE (n1)-[r1:$TYPE]->(n2)-[r2:$REVERSE_TYPE]->(n1)
-$PROP_STMT RETURN n1.key, n2.key""")
+ON CREATE SET ${prop_body}
+ON MATCH SET ${prop_body}
+RETURN count(*) AS count""")
 
 CREATE_UNIQUE_INDEX_TEMPLATE = Template('CREATE CONSTRAINT ON (node:${LABEL}) ASSERT node.key IS UNIQUE')
 
 LOGGER = logging.getLogger(__name__)
 
+# Encoding of CSV file, which is the same as the one used by open_file in text mode
+_ENCODING = locale.getpreferredencoding(False)
+
+
+class _SessionContext(object):
+    """
+    A session with its statement and commit counters. Each publishing thread uses its own context.
+    """
+
+    def __init__(self, session):
+        # type: (Session) -> None
+        self.session = session
+        self.count = 0  # type: int
+        self.commit_count = 0  # type: int
+        # Checkpoint entry per file processed in current transaction
+        self.offsets = {}  # type: Dict[str, Dict[str, int]]
+
+
+class _Checkpoint(object):
+    """
+    Durably records the CSV records committed per file for the publish tag.
+    A file is processed as a sequence of its CSV records. If relation pre-processor is enabled, relation file is
+    processed twice, pre-processing and merging, and the sequence is twice as long. Entry of a file has:
+     - offset: Number of records in the sequence committed
+     - base: Offset where the pass of the committed record starts. 0 for the first pass.
+     - position: Byte position in the file right after the committed record, where the pass resumes from.
+    """
+
+    def __init__(self, path, publish_tag):
+        # type: (str, str) -> None
+        self._path = path
+        self._publish_tag = publish_tag
+        self._lock = threading.Lock()
+        self._offsets = {}  # type: Dict[str, Dict[str, int]]
+
+        if not path or not isfile(path):
+            return
+
+        with open(path, 'r') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+
+        if checkpoint['publish_tag'] != publish_tag:
+            LOGGER.info('Ignoring checkpoint {} as its publish tag {} is different'
+                        .format(path, checkpoint['publish_tag']))
+            return
+
+        self._offsets = checkpoint['files']
+        LOGGER.info('Resuming from checkpoint {}: {}'.format(path, self._offsets))
+
+    def resume_point(self, file_path, base):
+        # type: (str, int) -> Tuple[int, Optional[int]]
+        """
+        Provides where a pass over the file resumes from.
+        :param file_path:
+        :param base: Offset where the pass starts
+        :return: A tuple of offset and byte position to resume from. Position is None if a later pass is already
+        committed, so that this pass is skipped, and offset is where the later pass starts.
+        """
+        entry = self._offsets.get(file_path)
+        if not entry or entry['base'] < base:
+            return base, 0
+        if entry['base'] > base:
+            return entry['base'], None
+        return entry['offset'], entry['position']
+
+    def commit(self, offsets):
+        # type: (Dict[str, Dict[str, int]]) -> None
+        """
+        Updates and writes checkpoint. It writes into temporary file first, and renames it so that checkpoint file is
+        always complete.
+        :param offsets: Checkpoint entry per file that are just committed
+        :return:
+        """
+        if not self._path or not offsets:
+            return
+
+        with self._lock:
+            self._offsets.update(offsets)
+            temp_path = '{}.tmp'.format(self._path)
+            with open(temp_path, 'w') as checkpoint_file:
+                json.dump({'publish_tag': self._publish_tag, 'files': self._offsets}, checkpoint_file)
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+            os.rename(temp_path, self._path)
+
+    def clear(self):
+        # type: () -> None
+        if self._path and isfile(self._path):
+            LOGGER.info('Deleting checkpoint {}'.format(self._path))
+            os.remove(self._path)
+
+
+class _CsvFileReader(object):
+    """
+    Iterates CSV records of a file and tracks the byte position right after the last record read, so that reading
+    can be resumed later by seeking to the position instead of reading and parsing the records before it.
+    Compressed file is decompressed up to the position as it cannot be seeked directly.
+    """
+
+    def __init__(self, file_path, position=0):
+        # type: (str, int) -> None
+        self._file_path = file_path
+        self._start_position = position
+        self.position = 0
+
+    def _lines(self, csv_file):
+        # type: (Any) -> Iterator[str]
+        for line in iter(csv_file.readline, b''):
+            self.position += len(line)
+            yield line if six.PY2 else line.decode(_ENCODING)
+
+    def _skip_to(self, csv_file, position):
+        # type: (Any, int) -> None
+        if not hasattr(csv_file, 'seekable') or csv_file.seekable():
+            csv_file.seek(position)
+            self.position = position
+            return
+
+        while self.position < position:
+            chunk = csv_file.read(min(position - self.position, io.DEFAULT_BUFFER_SIZE))
+            if not chunk:
+                break
+            self.position += len(chunk)
+
+    def __iter__(self):
+        # type: () -> Iterator[Dict[str, str]]
+        with open_file(self._file_path, 'rb') as csv_file:
+            lines = self._lines(csv_file)
+            # Header is always read as records after the position do not have it
+            fieldnames = next(csv.reader(lines), None)
+            if fieldnames is None:
+                return
+
+            if self._start_position > self.position:
+                self._skip_to(csv_file, self._start_position)
+
+            for record in csv.DictReader(lines, fieldnames=fieldnames):
+                yield record
+
 
 class Neo4jCsvPublisher(Publisher):
     """
@@ -113,18 +305,27 @@ class Neo4jCsvPublisher(Publisher):
     Neo4j follows Label Node properties Graph and more information about this is in:
     https://neo4j.com/docs/developer-manual/current/introduction/graphdb-concepts/
 
-    #TODO User UNWIND batch operation for better performance
+    If neo4j_unwind_batch_size is configured, CSV rows are merged in batch via parameterized UNWIND statement instead of
+    one statement per row.
+
+    If neo4j_checkpoint_file is configured, publisher records committed CSV records per file, and resumes from them when
+    it is restarted with the same job_publish_tag by seeking to the byte position right after them.
+
+    If neo4j_publish_parallelism is configured, CSV files are published concurrently by a pool of workers where each
+    worker has its own session. As there's no dependency between node files, node files are published concurrently
+    first. Once all nodes are published, relation files are published concurrently.
     """
 
     def __init__(self):
         # type: () -> None
         super(Neo4jCsvPublisher, self).__init__()
+        # Statement per template and label(s)
+        self._statements = {}  # type: Dict[Tuple, str]
 
     def init(self, conf):
         # type: (ConfigTree) -> None
         conf = conf.with_fallback(DEFAULT_CONFIG)
 
-        self._count = 0  # type: int
         self._progress_report_frequency = conf.get_int(NEO4J_PROGRESS_REPORT_FREQUENCY)
         self._node_files = self._list_files(conf, NODE_FILES_DIR)
         self._node_files_iter = iter(self._node_files)
@@ -137,7 +338,12 @@ class Neo4jCsvPublisher(Publisher):
                                  max_connection_life_time=conf.get_int(NEO4J_MAX_CONN_LIFE_TIME_SEC),
                                  auth=(conf.get_string(NEO4J_USER), conf.get_string(NEO4J_PASSWORD)))
         self._transaction_size = conf.get_int(NEO4J_TRANSCATION_SIZE)
+        self._unwind_batch_size = conf.get_int(NEO4J_UNWIND_BATCH_SIZE)
         self._session = self._driver.session()
+        self._session_context = _SessionContext(self._session)
+        self._thread_local = threading.local()
+        self._publish_parallelism = conf.get_int(NEO4J_PUBLISH_PARALLELISM)
+        self._transient_error_max_attempts = conf.get_int(NEO4J_TRANSIENT_ERROR_MAX_ATTEMPTS)
         self._confirm_rel_created = conf.get_bool(NEO4J_RELATIONSHIP_CREATION_CONFIRM)
 
         # config is list of node label.
@@ -149,6 +355,7 @@ class Neo4jCsvPublisher(Publisher):
             raise Exception('{} should not be empty'.format(JOB_PUBLISH_TAG))
 
         self._relation_preprocessor = conf.get(RELATION_PREPROCESSOR)
+        self._checkpoint = _Checkpoint(conf.get_string(NEO4J_CHECKPOINT_FILE), self.publish_tag)
 
         LOGGER.info('Publishing Node csv files {}, and Relation CSV files {}'
                     .format(self._node_files, self._relation_files))
@@ -156,7 +363,7 @@ class Neo4jCsvPublisher(Publisher):
     def _list_files(self, conf, path_key):
         # type: (ConfigTree, str) -> List[str]
         """
-        List files from directory
+        List files from directory and its sub-directories, except manifest file
         :param conf:
         :param path_key:
         :return: List of file paths
@@ -164,8 +371,7 @@ class Neo4jCsvPublisher(Publisher):
         if path_key not in conf:
             return []
 
-        path = conf.get_string(path_key)
-        return [join(path, f) for f in listdir(path) if isfile(join(path, f))]
+        return list_files(conf.get_string(path_key))
 
     def publish_impl(self):  # noqa: C901
         # type: () -> None
@@ -177,8 +383,13 @@ class Neo4jCsvPublisher(Publisher):
         start = time.time()
 
         LOGGER.info('Creating indices using Node files: {}'.format(self._node_files))
-        for node_file in self._node_files:
-            self._create_indices(node_file=node_file)
+        self._create_indices()
+
+        if self._publish_parallelism > 1:
+            self._publish_in_parallel()
+            self._checkpoint.clear()
+            LOGGER.info('Successfully published. Elapsed: {} seconds'.format(time.time() - start))
+            return
 
         LOGGER.info('Publishing Node files: {}'.format(self._node_files))
         try:
@@ -198,8 +409,9 @@ class Neo4jCsvPublisher(Publisher):
                 except StopIteration:
                     break
 
-            tx.commit()
-            LOGGER.info('Committed total {} statements'.format(self._count))
+            self._commit(tx, self._session_context)
+            self._checkpoint.clear()
+            LOGGER.info('Committed total {} statements'.format(self._session_context.count))
 
             # TODO: Add statsd support
             LOGGER.info('Successfully published. Elapsed: {} seconds'.format(time.time() - start))
@@ -209,28 +421,136 @@ class Neo4jCsvPublisher(Publisher):
                 tx.rollback()
             raise e
 
+    def _publish_in_parallel(self):
+        # type: () -> None
+        """
+        Publishes node files concurrently, waits for all of them, and then publishes relation files concurrently.
+        Each worker borrows a session from the session pool, and publishes a file within its own transaction(s).
+        :return:
+        """
+        contexts = [_SessionContext(self._driver.session()) for _ in range(self._publish_parallelism)]
+        self._session_pool = Queue()  # type: Queue
+        for context in contexts:
+            self._session_pool.put(context)
+
+        self._progress_lock = threading.Lock()
+        self._published_file_count = 0
+        self._total_file_count = len(self._node_files) + len(self._relation_files)
+
+        pool = ThreadPool(processes=self._publish_parallelism)
+        try:
+            LOGGER.info('Publishing Node files with {} workers: {}'.format(self._publish_parallelism,
+                                                                           self._node_files))
+            pool.map(partial(self._publish_file_in_worker, self._publish_node), self._node_files)
+
+            # Relations can be created only after all the nodes are created
+            LOGGER.info('Publishing Relationship files with {} workers: {}'.format(self._publish_parallelism,
+                                                                                   self._relation_files))
+            pool.map(partial(self._publish_file_in_worker, self._publish_relation), self._relation_files)
+
+            LOGGER.info('Committed total {} statements with {} commits'.format(
+                sum(context.count for context in contexts), sum(context.commit_count for context in contexts)))
+        finally:
+            pool.close()
+            pool.join()
+            for context in contexts:
+                context.session.close()
+
+    def _publish_file_in_worker(self, publish_func, file_path):
+        # type: (Callable[[str, Transaction], Transaction], str) -> None
+        """
+        Publishes a file with a session borrowed from the session pool. If Neo4j raises transient error such as
+        deadlock, it retries with exponential backoff. Retrying a file is safe as all the statements are MERGE.
+        :param publish_func: Either _publish_node or _publish_relation
+        :param file_path:
+        :return:
+        """
+        context = self._session_pool.get()
+        self._thread_local.context = context
+        try:
+            Retrying(retry_on_exception=_is_transient_error,
+                     stop_max_attempt_number=self._transient_error_max_attempts,
+                     wait_exponential_multiplier=1000,
+                     wait_exponential_max=10000,
+                     wait_jitter_max=1000).call(self._publish_file_in_transaction, publish_func, file_path, context)
+        finally:
+            self._thread_local.context = None
+            self._session_pool.put(context)
+
+        with self._progress_lock:
+            self._published_file_count += 1
+            LOGGER.info('Published {} ({}/{} files)'.format(file_path,
+                                                            self._published_file_count,
+                                                            self._total_file_count))
+
+    def _publish_file_in_transaction(self,
+                                     publish_func,  # type: Callable[[str, Transaction], Transaction]
+                                     file_path,  # type: str
+                                     context  # type: _SessionContext
+                                     ):
+        # type: (...) -> None
+        # Records processed by previous failed attempt are not committed
+        context.offsets = {}
+        tx = context.session.begin_transaction()
+        try:
+            tx = publish_func(file_path, tx=tx)
+            self._commit(tx, context)
+        except Exception as e:
+            if not tx.closed():
+                tx.rollback()
+            if _is_transient_error(e):
+                LOGGER.warning('Transient error while publishing {}: {}'.format(file_path, e))
+            raise e
+
     def get_scope(self):
         # type: () -> str
         return 'publisher.neo4j'
 
-    def _create_indices(self, node_file):
+    def _create_indices(self):
+        # type: () -> None
         """
-        Go over the node file and try creating unique index
-        :param node_file:
+        Find out labels of the node files and try creating unique index for each label in a single session
         :return:
         """
-        # type: (str) -> None
         LOGGER.info('Creating indices. (Existing indices will be ignored)')
 
-        with open(node_file, 'r') as node_csv:
-            for node_record in csv.DictReader(node_csv):
-                label = node_record[NODE_LABEL_KEY]
-                if label not in self.labels:
-                    self._try_create_index(label)
-                    self.labels.add(label)
+        labels = self._get_node_labels()
+        with self._driver.session() as session:
+            for label in sorted(labels - self.labels):
+                stmt = CREATE_UNIQUE_INDEX_TEMPLATE.substitute(LABEL=label)
+                LOGGER.info('Trying to create index for label {label} if not exist: {stmt}'.format(label=label,
+                                                                                                   stmt=stmt))
+                session.run(stmt)
+        self.labels.update(labels)
 
         LOGGER.info('Indices have been created.')
 
+    def _get_node_labels(self):
+        # type: () -> Set[str]
+        """
+        Labels of the node files from the manifest written by FsNeo4jCSVLoader. Node file that is not in the manifest
+        (or if there's no manifest) is scanned to find out its labels.
+        :return:
+        """
+        manifests = {}  # type: Dict[str, Dict[str, Dict[str, Any]]]
+        labels = set()  # type: Set[str]
+        for node_file in self._node_files:
+            dir_path = dirname(node_file)
+            if dir_path not in manifests:
+                manifests[dir_path] = read_manifest(dir_path)
+
+            entry = manifests[dir_path].get(basename(node_file))
+            if entry:
+                labels.update(entry['labels'])
+                continue
+
+            LOGGER.info('{} is not in manifest. Scanning the file for labels'.format(node_file))
+            with open_file(node_file, 'r') as node_csv:
+                for node_record in csv.DictReader(node_csv):
+                    labels.add(node_record[NODE_LABEL_KEY])
+
+        return labels
+
     def _publish_node(self, node_file, tx):
         # type: (str, Transaction) -> Transaction
         """
@@ -238,24 +558,137 @@ class Neo4jCsvPublisher(Publisher):
         All nodes should have a unique key, and this method will try to create unique index on the LABEL when it sees
         first time within a job scope.
         Example of Cypher query executed by this method:
-        MERGE (col_test_id1:Column {key: 'presto://gold.test_schema1/test_table1/test_id1'})
-        ON CREATE SET col_test_id1.name = 'test_id1',
-                      col_test_id1.order_pos = 2,
-                      col_test_id1.type = 'bigint'
-        ON MATCH SET col_test_id1.name = 'test_id1',
-                     col_test_id1.order_pos = 2,
-                     col_test_id1.type = 'bigint'
+        MERGE (node:Column {key: $key})
+        ON CREATE SET node += $props, node.published_tag = $publish_tag,
+                      node.publisher_last_updated_epoch_ms = timestamp()
+        ON MATCH SET node += $props, node.published_tag = $publish_tag,
+                     node.publisher_last_updated_epoch_ms = timestamp()
+        with parameters:
+        {'key': 'presto://gold.test_schema1/test_table1/test_id1',
+         'props': {'name': 'test_id1', 'order_pos': 2, 'type': 'bigint'},
+         'publish_tag': '2020-01-01'}
 
         :param node_file:
         :return:
         """
+        if self._unwind_batch_size > 0:
+            return self._publish_batch(node_file, tx, self._to_node_batch_row, self._execute_node_batch)
+
+        offset, position = self._checkpoint.resume_point(node_file, 0)
+        node_reader = _CsvFileReader(node_file, position)
+        for node_record in node_reader:
+            offset += 1
+            stmt, params = self.create_node_merge_statement(node_record=node_record)
+            self._set_offset(node_file, 0, offset, node_reader.position)
+            tx = self._execute_statement(stmt, tx, params=params)
+        return tx
 
-        with open(node_file, 'r') as node_csv:
-            for count, node_record in enumerate(csv.DictReader(node_csv)):
-                stmt = self.create_node_merge_statement(node_record=node_record)
-                tx = self._execute_statement(stmt, tx)
+    def _publish_batch(self,
+                       file_path,  # type: str
+                       tx,  # type: Transaction
+                       to_batch_row,  # type: Callable[[Dict[str, str]], Tuple[Tuple, Dict[str, Any]]]
+                       execute_batch,  # type: Callable[[Tuple, List[Dict[str, Any]], Transaction], Transaction]
+                       offset_base=0  # type: int
+                       ):
+        # type: (...) -> Transaction
+        """
+        Groups csv records of a file and executes each group with UNWIND statement once the group reaches the batch
+        size. Remaining groups are flushed at the end of the file.
+        Example of Cypher query executed for nodes:
+        UNWIND $batch AS row
+        MERGE (node:Column {key: row.KEY})
+        ON CREATE SET node += row.props, node.published_tag = $publish_tag,
+                      node.publisher_last_updated_epoch_ms = timestamp()
+        ON MATCH SET node += row.props, node.published_tag = $publish_tag,
+                     node.publisher_last_updated_epoch_ms = timestamp()
+
+        :param file_path:
+        :param tx:
+        :param to_batch_row: A function that converts csv record into group and row of the batch
+        :param execute_batch: A function that executes a batch of the group
+        :param offset_base: Number of records processed before this pass. Used for checkpoint.
+        :return:
+        """
+        offset, position = self._checkpoint.resume_point(file_path, offset_base)
+        batches = {}  # type: Dict[Tuple, List[Dict[str, Any]]]
+        # Offset and byte position of the first row per group. Checkpoint only covers records before the first row of
+        # any pending group.
+        first_offsets = {}  # type: Dict[Tuple, Tuple[int, int]]
+        reader = _CsvFileReader(file_path, position)
+        for record in reader:
+            start = offset, position
+            offset, position = offset + 1, reader.position
+
+            group, row = to_batch_row(record)
+            rows = batches.setdefault(group, [])
+            if not rows:
+                first_offsets[group] = start
+            rows.append(row)
+            if len(rows) >= self._unwind_batch_size:
+                del batches[group]
+                del first_offsets[group]
+                self._set_offset(file_path, offset_base,
+                                 *(min(six.itervalues(first_offsets)) if first_offsets else (offset, position)))
+                tx = execute_batch(group, rows, tx)
+
+        for group in sorted(batches, key=first_offsets.get):
+            rows = batches.pop(group)
+            del first_offsets[group]
+            self._set_offset(file_path, offset_base,
+                             *(min(six.itervalues(first_offsets)) if first_offsets else (offset, position)))
+            tx = execute_batch(group, rows, tx)
         return tx
 
+    def _to_node_batch_row(self, node_record):
+        # type: (Dict[str, str]) -> Tuple[Tuple, Dict[str, Any]]
+        """
+        Node is grouped by (LABEL, header set)
+        :param node_record:
+        :return:
+        """
+        group = (node_record[NODE_LABEL_KEY], frozenset(node_record.keys()))
+        row = {NODE_KEY_KEY: node_record[NODE_KEY_KEY],
+               'props': self._create_props_param(node_record, NODE_REQUIRED_KEYS)}
+        return group, row
+
+    def _execute_node_batch(self, group, rows, tx):
+        # type: (Tuple[str, FrozenSet[str]], List[Dict[str, Any]], Transaction) -> Transaction
+        stmt = self.create_node_unwind_statement(group[0])
+        return self._execute_statement(stmt, tx, params={'batch': rows, 'publish_tag': self.publish_tag})
+
+    def create_node_unwind_statement(self, label):
+        # type: (str) -> str
+        """
+        Creates node merge statement that merges a batch of rows of the label
+        :param label:
+        :return:
+        """
+        return self._create_node_statement(NODE_UNWIND_MERGE_TEMPLATE, label, 'row.props')
+
+    def _create_node_statement(self, template, label, props_param):
+        # type: (Template, str, str) -> str
+        """
+        Creates node merge statement from the template once per label
+        :param template: Either NODE_MERGE_TEMPLATE or NODE_UNWIND_MERGE_TEMPLATE
+        :param label:
+        :param props_param: Cypher expression of properties map
+        :return:
+        """
+        stmt = self._statements.get((template, label))
+        if stmt:
+            return stmt
+
+        prop_body = self._create_props_body('node', props_param)
+        update_statement = ''
+        if not self.is_create_only_node({NODE_LABEL_KEY: label}):
+            update_statement = NODE_UPDATE_TEMPLATE.substitute(update_prop_body=prop_body)
+
+        stmt = template.substitute(LABEL=label,
+                                   create_prop_body=prop_body,
+                                   update_statement=update_statement)
+        self._statements[(template, label)] = stmt
+        return stmt
+
     def is_create_only_node(self, node_record):
         # type: (dict) -> bool
         """
@@ -269,22 +702,17 @@ class Neo4jCsvPublisher(Publisher):
             return False
 
     def create_node_merge_statement(self, node_record):
-        # type: (dict) -> str
+        # type: (dict) -> Tuple[str, Dict[str, Any]]
         """
-        Creates node merge statement
+        Creates node merge statement and its parameters
         :param node_record:
-        :return:
+        :return: A tuple of Cypher statement and parameters
         """
-        params = copy.deepcopy(node_record)
-        params['create_prop_body'] = self._create_props_body(node_record, NODE_REQUIRED_KEYS, 'node')
-
-        update_statement = ''
-        if not self.is_create_only_node(node_record):
-            update_prop_body = self._create_props_body(node_record, NODE_REQUIRED_KEYS, 'node')
-            update_statement = NODE_UPDATE_TEMPLATE.substitute(update_prop_body=update_prop_body)
-        params['update_statement'] = update_statement
-
-        return NODE_MERGE_TEMPLATE.substitute(params)
+        stmt = self._create_node_statement(NODE_MERGE_TEMPLATE, node_record[NODE_LABEL_KEY], '$props')
+        params = {'key': node_record[NODE_KEY_KEY],
+                  'props': self._create_props_param(node_record, NODE_REQUIRED_KEYS),
+                  'publish_tag': self.publish_tag}
+        return stmt, params
 
     def _publish_relation(self, relation_file, tx):
         # type: (str, Transaction) -> Transaction
@@ -293,127 +721,259 @@ class Neo4jCsvPublisher(Publisher):
         (In Amundsen, all relation is bi-directional)
 
         Example of Cypher query executed by this method:
-        MATCH (n1:Table {key: 'presto://gold.test_schema1/test_table1'}),
-              (n2:Column {key: 'presto://gold.test_schema1/test_table1/test_col1'})
+        MATCH (n1:Table {key: $start_key}),
+              (n2:Column {key: $end_key})
         MERGE (n1)-[r1:COLUMN]->(n2)-[r2:BELONG_TO_TABLE]->(n1)
+        ON CREATE SET r1 += $props, r1.published_tag = $publish_tag, ...
+        ON MATCH SET r1 += $props, r1.published_tag = $publish_tag, ...
         RETURN n1.key, n2.key
 
         :param relation_file:
         :return:
         """
 
+        offset_base = 0
         if self._relation_preprocessor.is_perform_preprocess():
             LOGGER.info('Pre-processing relation with {}'.format(self._relation_preprocessor))
+            tx, offset_base = self._preprocess_relation(relation_file, tx)
+
+        if self._unwind_batch_size > 0:
+            return self._publish_batch(relation_file, tx, self._to_relation_batch_row, self._execute_relation_batch,
+                                       offset_base=offset_base)
 
-            count = 0
-            with open(relation_file, 'r') as relation_csv:
-                for rel_record in csv.DictReader(relation_csv):
-                    stmt, params = self._relation_preprocessor.preprocess_cypher(
-                        start_label=rel_record[RELATION_START_LABEL],
-                        end_label=rel_record[RELATION_END_LABEL],
-                        start_key=rel_record[RELATION_START_KEY],
-                        end_key=rel_record[RELATION_END_KEY],
-                        relation=rel_record[RELATION_TYPE],
-                        reverse_relation=rel_record[RELATION_REVERSE_TYPE])
-
-                    if stmt:
-                        tx = self._execute_statement(stmt, tx=tx, params=params)
-                        count += 1
-
-            LOGGER.info('Executed pre-processing Cypher statement {} times'.format(count))
-
-        with open(relation_file, 'r') as relation_csv:
-            for count, rel_record in enumerate(csv.DictReader(relation_csv)):
-                stmt = self.create_relationship_merge_statement(rel_record=rel_record)
-                tx = self._execute_statement(stmt, tx,
-                                             expect_result=self._confirm_rel_created)
+        offset, position = self._checkpoint.resume_point(relation_file, offset_base)
+        relation_reader = _CsvFileReader(relation_file, position)
+        for rel_record in relation_reader:
+            offset += 1
+            stmt, params = self.create_relationship_merge_statement(rel_record=rel_record)
+            self._set_offset(relation_file, offset_base, offset, relation_reader.position)
+            tx = self._execute_statement(stmt, tx, params=params,
+                                         expect_result=self._confirm_rel_created)
 
         return tx
 
-    def create_relationship_merge_statement(self, rel_record):
-        # type: (dict) -> str
+    def _preprocess_relation(self, relation_file, tx):
+        # type: (str, Transaction) -> Tuple[Transaction, int]
         """
-        Creates relationship merge statement
+        Executes pre-processing Cypher statement per relation record, which is the first pass over the file.
+        :param relation_file:
+        :param tx:
+        :return: A tuple of transaction and the number of records in the file, where the next pass starts.
+        """
+        offset, position = self._checkpoint.resume_point(relation_file, 0)
+        if position is None:
+            # Pre-processing is already committed
+            return tx, offset
+
+        count = 0
+        relation_reader = _CsvFileReader(relation_file, position)
+        for rel_record in relation_reader:
+            offset += 1
+            stmt, params = self._relation_preprocessor.preprocess_cypher(
+                start_label=rel_record[RELATION_START_LABEL],
+                end_label=rel_record[RELATION_END_LABEL],
+                start_key=rel_record[RELATION_START_KEY],
+                end_key=rel_record[RELATION_END_KEY],
+                relation=rel_record[RELATION_TYPE],
+                reverse_relation=rel_record[RELATION_REVERSE_TYPE])
+
+            if stmt:
+                self._set_offset(relation_file, 0, offset, relation_reader.position)
+                tx = self._execute_statement(stmt, tx=tx, params=params)
+                count += 1
+
+        LOGGER.info('Executed pre-processing Cypher statement {} times'.format(count))
+        return tx, offset
+
+    def _to_relation_batch_row(self, rel_record):
+        # type: (Dict[str, str]) -> Tuple[Tuple, Dict[str, Any]]
+        """
+        Relation is grouped by (START_LABEL, END_LABEL, TYPE, REVERSE_TYPE, header set)
+        Example of Cypher query executed for relations:
+        UNWIND $batch AS row
+        MATCH (n1:Table {key: row.START_KEY}),
+              (n2:Column {key: row.END_KEY})
+        MERGE (n1)-[r1:COLUMN]->(n2)-[r2:BELONG_TO_TABLE]->(n1)
+        ON CREATE SET r1 += row.props, r1.published_tag = $publish_tag, ...
+        ON MATCH SET r1 += row.props, r1.published_tag = $publish_tag, ...
+        RETURN count(*) AS count
+
         :param rel_record:
         :return:
         """
-        param = copy.deepcopy(rel_record)
-        create_prop_body = self._create_props_body(rel_record, RELATION_REQUIRED_KEYS, 'r1')
-        param['PROP_STMT'] = ' '  # No properties for relationship by default
-
-        if create_prop_body:
-            # We need one more body for reverse relation
-            create_prop_body = ' , '.join([create_prop_body,
-                                           self._create_props_body(rel_record, RELATION_REQUIRED_KEYS, 'r2')])
-            update_prop_body = ' , '.join([self._create_props_body(rel_record, RELATION_REQUIRED_KEYS, 'r1'),
-                                           self._create_props_body(rel_record, RELATION_REQUIRED_KEYS, 'r2')])
-
-            param['PROP_STMT'] = """ON CREATE SET {create_prop_body}
-ON MATCH SET {update_prop_body}""".format(create_prop_body=create_prop_body,
-                                          update_prop_body=update_prop_body)
-
-        return RELATION_MERGE_TEMPLATE.substitute(param)
-
-    def _create_props_body(self,
-                           record_dict,
-                           excludes,
-                           identifier):
-        # type: (dict, Set, str) -> str
+        group = (rel_record[RELATION_START_LABEL],
+                 rel_record[RELATION_END_LABEL],
+                 rel_record[RELATION_TYPE],
+                 rel_record[RELATION_REVERSE_TYPE],
+                 frozenset(rel_record.keys()))
+        row = {RELATION_START_KEY: rel_record[RELATION_START_KEY],
+               RELATION_END_KEY: rel_record[RELATION_END_KEY],
+               'props': self._create_props_param(rel_record, RELATION_REQUIRED_KEYS)}
+        return group, row
+
+    def _execute_relation_batch(self, group, rows, tx):
+        # type: (Tuple[str, str, str, str, FrozenSet[str]], List[Dict[str, Any]], Transaction) -> Transaction
+        start_label, end_label, rel_type, reverse_type, _ = group
+        stmt = self.create_relationship_unwind_statement(start_label=start_label,
+                                                         end_label=end_label,
+                                                         rel_type=rel_type,
+                                                         reverse_type=reverse_type)
+        return self._execute_statement(stmt, tx,
+                                       params={'batch': rows, 'publish_tag': self.publish_tag},
+                                       expect_count=len(rows) if self._confirm_rel_created else None)
+
+    def create_relationship_unwind_statement(self, start_label, end_label, rel_type, reverse_type):
+        # type: (str, str, str, str) -> str
         """
-        Creates properties body with params required for resolving template.
+        Creates relationship merge statement that merges a batch of rows of the same relation
+        :param start_label:
+        :param end_label:
+        :param rel_type:
+        :param reverse_type:
+        :return:
+        """
+        return self._create_relationship_statement(RELATION_UNWIND_MERGE_TEMPLATE, start_label, end_label, rel_type,
+                                                   reverse_type, 'row.props')
 
-        e.g: Note that node.key3 is not quoted if header has UNQUOTED_SUFFIX.
-        identifier.key1 = 'val1' , identifier.key2 = 'val2', identifier.key3 = val3
+    def create_relationship_merge_statement(self, rel_record):
+        # type: (dict) -> Tuple[str, Dict[str, Any]]
+        """
+        Creates relationship merge statement and its parameters
+        :param rel_record:
+        :return: A tuple of Cypher statement and parameters
+        """
+        stmt = self._create_relationship_statement(RELATION_MERGE_TEMPLATE,
+                                                   rel_record[RELATION_START_LABEL],
+                                                   rel_record[RELATION_END_LABEL],
+                                                   rel_record[RELATION_TYPE],
+                                                   rel_record[RELATION_REVERSE_TYPE],
+                                                   '$props')
+        params = {'start_key': rel_record[RELATION_START_KEY],
+                  'end_key': rel_record[RELATION_END_KEY],
+                  'props': self._create_props_param(rel_record, RELATION_REQUIRED_KEYS),
+                  'publish_tag': self.publish_tag}
+        return stmt, params
+
+    def _create_relationship_statement(self,
+                                       template,  # type: Template
+                                       start_label,  # type: str
+                                       end_label,  # type: str
+                                       rel_type,  # type: str
+                                       reverse_type,  # type: str
+                                       props_param  # type: str
+                                       ):
+        # type: (...) -> str
+        """
+        Creates relationship merge statement from the template once per labels and types
+        :param template: Either RELATION_MERGE_TEMPLATE or RELATION_UNWIND_MERGE_TEMPLATE
+        :param start_label:
+        :param end_label:
+        :param rel_type:
+        :param reverse_type:
+        :param props_param: Cypher expression of properties map
+        :return:
+        """
+        cache_key = (template, start_label, end_label, rel_type, reverse_type)
+        stmt = self._statements.get(cache_key)
+        if stmt:
+            return stmt
+
+        # We need one more body for reverse relation
+        prop_body = ' , '.join([self._create_props_body('r1', props_param),
+                                self._create_props_body('r2', props_param)])
+        stmt = template.substitute(START_LABEL=start_label,
+                                   END_LABEL=end_label,
+                                   TYPE=rel_type,
+                                   REVERSE_TYPE=reverse_type,
+                                   prop_body=prop_body)
+        self._statements[cache_key] = stmt
+        return stmt
+
+    def _create_props_param(self,
+                            record_dict,
+                            excludes):
+        # type: (dict, Set) -> Dict[str, Any]
+        """
+        Creates properties map that will be passed as a Cypher parameter.
+        Header with UNQUOTED_SUFFIX is stripped of the suffix and its value is converted into native type.
 
         :param record_dict: A dict represents CSV row
         :param excludes: set of excluded columns that does not need to be in properties (e.g: KEY, LABEL ...)
-        :param identifier: identifier that will be used in CYPHER query as shown on above example
-        :param is_update: Creates property body for update statement in MERGE
-        :return: Properties body for Cypher statement
+        :return: Properties map
         """
-        template_params = {}
-        props = []
+        props = {}
         for k, v in six.iteritems(record_dict):
             if k in excludes:
-                template_params[k] = v
                 continue
 
-            # escape quote for Cypher query
-            # if isinstance(str, v):
-            v = v.replace('\'', "\\'")
-
             if k.endswith(UNQUOTED_SUFFIX):
-                k = k[:-len(UNQUOTED_SUFFIX)]
-                props.append('{id}.{key} = {val}'.format(id=identifier, key=k, val=v))
+                props[k[:-len(UNQUOTED_SUFFIX)]] = parse_unquoted_value(v)
             else:
-                props.append("""{id}.{key} = '{val}'""".format(id=identifier, key=k, val=v))
+                props[k] = v
 
-            template_params[k] = v
+        return props
 
-        props.append("""{id}.{key} = '{val}'""".format(id=identifier,
-                                                       key=PUBLISHED_TAG_PROPERTY_NAME,
-                                                       val=self.publish_tag))
+    def _create_props_body(self,
+                           identifier,
+                           props_param):
+        # type: (str, str) -> str
+        """
+        Creates properties body where properties are provided by parameter.
+        e.g: node += $props, node.published_tag = $publish_tag, node.publisher_last_updated_epoch_ms = timestamp()
 
-        props.append("""{id}.{key} = {val}""".format(id=identifier,
-                                                     key=LAST_UPDATED_EPOCH_MS,
-                                                     val='timestamp()'))
+        :param identifier: identifier that will be used in CYPHER query as shown on above example
+        :param props_param: Cypher expression of properties map. (e.g: $props, row.props)
+        :return: Properties body for Cypher statement
+        """
+        return ', '.join(['{id} += {props}'.format(id=identifier, props=props_param),
+                          '{id}.{key} = $publish_tag'.format(id=identifier, key=PUBLISHED_TAG_PROPERTY_NAME),
+                          '{id}.{key} = timestamp()'.format(id=identifier, key=LAST_UPDATED_EPOCH_MS)])
 
-        return ', '.join(props)
+    def _current_context(self):
+        # type: () -> _SessionContext
+        return getattr(self._thread_local, 'context', None) or self._session_context
+
+    def _set_offset(self, file_path, base, offset, position):
+        # type: (str, int, int, int) -> None
+        """
+        Sets the records of the file that will be committed with current transaction
+        :param file_path:
+        :param base: Offset where current pass over the file starts
+        :param offset: Number of records processed
+        :param position: Byte position in the file right after the records processed
+        :return:
+        """
+        self._current_context().offsets[file_path] = {'base': base, 'offset': offset, 'position': position}
+
+    def _commit(self, tx, context):
+        # type: (Transaction, _SessionContext) -> None
+        """
+        Commits the transaction and records checkpoint of the records committed by the transaction
+        :param tx:
+        :param context:
+        :return:
+        """
+        tx.commit()
+        context.commit_count += 1
+        self._checkpoint.commit(context.offsets)
+        context.offsets = {}
 
     def _execute_statement(self,
                            stmt,
                            tx,
                            params=None,
-                           expect_result=False):
-        # type: (str, Transaction, bool) -> Transaction
+                           expect_result=False,
+                           expect_count=None):
+        # type: (str, Transaction, Dict[str, Any], bool, int) -> Transaction
 
         """
         Executes statement against Neo4j. If execution fails, it rollsback and raise exception.
         If 'expect_result' flag is True, it confirms if result object is not null.
         :param stmt:
         :param tx:
-        :param count:
+        :param params: Parameters of the Cypher statement
         :param expect_result: By having this True, it will validate if result object is not None.
+        :param expect_count: If provided, it will validate if 'count' of the result equals to it.
         :return:
         """
         try:
@@ -423,18 +983,23 @@ ON MATCH SET {update_prop_body}""".format(create_prop_body=create_prop_body,
             if six.PY2:
                 result = tx.run(unicode(stmt, errors='ignore'), parameters=params)  # noqa
             else:
-                result = tx.run(str(stmt).encode('utf-8', 'ignore'), parameters=params)
+                result = tx.run(stmt, parameters=params)
             if expect_result and not result.single():
                 raise RuntimeError('Failed to executed statement: {}'.format(stmt))
 
-            self._count += 1
-            if self._count > 1 and self._count % self._transaction_size == 0:
-                tx.commit()
-                LOGGER.info('Committed {} statements so far'.format(self._count))
-                return self._session.begin_transaction()
+            if expect_count is not None and result.single()['count'] != expect_count:
+                raise RuntimeError('Failed to executed statement for all {} rows: {}'.format(expect_count, stmt))
+
+            # In parallel mode, each thread uses its own session and counts its own transaction size
+            context = self._current_context()
+            context.count += 1
+            if context.count > 1 and context.count % self._transaction_size == 0:
+                self._commit(tx, context)
+                LOGGER.info('Committed {} statements so far'.format(context.count))
+                return context.session.begin_transaction()
 
-            if self._count > 1 and self._count % self._progress_report_frequency == 0:
-                LOGGER.info('Processed {} statements so far'.format(self._count))
+            if context.count > 1 and context.count % self._progress_report_frequency == 0:
+                LOGGER.info('Processed {} statements so far'.format(context.count))
 
             return tx
         except Exception as e:
@@ -443,17 +1008,77 @@ ON MATCH SET {update_prop_body}""".format(create_prop_body=create_prop_body,
                 tx.rollback()
             raise e
 
-    def _try_create_index(self,
-                          label):
-        # type: (str) -> None
-        """
-        For any label seen first time for this publisher it will try to create unique index.
-        There's no side effect on Neo4j side issuing index creation for existing index.
-        :param label:
-        :return:
-        """
-        stmt = CREATE_UNIQUE_INDEX_TEMPLATE.substitute(LABEL=label)
-        LOGGER.info('Trying to create index for label {label} if not exist: {stmt}'.format(label=label,
-                                                                                           stmt=stmt))
-        with self._driver.session() as session:
-            session.run(stmt)
+
+def list_files(dir_path):
+    # type: (str) -> List[str]
+    """
+    Lists files in the directory and in its immediate sub-directories, except manifest file. Sub-directories are
+    written by each shard of ParallelJob.
+    :param dir_path:
+    :return: Sorted list of file paths
+    """
+    files = []  # type: List[str]
+    for name in sorted(listdir(dir_path)):
+        path = join(dir_path, name)
+        if isdir(path):
+            files.extend(join(path, f) for f in sorted(listdir(path))
+                         if isfile(join(path, f)) and f != MANIFEST_FILE_NAME)
+        elif name != MANIFEST_FILE_NAME:
+            files.append(path)
+    return files
+
+
+def read_manifest(dir_path):
+    # type: (str) -> Dict[str, Dict[str, Any]]
+    """
+    Reads manifest in the directory.
+    :param dir_path:
+    :return: A dict where key is CSV file name, and value is its description. Empty if there's no manifest.
+    """
+    path = join(dir_path, MANIFEST_FILE_NAME)
+    if not isfile(path):
+        return {}
+
+    with open(path, 'r') as manifest_file:
+        return json.load(manifest_file)['files']
+
+
+def _is_transient_error(e):
+    # type: (Exception) -> bool
+    """
+    Transient error (e.g: Neo.TransientError.Transaction.DeadlockDetected) can be resolved by retrying
+    :param e:
+    :return:
+    """
+    return isinstance(e, TransientError)
+
+
+def parse_unquoted_value(value):
+    # type: (str) -> Any
+    """
+    Converts value of a header with UNQUOTED_SUFFIX into native type, the same way Cypher would have interpreted it as
+    a literal. (e.g: 'True' -> True, '3' -> 3, '1.5' -> 1.5, '"foo"' -> 'foo')
+    :param value:
+    :return:
+    """
+    stripped = value.strip()
+    lowered = stripped.lower()
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    if lowered in ('null', ''):
+        return None
+
+    try:
+        return int(stripped)
+    except ValueError:
+        pass
+
+    try:
+        return float(stripped)
+    except ValueError:
+        pass
+
+    if len(stripped) > 1 and stripped[0] == stripped[-1] and stripped[0] in ('\'', '"'):
+        return stripped[1:-1]
+
+    return value
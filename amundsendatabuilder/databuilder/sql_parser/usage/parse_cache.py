@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import re
+import shelve
+from collections import OrderedDict
+
+import six
+from typing import Any, Optional  # noqa: F401
+
+LOGGER = logging.getLogger(__name__)
+
+# Bump when parsed result changes for the same statement (e.g: grammar or listener change), so that results
+# persisted by the previous version are not used.
+CACHE_VERSION = 1
+
+_TOKEN_REGEX = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<number>\b\d+(?:\.\d*)?(?:[eE][-+]?\d+)?\b)
+  | (?P<space>(?:\s|--[^\n]*|/\*.*?\*/)+)
+""", re.VERBOSE | re.DOTALL)
+
+
+def _normalize_token(match):
+    # type: (Any) -> str
+    kind = match.lastgroup
+    if kind in ('string', 'number'):
+        return '?'
+    if kind == 'quoted':
+        return match.group()
+    return ' '
+
+
+def get_fingerprint(stmt):
+    # type: (str) -> str
+    """
+    Normalizes SQL statement into a fingerprint, so that the statements that only differ in literals, whitespaces,
+    comments, or case have the same fingerprint. e.g: "SELECT foo FROM bar WHERE ds = '2019-01-01'" and
+    "select foo\n  from bar where ds = '2019-01-02';" both become "select foo from bar where ds = ?"
+    Note that it is case insensitive as ColumnUsageProvider upper cases statement before parsing it.
+    :param stmt:
+    :return:
+    """
+    return _TOKEN_REGEX.sub(_normalize_token, stmt).strip().rstrip(';').strip().lower()
+
+
+class ParseCache(object):
+    """
+    A cache of parsed result (e.g: columns from ColumnUsageProvider) keyed by the fingerprint of the statement.
+
+    The most recently used max_size results are kept in memory. If path is provided, results are also persisted in
+    a shelve database on the path, so that they can be reused across runs.
+    """
+    def __init__(self,
+                 max_size,  # type: int
+                 path=None  # type: Optional[str]
+                 ):
+        # type: (...) -> None
+        self._max_size = max_size
+        self._memory = OrderedDict()  # type: OrderedDict
+        self._store = shelve.open(path) if path else None
+        self.hit_count = 0
+        self.disk_hit_count = 0
+        self.miss_count = 0
+
+    @staticmethod
+    def get_key(stmt):
+        # type: (str) -> str
+        fingerprint = get_fingerprint(stmt)
+        if isinstance(fingerprint, six.text_type):
+            fingerprint = fingerprint.encode('utf-8')
+        return '{}:{}'.format(CACHE_VERSION, hashlib.sha1(fingerprint).hexdigest())
+
+    def get(self, key):
+        # type: (str) -> Optional[Any]
+        """
+        :param key: Key from get_key
+        :return: Cached result, or None if not cached
+        """
+        if key in self._memory:
+            # Moves to the end as most recently used
+            result = self._memory.pop(key)
+            self._memory[key] = result
+            self.hit_count += 1
+            return result
+
+        if self._store is not None and key in self._store:
+            result = self._store[key]
+            self._put_memory(key, result)
+            self.hit_count += 1
+            self.disk_hit_count += 1
+            return result
+
+        self.miss_count += 1
+        return None
+
+    def put(self, key, result):
+        # type: (str, Any) -> None
+        self._put_memory(key, result)
+        if self._store is not None:
+            self._store[key] = result
+
+    def _put_memory(self, key, result):
+        # type: (str, Any) -> None
+        self._memory[key] = result
+        if len(self._memory) > self._max_size:
+            self._memory.popitem(last=False)
+
+    def get_hit_rate(self):
+        # type: () -> float
+        total = self.hit_count + self.miss_count
+        return float(self.hit_count) / total if total else 0.0
+
+    def close(self):
+        # type: () -> None
+        LOGGER.info('Parse cache hit rate: {:.1%} ({} hits including {} from disk, {} misses)'
+                    .format(self.get_hit_rate(), self.hit_count, self.disk_hit_count, self.miss_count))
+        if self._store is not None:
+            self._store.close()
+            self._store = None
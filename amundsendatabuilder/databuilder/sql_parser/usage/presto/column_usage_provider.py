@@ -1,5 +1,8 @@
 import logging
 from antlr4 import InputStream, CommonTokenStream, ParseTreeWalker
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
 from typing import Iterable, List  # noqa: F401
 
 from databuilder.sql_parser.usage.column import Column, Table, remove_double_quotes
@@ -203,22 +206,52 @@ class ColumnUsageProvider(object):
         pass
 
     @classmethod
-    def get_columns(cls, query):
-        # type: (str) -> Iterable[Column]
+    def get_columns(cls, query, sll_first=True):
+        # type: (str, bool) -> Iterable[Column]
         """
         Using presto Grammar, instantiate Parsetree, attach ColumnUsageListener to tree and walk the tree.
         Once finished walking the tree, listener will have selected columns and return them.
         :param query:
+        :param sll_first: Parse in two stages, where it first tries SLL prediction mode, which is much faster and
+        enough for most of the statements, and falls back to full LL prediction mode only if SLL fails.
         :return:
         """
 
         query = query.rstrip(';').upper() + "\n"
         lexer = SqlBaseLexer(InputStream(query))
-        parser = SqlBaseParser(CommonTokenStream(lexer))
-        parse_tree = parser.singleStatement()
+        token_stream = CommonTokenStream(lexer)
+        parser = SqlBaseParser(token_stream)
+        if sll_first:
+            parse_tree = cls._parse_two_stage(parser, token_stream)
+        else:
+            parse_tree = parser.singleStatement()
 
         listener = ColumnUsageListener()
         walker = ParseTreeWalker()
         walker.walk(listener, parse_tree)
 
         return listener.processed_cols
+
+    @staticmethod
+    def _parse_two_stage(parser, token_stream):
+        # type: (SqlBaseParser, CommonTokenStream) -> SqlBaseParser.SingleStatementContext
+        """
+        Parses with SLL prediction mode that bails out on the first syntax error without reporting it, and re-parses
+        with LL prediction mode and the default error reporting and recovery if it fails. SLL can fail on a valid
+        statement that needs full context to predict, while a statement that SLL parses is parsed the same by LL.
+        """
+        error_listeners = parser._listeners
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = BailErrorStrategy()
+        parser.removeErrorListeners()
+        try:
+            return parser.singleStatement()
+        except ParseCancellationException:
+            LOGGER.debug('SLL prediction mode failed. Falling back to LL')
+
+        token_stream.seek(0)
+        parser.reset()
+        parser._interp.predictionMode = PredictionMode.LL
+        parser._errHandler = DefaultErrorStrategy()
+        parser._listeners = error_listeners
+        return parser.singleStatement()
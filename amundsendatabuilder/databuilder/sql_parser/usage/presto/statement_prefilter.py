@@ -0,0 +1,209 @@
+import re
+
+from typing import List, Optional, Tuple  # noqa: F401
+
+from databuilder.sql_parser.usage.column import Column, Table
+from databuilder.sql_parser.usage.presto.antlr_generated.SqlBaseLexer import SqlBaseLexer
+
+# Kinds of statement that don't need full parse
+NO_SELECT = 'no_select'
+SIMPLE_SELECT = 'simple_select'
+
+# Presto keywords, reserved or not. A word that is a keyword is not taken as an identifier here, and leaves the
+# statement to the parser.
+_KEYWORDS = frozenset(name.strip("'") for name in SqlBaseLexer.literalNames if re.match(r"'[A-Z_]+'$", name))
+# Clauses that can follow the table in a simple SELECT without reading more tables
+_CLAUSE_KEYWORDS = frozenset(['WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT'])
+
+_SELECT_REGEX = re.compile(r'select', re.IGNORECASE)
+_TOKEN_REGEX = re.compile(r"""
+    (?P<space>(?:\s|--[^\n]*|/\*.*?\*/)+)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<word>[A-Za-z_][A-Za-z0-9_@:]*)
+  | (?P<number>[0-9][A-Za-z0-9_@:.]*|\.[0-9]+)
+  | (?P<symbol>.)
+""", re.VERBOSE | re.DOTALL)
+
+_Token = Tuple[str, str]
+
+
+def prefilter(stmt):
+    # type: (str) -> Tuple[Optional[str], Optional[List[Column]]]
+    """
+    Classifies the statement with a tokenizer, which is much cheaper than ANTLR parser, and provides the same
+    columns as ColumnUsageProvider.get_columns where it can be told without full parse:
+     - A statement without SELECT (e.g: DDL, SHOW, DESCRIBE, INSERT ... VALUES) does not read any table.
+     - A simple SELECT from a single table, where selected columns are plain identifiers, e.g:
+       SELECT foo, t.bar AS b FROM schema.table t WHERE ...
+
+    :param stmt: SQL statement
+    :return: (NO_SELECT or SIMPLE_SELECT, columns), or (None, None) if the statement needs full parse
+    """
+    if not _SELECT_REGEX.search(stmt):
+        return NO_SELECT, []
+
+    tokens = _tokenize(stmt)
+    if tokens is None:
+        return None, None
+
+    select_count = tokens.count(('word', 'SELECT'))
+    if not select_count:
+        return NO_SELECT, []
+
+    if select_count > 1:
+        return None, None
+
+    columns = _get_simple_select_columns(tokens)
+    if columns is None:
+        return None, None
+    return SIMPLE_SELECT, columns
+
+
+def _tokenize(stmt):
+    # type: (str) -> Optional[List[_Token]]
+    """
+    :return: (kind, upper cased text) per token without whitespaces and comments, or None if the statement has
+    unterminated quote
+    """
+    tokens = []  # type: List[_Token]
+    for match in _TOKEN_REGEX.finditer(stmt):
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+
+        text = match.group().upper()
+        if kind == 'symbol' and text in ('\'', '"', '`'):
+            return None
+        tokens.append((kind, text))
+
+    while tokens and tokens[-1] == ('symbol', ';'):
+        tokens.pop()
+    return tokens
+
+
+def _get_identifier(tokens, pos):
+    # type: (List[_Token], int) -> Optional[str]
+    if pos >= len(tokens):
+        return None
+
+    kind, text = tokens[pos]
+    if kind == 'word' and text not in _KEYWORDS:
+        return text
+    if kind == 'quoted' and '.' not in text and '""' not in text:
+        return text[1:-1]
+    return None
+
+
+def _get_alias(tokens, pos):
+    # type: (List[_Token], int) -> Tuple[Optional[str], int]
+    """
+    :return: Alias with optional AS at the position or None, and the position after it. Position is -1 if AS is not
+    followed by identifier.
+    """
+    if pos < len(tokens) and tokens[pos] == ('word', 'AS'):
+        alias = _get_identifier(tokens, pos + 1)
+        return alias, pos + 2 if alias else -1
+
+    alias = _get_identifier(tokens, pos)
+    return alias, pos + 1 if alias else pos
+
+
+def _get_select_item(tokens, pos):
+    # type: (List[_Token], int) -> Tuple[Optional[Tuple[str, Optional[str], Optional[str]]], int]
+    """
+    :return: (column name, table qualifier, column alias) of a plain column in SELECT clause or None, and the
+    position after it
+    """
+    if pos < len(tokens) and tokens[pos] == ('symbol', '*'):
+        return ('*', None, None), pos + 1
+
+    name = _get_identifier(tokens, pos)
+    if not name:
+        return None, pos
+    pos += 1
+
+    qualifier = None
+    if pos < len(tokens) and tokens[pos] == ('symbol', '.'):
+        qualifier = name
+        if pos + 1 < len(tokens) and tokens[pos + 1] == ('symbol', '*'):
+            return ('*', qualifier, None), pos + 2
+
+        name = _get_identifier(tokens, pos + 1)
+        if not name:
+            return None, pos
+        pos += 2
+
+    alias, pos = _get_alias(tokens, pos)
+    if pos < 0:
+        return None, pos
+    return (name, qualifier, alias), pos
+
+
+def _get_select_items(tokens, pos):
+    # type: (List[_Token], int) -> Tuple[Optional[List[Tuple[str, Optional[str], Optional[str]]]], int]
+    """
+    :return: Plain columns in SELECT clause or None if any of them is not, and the position after them
+    """
+    if pos < len(tokens) and tokens[pos] in (('word', 'DISTINCT'), ('word', 'ALL')):
+        pos += 1
+
+    select_items = []  # type: List[Tuple[str, Optional[str], Optional[str]]]
+    while True:
+        select_item, pos = _get_select_item(tokens, pos)
+        if not select_item:
+            return None, pos
+        select_items.append(select_item)
+        if pos >= len(tokens) or tokens[pos] != ('symbol', ','):
+            return select_items, pos
+        pos += 1
+
+
+def _get_table(tokens, pos):
+    # type: (List[_Token], int) -> Tuple[Optional[Table], int]
+    """
+    :return: Table with optional alias at the position or None, and the position after it
+    """
+    table_parts = []  # type: List[str]
+    while True:
+        part = _get_identifier(tokens, pos)
+        if not part:
+            return None, pos
+        table_parts.append(part)
+        pos += 1
+        if pos < len(tokens) and tokens[pos] == ('symbol', '.'):
+            pos += 1
+            continue
+        break
+
+    alias, pos = _get_alias(tokens, pos)
+    if pos < 0:
+        return None, pos
+    return Table(table_parts[-1], schema=table_parts[-2] if len(table_parts) > 1 else None, alias=alias), pos
+
+
+def _get_simple_select_columns(tokens):
+    # type: (List[_Token]) -> Optional[List[Column]]
+    """
+    :return: Columns of simple SELECT from a single table, or None if it's not
+    """
+    if tokens[0] != ('word', 'SELECT'):
+        return None
+
+    select_items, pos = _get_select_items(tokens, 1)
+    if not select_items or pos >= len(tokens) or tokens[pos] != ('word', 'FROM'):
+        return None
+
+    table, pos = _get_table(tokens, pos + 1)
+    if not table:
+        return None
+    if pos < len(tokens) and not (tokens[pos][0] == 'word' and tokens[pos][1] in _CLAUSE_KEYWORDS):
+        return None
+
+    columns = []  # type: List[Column]
+    for name, qualifier, alias in select_items:
+        # Parser fails to resolve qualifier other than table name or alias
+        if qualifier and not table.resolve_table(qualifier):
+            return None
+        columns.append(Column(name, table=Table(table.name, schema=table.schema, alias=table.alias), col_alias=alias))
+    return columns
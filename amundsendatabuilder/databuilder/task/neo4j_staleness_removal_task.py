@@ -24,13 +24,34 @@ BATCH_SIZE = "batch_size"
 STALENESS_MAX_PCT = "staleness_max_pct"
 # Staleness max percentage per LABEL/TYPE. Safety net to prevent majority of data being deleted.
 STALENESS_PCT_MAX_DICT = "staleness_max_pct_dict"
+# Create index on published_tag of target nodes so that stale nodes are found via index seek.
+CREATE_PUBLISHED_TAG_INDEX = "create_published_tag_index"
+# Delete with apoc.periodic.iterate, which scans stale data once and deletes in batches. Requires APOC plugin.
+USE_APOC_PERIODIC_ITERATE = "use_apoc_periodic_iterate"
 
 DEFAULT_CONFIG = ConfigFactory.from_dict({BATCH_SIZE: 100,
                                           NEO4J_MAX_CONN_LIFE_TIME_SEC: 50,
                                           STALENESS_MAX_PCT: 5,
                                           TARGET_NODES: [],
                                           TARGET_RELATIONS: [],
-                                          STALENESS_PCT_MAX_DICT: {}})
+                                          STALENESS_PCT_MAX_DICT: {},
+                                          CREATE_PUBLISHED_TAG_INDEX: False,
+                                          USE_APOC_PERIODIC_ITERATE: False})
+
+# Stale nodes are found via index range seeks on published_tag. As index does not have node without
+# published_tag, those are deleted separately.
+STALE_NODE_PREDICATES = ['n.published_tag < $published_tag OR n.published_tag > $published_tag',
+                         'NOT EXISTS(n.published_tag)']
+STALE_RELATION_PREDICATE = 'r.published_tag <> $published_tag OR NOT EXISTS(r.published_tag)'
+
+APOC_PERIODIC_ITERATE_TEMPLATE = """
+CALL apoc.periodic.iterate(
+    '{match_statement}',
+    '{delete_statement}',
+    {{batchSize: $batch_size, iterateList: true, params: {{published_tag: $published_tag}}}})
+YIELD total, failedBatches, errorMessages
+RETURN total as count, failedBatches, errorMessages
+"""
 
 LOGGER = logging.getLogger(__name__)
 
@@ -43,6 +64,10 @@ class Neo4jStalenessRemovalTask(Task):
     Not all resource is being published by Neo4jCsvPublisher and you can only set specific LABEL of the node or TYPE
     of relation to perform this deletion.
 
+    Staleness is validated per target LABEL/TYPE where total count comes from Neo4j count store. Stale nodes are
+    found via index on published_tag, which is created on target nodes if create_published_tag_index is
+    enabled. If use_apoc_periodic_iterate is enabled, stale data is scanned once and deleted by
+    apoc.periodic.iterate in batches, otherwise it's deleted by repeating statement with LIMIT of batch size.
     """
 
     def __init__(self):
@@ -64,6 +89,8 @@ class Neo4jStalenessRemovalTask(Task):
         self.staleness_pct = conf.get_int(STALENESS_MAX_PCT)
         self.staleness_pct_dict = conf.get(STALENESS_PCT_MAX_DICT)
         self.publish_tag = conf.get_string(JOB_PUBLISH_TAG)
+        self.create_published_tag_index = conf.get_bool(CREATE_PUBLISHED_TAG_INDEX)
+        self.use_apoc_periodic_iterate = conf.get_bool(USE_APOC_PERIODIC_ITERATE)
         self._driver = \
             GraphDatabase.driver(conf.get_string(NEO4J_END_POINT_KEY),
                                  max_connection_life_time=conf.get_int(NEO4J_MAX_CONN_LIFE_TIME_SEC),
@@ -79,6 +106,8 @@ class Neo4jStalenessRemovalTask(Task):
         relations.
         :return:
         """
+        if self.create_published_tag_index:
+            self._create_published_tag_index()
         self.validate()
         self._delete_stale_nodes()
         self._delete_stale_relations()
@@ -93,47 +122,101 @@ class Neo4jStalenessRemovalTask(Task):
         self._validate_node_staleness_pct()
         self._validate_relation_staleness_pct()
 
+    def _create_published_tag_index(self):
+        # type: () -> None
+        for label in sorted(self.target_nodes):
+            # No-op if index already exists
+            self._execute_cypher_query(statement='CREATE INDEX ON :{label}(published_tag)'.format(label=label))
+
     def _delete_stale_nodes(self):
-        statement = """
-        MATCH (n:{type})
-        WHERE n.published_tag <> $published_tag
-        OR NOT EXISTS(n.published_tag)
+        # type: () -> None
+        if self.use_apoc_periodic_iterate:
+            match_statement = 'MATCH (n:{{type}}) WHERE {} RETURN n'.format(' OR '.join(STALE_NODE_PREDICATES))
+            self._batch_delete_with_apoc(match_statement=match_statement,
+                                         delete_statement='DETACH DELETE n',
+                                         targets=self.target_nodes)
+            return
+
+        statements = ["""
+        MATCH (n:{{type}})
+        WHERE {predicate}
         WITH n LIMIT $batch_size
         DETACH DELETE (n)
         RETURN COUNT(*) as count;
-        """
-        self._batch_delete(statement=statement, targets=self.target_nodes)
+        """.format(predicate=predicate) for predicate in STALE_NODE_PREDICATES]
+        self._batch_delete(statements=statements, targets=self.target_nodes)
 
     def _delete_stale_relations(self):
+        # type: () -> None
+        # Relation is matched with direction as undirected pattern matches each relation twice
+        if self.use_apoc_periodic_iterate:
+            match_statement = 'MATCH ()-[r:{{type}}]->() WHERE {} RETURN r'.format(STALE_RELATION_PREDICATE)
+            self._batch_delete_with_apoc(match_statement=match_statement,
+                                         delete_statement='DELETE r',
+                                         targets=self.target_relations)
+            return
+
         statement = """
-        MATCH ()-[r:{type}]-()
-        WHERE r.published_tag <> $published_tag
-        OR NOT EXISTS(r.published_tag)
+        MATCH ()-[r:{{type}}]->()
+        WHERE {predicate}
         WITH r LIMIT $batch_size
         DELETE r
         RETURN count(*) as count;
-        """
-        self._batch_delete(statement=statement, targets=self.target_relations)
+        """.format(predicate=STALE_RELATION_PREDICATE)
+        self._batch_delete(statements=[statement], targets=self.target_relations)
 
-    def _batch_delete(self, statement, targets):
+    def _batch_delete(self, statements, targets):
+        # type: (Iterable[str], Iterable[str]) -> None
         """
         Performing huge amount of deletion could degrade Neo4j performance. Therefore, it's taking batch deletion here.
-        :param statement:
+        Each statement is repeated until it deletes nothing.
+        :param statements:
         :param targets:
         :return:
         """
-        for t in targets:
+        for t in sorted(targets):
             LOGGER.info('Deleting stale data of {} with batch size {}'.format(t, self.batch_size))
+            start = time.time()
             total_count = 0
-            while True:
-                result = self._execute_cypher_query(statement=statement.format(type=t),
-                                                    param_dict={'batch_size': self.batch_size,
-                                                                'published_tag': self.publish_tag}).single()
-                count = result['count']
-                total_count = total_count + count
-                if count == 0:
-                    break
-            LOGGER.info('Deleted {} stale data of {}'.format(total_count, t))
+            for statement in statements:
+                while True:
+                    result = self._execute_cypher_query(statement=statement.format(type=t),
+                                                        param_dict={'batch_size': self.batch_size,
+                                                                    'published_tag': self.publish_tag}).single()
+                    count = result['count']
+                    total_count = total_count + count
+                    if count == 0:
+                        break
+            self._log_throughput(t, total_count, time.time() - start)
+
+    def _batch_delete_with_apoc(self, match_statement, delete_statement, targets):
+        # type: (str, str, Iterable[str]) -> None
+        """
+        Deletes stale data with apoc.periodic.iterate, which streams the match statement once and runs delete
+        statement for each batch in separate transaction.
+        :param match_statement:
+        :param delete_statement:
+        :param targets:
+        :return:
+        """
+        for t in sorted(targets):
+            LOGGER.info('Deleting stale data of {} with apoc.periodic.iterate and batch size {}'
+                        .format(t, self.batch_size))
+            start = time.time()
+            statement = APOC_PERIODIC_ITERATE_TEMPLATE.format(match_statement=match_statement.format(type=t),
+                                                              delete_statement=delete_statement)
+            result = self._execute_cypher_query(statement=statement,
+                                                param_dict={'batch_size': self.batch_size,
+                                                            'published_tag': self.publish_tag}).single()
+            if result['failedBatches']:
+                raise Exception('Failed to delete stale data of {} in {} batches: {}'
+                                .format(t, result['failedBatches'], result['errorMessages']))
+            self._log_throughput(t, result['count'], time.time() - start)
+
+    def _log_throughput(self, target, count, elapsed):
+        # type: (str, int, float) -> None
+        LOGGER.info('Deleted {} stale data of {} in {:.2f} seconds ({:.1f} per second)'
+                    .format(count, target, elapsed, count / elapsed if elapsed > 0 else 0.0))
 
     def _validate_staleness_pct(self, total_records, stale_records, types):
         # type: (Iterable[Dict[str, Any]], Iterable[Dict[str, Any]], Iterable[str]) -> None
@@ -159,45 +242,63 @@ class Neo4jStalenessRemovalTask(Task):
 
     def _validate_node_staleness_pct(self):
         # type: () -> None
-
+        """
+        Counts per target label, where total count is from count store and fresh count is from index seek on
+        published_tag. The rest of the nodes are stale.
+        """
         total_nodes_statement = """
-        MATCH (n)
-        WITH DISTINCT labels(n) as node, count(*) as count
-        RETURN head(node) as type, count
+        MATCH (n:{type})
+        RETURN count(n) as count
         """
 
-        stale_nodes_statement = """
-        MATCH (n)
-        WHERE n.published_tag <> $published_tag
-        OR NOT EXISTS(n.published_tag)
-        WITH DISTINCT labels(n) as node, count(*) as count
-        RETURN head(node) as type, count
+        fresh_nodes_statement = """
+        MATCH (n:{type})
+        WHERE n.published_tag = $published_tag
+        RETURN count(n) as count
         """
 
-        total_records = self._execute_cypher_query(statement=total_nodes_statement)
-        stale_records = self._execute_cypher_query(statement=stale_nodes_statement,
-                                                   param_dict={'published_tag': self.publish_tag})
+        total_records = []
+        stale_records = []
+        for label in sorted(self.target_nodes):
+            total_count = self._execute_cypher_query(statement=total_nodes_statement.format(type=label)) \
+                .single()['count']
+            fresh_count = self._execute_cypher_query(statement=fresh_nodes_statement.format(type=label),
+                                                     param_dict={'published_tag': self.publish_tag}) \
+                .single()['count']
+            total_records.append({'type': label, 'count': total_count})
+            stale_records.append({'type': label, 'count': total_count - fresh_count})
+
         self._validate_staleness_pct(total_records=total_records,
                                      stale_records=stale_records,
                                      types=self.target_nodes)
 
     def _validate_relation_staleness_pct(self):
         # type: () -> None
+        """
+        Counts per target type, where total count is from count store.
+        """
         total_relations_statement = """
-        MATCH ()-[r]-()
-        RETURN type(r) as type, count(*) as count;
+        MATCH ()-[r:{type}]->()
+        RETURN count(r) as count
         """
 
         stale_relations_statement = """
-        MATCH ()-[r]-()
-        WHERE r.published_tag <> $published_tag
-        OR NOT EXISTS(r.published_tag)
-        RETURN type(r) as type, count(*) as count
-        """
+        MATCH ()-[r:{{type}}]->()
+        WHERE {predicate}
+        RETURN count(r) as count
+        """.format(predicate=STALE_RELATION_PREDICATE)
+
+        total_records = []
+        stale_records = []
+        for rel_type in sorted(self.target_relations):
+            total_count = self._execute_cypher_query(statement=total_relations_statement.format(type=rel_type)) \
+                .single()['count']
+            stale_count = self._execute_cypher_query(statement=stale_relations_statement.format(type=rel_type),
+                                                     param_dict={'published_tag': self.publish_tag}) \
+                .single()['count']
+            total_records.append({'type': rel_type, 'count': total_count})
+            stale_records.append({'type': rel_type, 'count': stale_count})
 
-        total_records = self._execute_cypher_query(statement=total_relations_statement)
-        stale_records = self._execute_cypher_query(statement=stale_relations_statement,
-                                                   param_dict={'published_tag': self.publish_tag})
         self._validate_staleness_pct(total_records=total_records,
                                      stale_records=stale_records,
                                      types=self.target_relations)
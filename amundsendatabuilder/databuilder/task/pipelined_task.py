@@ -0,0 +1,216 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from pyhocon import ConfigTree  # noqa: F401
+from six.moves.queue import Empty, Full, Queue
+from typing import Any, Callable, List, Optional  # noqa: F401
+
+from databuilder.extractor.base_extractor import Extractor  # noqa: F401
+from databuilder.loader.base_loader import Loader  # noqa: F401
+from databuilder.task.task import DefaultTask
+from databuilder.transformer.base_transformer import Transformer  # noqa: F401
+from databuilder.transformer.base_transformer \
+    import NoopTransformer  # noqa: F401
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Marks the end of the records in the queue
+_END_OF_RECORDS = object()
+# Interval to check whether the pipeline is stopped while waiting on a queue
+_POLL_INTERVAL_SEC = 0.1
+
+
+class _PipelineStopped(Exception):
+    pass
+
+
+class StageMetrics(object):
+    """
+    Throughput metrics of a stage. Busy time is time spent in extractor, transformer, or loader, where wait time
+    is time spent waiting on a queue for the records from upstream stage or for the space in downstream queue.
+    A stage with the most busy time is the bottleneck, and the other stages wait for it.
+    """
+    def __init__(self, name):
+        # type: (str) -> None
+        self.name = name
+        self.count = 0  # type: int
+        self.busy_sec = 0.0  # type: float
+        self.wait_sec = 0.0  # type: float
+
+    def throughput(self):
+        # type: () -> float
+        """
+        :return: Number of records per busy second
+        """
+        return self.count / self.busy_sec if self.busy_sec > 0 else 0.0
+
+    def __repr__(self):
+        # type: () -> str
+        return '{}(count={}, busy_sec={:.2f}, wait_sec={:.2f}, throughput={:.1f}/s)'\
+            .format(self.name, self.count, self.busy_sec, self.wait_sec, self.throughput())
+
+
+class PipelinedTask(DefaultTask):
+    """
+    A task that runs extractor, transformer, and loader in separate threads where stages are connected by bounded
+    queues. Slow extraction (e.g: metastore query), CPU heavy transformation and loader's disk write can overlap
+    each other. A stage blocks when its downstream queue is full, which applies back pressure to the upstream stages.
+
+    Records are passed in order, as each stage has one thread. If any stage fails, the other stages are stopped,
+    extractor, transformer, and loader are closed via Closer, and the failure is propagated.
+
+    As the stages run in threads, overlap is achieved when the stages release GIL, e.g: I/O. A transformer that is
+    CPU bound in Python code (e.g: SQL parsing) only overlaps with I/O of the other stages.
+    """
+
+    # Max number of records in each queue between stages
+    QUEUE_SIZE = 'queue_size'
+
+    def __init__(self,
+                 extractor,
+                 loader,
+                 transformer=NoopTransformer()):
+        # type: (Extractor, Loader, Transformer) -> None
+        super(PipelinedTask, self).__init__(extractor=extractor, loader=loader, transformer=transformer)
+        self._stop_event = threading.Event()
+        self._errors = []  # type: List[Exception]
+        self._threads = []  # type: List[threading.Thread]
+        self.stage_metrics = OrderedDict((name, StageMetrics(name))
+                                         for name in ('extractor', 'transformer', 'loader'))
+
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        super(PipelinedTask, self).init(conf)
+        queue_size = conf.get_int('{}.{}'.format(self.get_scope(), PipelinedTask.QUEUE_SIZE), 1000)
+        self._extracted_queue = Queue(maxsize=queue_size)  # type: Queue
+        self._transformed_queue = Queue(maxsize=queue_size)  # type: Queue
+
+    def run(self):
+        # type: () -> None
+        """
+        Runs extractor and transformer stages in threads and loader stage in current thread.
+        :return:
+        """
+        LOGGER.info('Running a pipelined task')
+        # Closer is LIFO, so stages are stopped before extractor, transformer, and loader are closed
+        self._closer.register(self._stop_stages)
+        try:
+            self._start_stage(self._run_extractor)
+            self._start_stage(self._run_transformer)
+            self._run_stage(self._run_loader)
+            self._raise_error()
+        finally:
+            self._closer.close()
+            LOGGER.info('Pipelined task metrics: {}'.format(list(self.stage_metrics.values())))
+
+    def _start_stage(self, stage):
+        # type: (Callable[[], None]) -> None
+        thread = threading.Thread(target=self._run_stage, args=(stage,))
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _run_stage(self, stage):
+        # type: (Callable[[], None]) -> None
+        try:
+            stage()
+        except _PipelineStopped:
+            pass
+        except Exception as e:
+            LOGGER.exception('Failed on stage {}'.format(stage.__name__))
+            self._errors.append(e)
+            self._stop_event.set()
+
+    def _stop_stages(self):
+        # type: () -> None
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        # type: () -> None
+        if self._errors:
+            raise self._errors[0]
+
+    def _run_extractor(self):
+        # type: () -> None
+        metrics = self.stage_metrics['extractor']
+        while True:
+            start = time.time()
+            record = self.extractor.extract()
+            metrics.busy_sec += time.time() - start
+            if not record:
+                break
+            metrics.count += 1
+            self._put(self._extracted_queue, record, metrics)
+        self._put(self._extracted_queue, _END_OF_RECORDS, metrics)
+
+    def _run_transformer(self):
+        # type: () -> None
+        metrics = self.stage_metrics['transformer']
+        while True:
+            record = self._get(self._extracted_queue, metrics)
+            if record is _END_OF_RECORDS:
+                break
+            start = time.time()
+            record = self.transformer.transform(record)
+            metrics.busy_sec += time.time() - start
+            metrics.count += 1
+            if record:
+                self._put(self._transformed_queue, record, metrics)
+        self._put(self._transformed_queue, _END_OF_RECORDS, metrics)
+
+    def _run_loader(self):
+        # type: () -> None
+        metrics = self.stage_metrics['loader']
+        while True:
+            record = self._get(self._transformed_queue, metrics)
+            if record is _END_OF_RECORDS:
+                break
+            start = time.time()
+            self.loader.load(record)
+            metrics.busy_sec += time.time() - start
+            metrics.count += 1
+            if metrics.count % self._progress_report_frequency == 0:
+                LOGGER.info('Loaded {} records so far. Queue depths: [{}, {}]. Metrics: {}'
+                            .format(metrics.count, self._extracted_queue.qsize(), self._transformed_queue.qsize(),
+                                    list(self.stage_metrics.values())))
+
+    def _put(self, queue, record, metrics):
+        # type: (Queue, Any, StageMetrics) -> None
+        """
+        Puts record into the queue, blocking while the queue is full until the pipeline is stopped.
+        """
+        start = time.time()
+        try:
+            while True:
+                if self._stop_event.is_set():
+                    raise _PipelineStopped()
+                try:
+                    queue.put(record, timeout=_POLL_INTERVAL_SEC)
+                    return
+                except Full:
+                    continue
+        finally:
+            metrics.wait_sec += time.time() - start
+
+    def _get(self, queue, metrics):
+        # type: (Queue, StageMetrics) -> Any
+        """
+        Gets record from the queue, blocking while the queue is empty until the pipeline is stopped.
+        """
+        start = time.time()
+        try:
+            while True:
+                if self._stop_event.is_set():
+                    raise _PipelineStopped()
+                try:
+                    return queue.get(timeout=_POLL_INTERVAL_SEC)
+                except Empty:
+                    continue
+        finally:
+            metrics.wait_sec += time.time() - start
@@ -1,5 +1,6 @@
 import logging
 
+import six
 from pyhocon import ConfigTree  # noqa: F401
 
 from databuilder import Scoped
@@ -19,10 +20,14 @@ class DefaultTask(Task):
     """
     A default task expecting to extract, transform and load.
 
+    If batch_size is set and both extractor and loader implement batch natively (Extractor.extract_batch and
+    Loader.load_batch), records are extracted and loaded in batches of batch_size, which saves per record overhead.
     """
 
     # Determines the frequency of the log on task progress
     PROGRESS_REPORT_FREQUENCY = 'progress_report_frequency'
+    # Number of records per batch when extractor and loader support batch. 0 (default) disables batch.
+    BATCH_SIZE = 'batch_size'
 
     def __init__(self,
                  extractor,
@@ -42,6 +47,7 @@ class DefaultTask(Task):
         # type: (ConfigTree) -> None
         self._progress_report_frequency = \
             conf.get_int('{}.{}'.format(self.get_scope(), DefaultTask.PROGRESS_REPORT_FREQUENCY), 500)
+        self._batch_size = conf.get_int('{}.{}'.format(self.get_scope(), DefaultTask.BATCH_SIZE), 0)
 
         self.extractor.init(Scoped.get_scoped_conf(conf, self.extractor.get_scope()))
         self.transformer.init(Scoped.get_scoped_conf(conf, self.transformer.get_scope()))
@@ -54,6 +60,10 @@ class DefaultTask(Task):
         :return:
         """
         LOGGER.info('Running a task')
+        if self._batch_size > 0 and self._is_batch_supported():
+            self._run_batch()
+            return
+
         try:
             record = self.extractor.extract()
             count = 1
@@ -70,3 +80,41 @@ class DefaultTask(Task):
 
         finally:
             self._closer.close()
+
+    def _is_batch_supported(self):
+        # type: () -> bool
+        """
+        :return: True if both extractor and loader override batch methods
+        """
+        return six.get_unbound_function(type(self.extractor).extract_batch) is not \
+            six.get_unbound_function(Extractor.extract_batch) and \
+            six.get_unbound_function(type(self.loader).load_batch) is not \
+            six.get_unbound_function(Loader.load_batch)
+
+    def _run_batch(self):
+        # type: () -> None
+        """
+        Runs a task in batches
+        :return:
+        """
+        LOGGER.info('Running a task in batches of {}'.format(self._batch_size))
+        is_noop_transformer = isinstance(self.transformer, NoopTransformer)
+        try:
+            count = 0
+            while True:
+                extracted = self.extractor.extract_batch(self._batch_size)
+                records = extracted
+                if not is_noop_transformer:
+                    records = [r for r in (self.transformer.transform(record) for record in extracted) if r]
+                if records:
+                    self.loader.load_batch(records)
+
+                previous_count = count
+                count += len(extracted)
+                if count // self._progress_report_frequency > previous_count // self._progress_report_frequency:
+                    LOGGER.info('Extracted {} records so far'.format(count))
+
+                if len(extracted) < self._batch_size:
+                    break
+        finally:
+            self._closer.close()
@@ -5,17 +5,21 @@ except Exception:
 
 import logging
 import types
+from collections import OrderedDict
 from multiprocessing.pool import Pool, TimeoutError
 
 from pyhocon import ConfigTree  # noqa: F401
-from typing import Any, Optional, List, Iterable  # noqa: F401
+from typing import Any, Dict, Optional, List, Iterable, Tuple  # noqa: F401
 
 from databuilder import Scoped
 from databuilder.extractor.hive_table_metadata_extractor import HiveTableMetadataExtractor
 from databuilder.models.table_column_usage import TableColumnUsage, ColumnReader
+from databuilder.sql_parser.usage.parse_cache import ParseCache
 from databuilder.sql_parser.usage.column import OrTable, Table  # noqa: F401
 from databuilder.sql_parser.usage.presto.column_usage_provider import ColumnUsageProvider
+from databuilder.sql_parser.usage.presto.statement_prefilter import prefilter, NO_SELECT
 from databuilder.transformer.base_transformer import Transformer
+from databuilder.utils.process_pool import OrderedProcessPool
 
 LOGGER = logging.getLogger(__name__)
 
@@ -43,6 +47,17 @@ class SqlToTblColUsageTransformer(Transformer):
 
     Currently, ColumnUsageProvider could hang on certain SQL statement and as a short term solution it will timeout
     processing statement at 10 seconds.
+
+    With num_workers more than 1, statements are parsed in parallel by a pool of worker processes when transformed
+    via transform_batch, where statements are dispatched to workers in chunks of dispatch_chunk_size, and only the
+    worker that times out on a statement is replaced.
+
+    Parsed columns are cached by fingerprint of the statement (literals, whitespaces, comments, and case removed), so
+    that the same query with different literals is parsed once. Up to parse_cache_size results are kept in memory,
+    and with parse_cache_path, results are persisted on disk to be reused across runs.
+
+    Before parsing, statements are classified by a tokenizer, where statements without SELECT (e.g: DDL, SHOW,
+    INSERT ... VALUES) are skipped, and simple SELECTs from a single table are resolved without full parse.
     """
     # Config key
     DATABASE_NAME = 'database'
@@ -51,9 +66,23 @@ class SqlToTblColUsageTransformer(Transformer):
     USER_EMAIL_ATTRIBUTE_NAME = 'user_email_attribute_name'
     COLUMN_EXTRACTION_TIMEOUT_SEC = 'column_extraction_timeout_seconds'
     LOG_ALL_EXTRACTION_FAILURES = 'log_all_extraction_failures'
+    NUM_WORKERS = 'num_workers'
+    DISPATCH_CHUNK_SIZE = 'dispatch_chunk_size'
+    PARSE_CACHE_SIZE = 'parse_cache_size'
+    PARSE_CACHE_PATH = 'parse_cache_path'
+    ENABLE_PREFILTER = 'enable_prefilter'
 
     total_counts = 0
     failure_counts = 0
+    # Number of statements that avoided full parse
+    no_select_counts = 0
+    simple_select_counts = 0
+
+    def __init__(self):
+        # type: () -> None
+        self._parallel_pool = None  # type: Optional[OrderedProcessPool]
+        self._parse_cache = None  # type: Optional[ParseCache]
+        self._enable_prefilter = True
 
     def init(self, conf):
         # type: (ConfigTree) -> None
@@ -63,20 +92,153 @@ class SqlToTblColUsageTransformer(Transformer):
         self._sql_stmt_attr = conf.get_string(SqlToTblColUsageTransformer.SQL_STATEMENT_ATTRIBUTE_NAME)
         self._user_email_attr = conf.get_string(SqlToTblColUsageTransformer.USER_EMAIL_ATTRIBUTE_NAME)
         self._tbl_to_schema_mapping = self._create_schema_by_table_mapping()
-        self._worker_pool = Pool(processes=1)
         self._time_out_sec = conf.get_int(SqlToTblColUsageTransformer.COLUMN_EXTRACTION_TIMEOUT_SEC, 10)
         LOGGER.info('Column extraction timeout: {} seconds'.format(self._time_out_sec))
         self._log_all_extraction_failures = conf.get_bool(SqlToTblColUsageTransformer.LOG_ALL_EXTRACTION_FAILURES,
                                                           False)
 
+        self._num_workers = conf.get_int(SqlToTblColUsageTransformer.NUM_WORKERS, 1)
+        self._dispatch_chunk_size = conf.get_int(SqlToTblColUsageTransformer.DISPATCH_CHUNK_SIZE, 100)
+        if self._num_workers > 1:
+            LOGGER.info('Parsing with {} worker processes'.format(self._num_workers))
+            self._parallel_pool = OrderedProcessPool(ColumnUsageProvider.get_columns,
+                                                     num_workers=self._num_workers,
+                                                     timeout_sec=self._time_out_sec,
+                                                     chunk_size=self._dispatch_chunk_size)
+        else:
+            self._worker_pool = Pool(processes=1)
+
+        self._enable_prefilter = conf.get_bool(SqlToTblColUsageTransformer.ENABLE_PREFILTER, True)
+
+        parse_cache_size = conf.get_int(SqlToTblColUsageTransformer.PARSE_CACHE_SIZE, 10000)
+        parse_cache_path = conf.get_string(SqlToTblColUsageTransformer.PARSE_CACHE_PATH, None)
+        if parse_cache_size > 0 or parse_cache_path:
+            self._parse_cache = ParseCache(max_size=parse_cache_size, path=parse_cache_path)
+
+    def get_batch_size(self):
+        # type: () -> int
+        """
+        :return: Number of records transform_batch should be called with to keep all workers busy
+        """
+        if self._parallel_pool:
+            return self._num_workers * self._dispatch_chunk_size
+        return 1
+
+    def transform_batch(self, records):
+        # type: (List[Any]) -> List[Optional[TableColumnUsage]]
+        """
+        Transforms records, parsing statements in parallel when num_workers is more than 1.
+        :param records:
+        :return: TableColumnUsage or None per record, in the order of records
+        """
+        if not self._parallel_pool:
+            return [self.transform(record) for record in records]
+
+        SqlToTblColUsageTransformer.total_counts += len(records)
+        stmts = [getattr(record, self._sql_stmt_attr) for record in records]
+        results = []  # type: List[Optional[TableColumnUsage]]
+        for record, stmt, (columns, error) in zip(records, stmts, self._get_columns_batch(stmts)):
+            if error:
+                SqlToTblColUsageTransformer.failure_counts += 1
+                if isinstance(error, TimeoutError):
+                    LOGGER.error('Timed out while getting column usage from query: {}'.format(stmt))
+                elif self._log_all_extraction_failures:
+                    LOGGER.error('Failed to get column usage from query: {}\n{}'.format(stmt, error))
+                results.append(None)
+                continue
+
+            results.append(self._to_usage(stmt=stmt, email=getattr(record, self._user_email_attr), columns=columns))
+        return results
+
+    def _prefilter(self, stmt):
+        # type: (str) -> Optional[List[Any]]
+        """
+        :return: Columns if the statement does not need full parse, None otherwise
+        """
+        if not self._enable_prefilter:
+            return None
+
+        kind, columns = prefilter(stmt)
+        if kind == NO_SELECT:
+            SqlToTblColUsageTransformer.no_select_counts += 1
+        elif kind:
+            SqlToTblColUsageTransformer.simple_select_counts += 1
+        return columns
+
+    def _get_columns_batch(self, stmts):
+        # type: (List[str]) -> List[Tuple[Any, Optional[Exception]]]
+        """
+        Gets columns of the statements, where only the statements that are not resolved by prefilter are parsed.
+        :param stmts:
+        :return: (columns, None) or (None, error) per statement
+        """
+        results = [None] * len(stmts)  # type: List[Any]
+        to_parse = []  # type: List[int]
+        for i, stmt in enumerate(stmts):
+            columns = self._prefilter(stmt)
+            if columns is None:
+                to_parse.append(i)
+            else:
+                results[i] = (columns, None)
+
+        for i, result in zip(to_parse, self._parse_batch([stmts[i] for i in to_parse])):
+            results[i] = result
+        return results
+
+    def _parse_batch(self, stmts):
+        # type: (List[str]) -> List[Tuple[Any, Optional[Exception]]]
+        """
+        Parses statements via worker pool, where the statements in the parse cache and the statements with the same
+        fingerprint in the batch are parsed only once.
+        :param stmts:
+        :return: (columns, None) or (None, error) per statement
+        """
+        if not stmts:
+            return []
+
+        if not self._parse_cache:
+            return self._parallel_pool.map(stmts)
+
+        keys = [ParseCache.get_key(stmt) for stmt in stmts]
+        results = {}  # type: Dict[str, Tuple[Any, Optional[Exception]]]
+        missed = OrderedDict()  # type: OrderedDict
+        for key, stmt in zip(keys, stmts):
+            if key in results or key in missed:
+                continue
+            columns = self._parse_cache.get(key)
+            if columns is None:
+                missed[key] = stmt
+            else:
+                results[key] = (columns, None)
+
+        for key, (columns, error) in zip(missed, self._parallel_pool.map(list(missed.values()))):
+            results[key] = (columns, error)
+            if not error:
+                self._parse_cache.put(key, columns)
+
+        return [results[key] for key in keys]
+
     def transform(self, record):
         # type: (Any) -> Optional[TableColumnUsage]
+        if self._parallel_pool:
+            return self.transform_batch([record])[0]
+
         SqlToTblColUsageTransformer.total_counts += 1
 
         stmt = getattr(record, self._sql_stmt_attr)
         email = getattr(record, self._user_email_attr)
 
-        result = []  # type: List[ColumnReader]
+        columns = self._prefilter(stmt)
+        if columns is not None:
+            return self._to_usage(stmt=stmt, email=email, columns=columns)
+
+        cache_key = None  # type: Optional[str]
+        if self._parse_cache:
+            cache_key = ParseCache.get_key(stmt)
+            columns = self._parse_cache.get(cache_key)
+            if columns is not None:
+                return self._to_usage(stmt=stmt, email=email, columns=columns)
+
         try:
             columns = self._worker_pool.apply_async(ColumnUsageProvider.get_columns, (stmt,)).get(self._time_out_sec)
             # LOGGER.info('Statement: {} ---> columns: {}'.format(stmt, columns))
@@ -94,6 +256,14 @@ class SqlToTblColUsageTransformer(Transformer):
                 LOGGER.exception('Failed to get column usage from query: {}'.format(stmt))
             return None
 
+        if self._parse_cache:
+            self._parse_cache.put(cache_key, columns)
+        return self._to_usage(stmt=stmt, email=email, columns=columns)
+
+    def _to_usage(self, stmt, email, columns):
+        # type: (str, str, Iterable[Any]) -> Optional[TableColumnUsage]
+        result = []  # type: List[ColumnReader]
+
         # Dedupe is needed to make it table level. TODO: Remove this once we are at column level
         dedupe_tuples = set()  # type: set
         for col in columns:
@@ -210,6 +380,15 @@ class SqlToTblColUsageTransformer(Transformer):
 
     def close(self):
         # type: () -> None
+        if self._parallel_pool:
+            LOGGER.info('Restarted {} worker processes'.format(self._parallel_pool.restart_count))
+            self._parallel_pool.close()
+        if self._parse_cache:
+            self._parse_cache.close()
         LOGGER.info('Column usage stats: failure: {fail_count} out of total {total_count}'
                     .format(fail_count=SqlToTblColUsageTransformer.failure_counts,
                             total_count=SqlToTblColUsageTransformer.total_counts))
+        no_select_counts = SqlToTblColUsageTransformer.no_select_counts
+        simple_select_counts = SqlToTblColUsageTransformer.simple_select_counts
+        LOGGER.info('Avoided full parse of {} statements: {} without SELECT, {} simple SELECT'
+                    .format(no_select_counts + simple_select_counts, no_select_counts, simple_select_counts))
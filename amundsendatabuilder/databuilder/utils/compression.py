@@ -0,0 +1,80 @@
+import gzip
+import io
+
+import six
+from typing import Any, Optional  # noqa: F401
+
+# Supported compressions
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+_EXTENSIONS = {GZIP: '.gz', ZSTD: '.zst'}
+
+
+def get_extension(compression):
+    # type: (Optional[str]) -> str
+    """
+    Provides file name extension of the compression. e.g: '.gz' for gzip
+    :param compression: gzip, zstd, or empty for no compression
+    :return:
+    """
+    if not compression:
+        return ''
+
+    if compression not in _EXTENSIONS:
+        raise ValueError('Unsupported compression {}. Supported: {}'.format(compression, sorted(_EXTENSIONS)))
+    return _EXTENSIONS[compression]
+
+
+def get_compression(path):
+    # type: (str) -> Optional[str]
+    """
+    Provides compression of the file based on its extension, or None if not compressed.
+    :param path:
+    :return:
+    """
+    for compression, extension in _EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def open_file(path, mode='r', buffer_size=-1):
+    # type: (str, str, int) -> Any
+    """
+    Opens text file for read or write. If the file name ends with compression extension (.gz, .zst), it is
+    compressed on write and decompressed on read transparently.
+    zstd requires zstandard package (pip install amundsen-databuilder[zstd]).
+
+    :param path:
+    :param mode: 'r' or 'w'. 'rb' opens it as binary (decompressed) file.
+    :param buffer_size: Size of write buffer in bytes. Zero or negative number for the default size.
+    :return: File object
+    """
+    compression = get_compression(path)
+    binary_mode = '{}b'.format(mode[0])
+    if not compression:
+        if six.PY2:
+            return open(path, mode, buffer_size if buffer_size > 0 else -1)
+        # Write buffer is added below the same way as compressed file, as text mode open() rejects buffer_size 0
+        # and line buffers with 1
+        raw = open(path, binary_mode, -1 if mode[0] == 'r' else 0)
+    elif compression == GZIP:
+        raw = gzip.open(path, binary_mode)
+    else:
+        import zstandard
+        raw = zstandard.open(path, binary_mode)
+        if mode[0] == 'r':
+            # zstd decompression reader does not support readline
+            raw = io.BufferedReader(raw)
+
+    if six.PY2:
+        # csv module in Python 2 reads and writes bytes
+        return raw
+
+    if mode[0] == 'w':
+        # Compressor is called per buffer flush rather than per row
+        raw = io.BufferedWriter(raw, buffer_size if buffer_size > 0 else io.DEFAULT_BUFFER_SIZE)
+    if 'b' in mode:
+        return raw
+    return io.TextIOWrapper(raw)
@@ -0,0 +1,229 @@
+import abc
+import importlib
+import logging
+import math
+from collections import OrderedDict
+
+import six
+from pyhocon import ConfigTree, ConfigFactory  # noqa: F401
+from typing import Any, Dict  # noqa: F401
+
+from databuilder import Scoped
+
+LOGGER = logging.getLogger(__name__)
+
+# Config scope and keys under job config
+DEDUP_CACHE_SCOPE = 'job.dedup_cache'
+CLASS_NAME = 'class_name'
+DEFAULT_CLASS_NAME = 'databuilder.utils.dedup_cache.LruDedupCache'
+
+
+@six.add_metaclass(abc.ABCMeta)
+class DedupCache(Scoped):
+    """
+    A cache of the rows that are already serialized by Neo4jCsvSerializable models in the job, so that a node or
+    a relation that is shared by many records (e.g: database, cluster, schema, tag) is written once.
+
+    Rows are identified by a 128 bit digest of the row, where the chance that two different rows collide is
+    negligible. The cache only needs to remember the digest, and it's up to the implementation how much it
+    remembers: a cache that forgets a row lets its duplicate be written again, which is harmless as publisher merges
+    it, where a cache with false positive drops a row that was never written.
+    """
+    def __init__(self):
+        # type: () -> None
+        self.added_count = 0
+        self.duplicate_count = 0
+
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        pass
+
+    def add(self, row_hash):
+        # type: (int) -> bool
+        """
+        Adds digest of a row into the cache.
+        :param row_hash:
+        :return: True if the row is new, False if the row is a duplicate and can be skipped
+        """
+        if self._add(row_hash):
+            self.added_count += 1
+            return True
+
+        self.duplicate_count += 1
+        return False
+
+    @abc.abstractmethod
+    def _add(self, row_hash):
+        # type: (int) -> bool
+        pass
+
+    def get_scope(self):
+        # type: () -> str
+        return DEDUP_CACHE_SCOPE
+
+
+class NoopDedupCache(DedupCache):
+    """
+    A cache that does not dedup any row.
+    """
+    def _add(self, row_hash):
+        # type: (int) -> bool
+        return True
+
+
+class KeyHashSetDedupCache(DedupCache):
+    """
+    A cache that remembers digest of every row in a set. Digest is much smaller than the row itself, but memory
+    grows with the number of distinct rows in the job, so this fits jobs of bounded size.
+    """
+    def __init__(self):
+        # type: () -> None
+        super(KeyHashSetDedupCache, self).__init__()
+        self._hashes = set()  # type: set
+
+    def _add(self, row_hash):
+        # type: (int) -> bool
+        if row_hash in self._hashes:
+            return False
+
+        self._hashes.add(row_hash)
+        return True
+
+
+class LruDedupCache(DedupCache):
+    """
+    A cache that remembers digest of most recently seen rows up to max_size. Memory is bounded (about 15MB for the
+    default max_size), and a row that is evicted can be written again. Rows shared by many records (e.g: database,
+    cluster, schema, tag) keep being seen, so they stay in the cache. This is the default cache of the job.
+    """
+    # Config keys
+    MAX_SIZE = 'max_size'
+
+    DEFAULT_CONFIG = ConfigFactory.from_dict({MAX_SIZE: 100000})
+
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        conf = conf.with_fallback(LruDedupCache.DEFAULT_CONFIG)
+        self._max_size = conf.get_int(LruDedupCache.MAX_SIZE)
+        self._hashes = OrderedDict()  # type: OrderedDict
+
+    def _add(self, row_hash):
+        # type: (int) -> bool
+        if row_hash in self._hashes:
+            # Moves to the end as most recently used
+            del self._hashes[row_hash]
+            self._hashes[row_hash] = True
+            return False
+
+        self._hashes[row_hash] = True
+        if len(self._hashes) > self._max_size:
+            self._hashes.popitem(last=False)
+        return True
+
+
+class BloomFilterDedupCache(DedupCache):
+    """
+    A cache backed by Bloom filter sized for capacity rows with given false positive rate. Memory is fixed, e.g:
+    about 1.8MB for a million rows with 0.1% false positive rate. Note that false positive makes the row skipped
+    even though it's never written, so this should be used only where a small loss of rows is acceptable.
+    """
+    # Config keys
+    CAPACITY = 'capacity'
+    FALSE_POSITIVE_RATE = 'false_positive_rate'
+
+    DEFAULT_CONFIG = ConfigFactory.from_dict({CAPACITY: 10000000,
+                                              FALSE_POSITIVE_RATE: 0.001})
+
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        conf = conf.with_fallback(BloomFilterDedupCache.DEFAULT_CONFIG)
+        capacity = conf.get_int(BloomFilterDedupCache.CAPACITY)
+        false_positive_rate = conf.get_float(BloomFilterDedupCache.FALSE_POSITIVE_RATE)
+        if not 0 < false_positive_rate < 1:
+            raise ValueError('{} should be between 0 and 1: {}'.format(BloomFilterDedupCache.FALSE_POSITIVE_RATE,
+                                                                       false_positive_rate))
+
+        self._num_bits = max(8, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self._num_hashes = max(1, int(round(self._num_bits / float(capacity) * math.log(2))))
+        self._bits = bytearray((self._num_bits + 7) // 8)
+        LOGGER.info('Bloom filter with {} bytes and {} hashes'.format(len(self._bits), self._num_hashes))
+
+    def _add(self, row_hash):
+        # type: (int) -> bool
+        # Double hashing with lower and upper 32 bits of the row digest
+        row_hash &= 0xFFFFFFFFFFFFFFFF
+        hash1 = row_hash & 0xFFFFFFFF
+        hash2 = (row_hash >> 32) | 1
+        is_new = False
+        for i in range(self._num_hashes):
+            bit = (hash1 + i * hash2) % self._num_bits
+            index, mask = bit >> 3, 1 << (bit & 7)
+            if not self._bits[index] & mask:
+                self._bits[index] |= mask
+                is_new = True
+        return is_new
+
+
+# Cache used by Neo4jCsvSerializable, while no job has installed one. It does not dedup rows, and shared rows are
+# deduped by is_new_shared_row instead.
+_FALLBACK_DEDUP_CACHE = NoopDedupCache()
+_dedup_cache = _FALLBACK_DEDUP_CACHE  # type: DedupCache
+# Keys of the rows shared by many records, serialized outside of a job in this process
+_shared_row_keys = set()  # type: set
+
+
+def get_dedup_cache():
+    # type: () -> DedupCache
+    return _dedup_cache
+
+
+def is_new_shared_row(row_key):
+    # type: (Any) -> bool
+    """
+    Checks whether a row shared by many records (e.g: database, cluster, schema) is not serialized yet. Within a job,
+    rows are deduped by the job's cache, so it's always new here. Outside of a job, shared rows are remembered for the
+    life of the process, so that they are written once as models did before the job scoped cache.
+    :param row_key: Hashable key of the row, e.g: NodeTuple or RelTuple of the model
+    :return:
+    """
+    if _dedup_cache is not _FALLBACK_DEDUP_CACHE:
+        return True
+
+    if row_key in _shared_row_keys:
+        return False
+
+    _shared_row_keys.add(row_key)
+    return True
+
+
+def set_dedup_cache(dedup_cache):
+    # type: (DedupCache) -> None
+    global _dedup_cache
+    _dedup_cache = dedup_cache
+
+
+def reset_dedup_cache():
+    # type: () -> None
+    """
+    Logs statistics of the current cache and falls back to dedup of shared rows only, which starts over.
+    """
+    LOGGER.info('Dedup cache {} added {} rows, and skipped {} duplicate rows'
+                .format(type(_dedup_cache).__name__, _dedup_cache.added_count, _dedup_cache.duplicate_count))
+    set_dedup_cache(_FALLBACK_DEDUP_CACHE)
+    _shared_row_keys.clear()
+
+
+def create_dedup_cache(conf):
+    # type: (ConfigTree) -> DedupCache
+    """
+    Creates dedup cache of the class configured in job.dedup_cache.class_name
+    (default: databuilder.utils.dedup_cache.LruDedupCache), initialized with job.dedup_cache config.
+    :param conf: Job config
+    :return:
+    """
+    scoped_conf = Scoped.get_scoped_conf(conf, DEDUP_CACHE_SCOPE)
+    class_name = scoped_conf.get_string(CLASS_NAME, DEFAULT_CLASS_NAME)
+    module_name, class_name = class_name.rsplit('.', 1)
+    dedup_cache = getattr(importlib.import_module(module_name), class_name)()
+    dedup_cache.init(scoped_conf)
+    return dedup_cache
@@ -0,0 +1,213 @@
+import logging
+import time
+import traceback
+from collections import deque
+from multiprocessing import Pipe, Process, TimeoutError
+
+from typing import Any, Callable, Deque, List, Optional, Tuple  # noqa: F401
+
+try:
+    from multiprocessing.connection import wait as _wait_connections
+except ImportError:
+    # Python 2 does not have it, where connections are polled instead
+    _wait_connections = None
+
+LOGGER = logging.getLogger(__name__)
+
+# Interval to poll workers in seconds, where waiting on multiple connections is not available
+_POLL_INTERVAL_SEC = 0.01
+
+
+class WorkerError(Exception):
+    """
+    An exception raised by the function in worker process, with the traceback from the worker.
+    """
+    pass
+
+
+def _run_worker(func, conn):
+    # type: (Callable, Any) -> None
+    """
+    Worker process main. Receives chunks of (index, item) and sends back (index, result, error) per item, so that
+    the pool knows which item the worker is on.
+    """
+    while True:
+        chunk = conn.recv()
+        if chunk is None:
+            return
+
+        for index, item in chunk:
+            try:
+                conn.send((index, func(item), None))
+            except Exception:
+                conn.send((index, None, traceback.format_exc()))
+
+
+class _Worker(object):
+    """
+    A worker process with a dedicated pipe, so that it can be terminated without affecting other workers.
+    """
+    __slots__ = ('_func', 'process', 'conn', 'pending', 'started_at')
+
+    def __init__(self, func):
+        # type: (Callable) -> None
+        self._func = func
+        self.pending = deque()  # type: Deque[Tuple[int, Any]]
+        self.started_at = 0.0
+        self._start()
+
+    def _start(self):
+        # type: () -> None
+        self.conn, child_conn = Pipe()
+        self.process = Process(target=_run_worker, args=(self._func, child_conn))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def send(self, chunk):
+        # type: (List[Tuple[int, Any]]) -> None
+        self.pending.extend(chunk)
+        self.started_at = time.time()
+        self.conn.send(chunk)
+
+    def restart(self):
+        # type: () -> List[Tuple[int, Any]]
+        """
+        Terminates the worker and starts a new one.
+        :return: Items that were sent to the terminated worker and not processed
+        """
+        self.terminate()
+        unprocessed = list(self.pending)
+        self.pending.clear()
+        self._start()
+        return unprocessed
+
+    def terminate(self):
+        # type: () -> None
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        # type: () -> None
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+class OrderedProcessPool(object):
+    """
+    A pool of worker processes that applies a function to items, and provides results in the order of items.
+
+    Items are dispatched to workers in chunks, so that workers don't wait for the round trip of every item. Unlike
+    multiprocessing.Pool, the timeout applies to each item, and only the worker that is hung on the item is
+    terminated and replaced, where rest of its chunk is dispatched to the new worker.
+    """
+    def __init__(self,
+                 func,  # type: Callable
+                 num_workers,  # type: int
+                 timeout_sec,  # type: float
+                 chunk_size=100  # type: int
+                 ):
+        # type: (...) -> None
+        """
+        :param func: Function applied to each item. It should be picklable (e.g: module level function).
+        :param num_workers: Number of worker processes
+        :param timeout_sec: Timeout of applying the function to an item
+        :param chunk_size: Number of items dispatched to a worker at once
+        """
+        if num_workers < 1:
+            raise ValueError('Number of workers should be positive: {}'.format(num_workers))
+        if chunk_size < 1:
+            raise ValueError('Chunk size should be positive: {}'.format(chunk_size))
+
+        self._timeout_sec = timeout_sec
+        self._chunk_size = chunk_size
+        self._workers = [_Worker(func) for _ in range(num_workers)]
+        self.restart_count = 0
+
+    def map(self, items):
+        # type: (List[Any]) -> List[Tuple[Any, Optional[Exception]]]
+        """
+        Applies the function to the items.
+        :param items:
+        :return: (result, None) or (None, error) per item in the order of items. Error is
+        multiprocessing.TimeoutError if the item timed out, or WorkerError if the function raised.
+        """
+        results = [None] * len(items)  # type: List[Any]
+        chunks = deque(list(enumerate(items[i:i + self._chunk_size], i))
+                       for i in range(0, len(items), self._chunk_size))
+        remaining = len(items)
+
+        while remaining:
+            for worker in self._workers:
+                if not worker.pending and chunks:
+                    worker.send(chunks.popleft())
+
+            busy_workers = [worker for worker in self._workers if worker.pending]
+            self._wait(busy_workers)
+
+            for worker in busy_workers:
+                remaining -= self._receive(worker, results)
+                if worker.pending and time.time() - worker.started_at > self._timeout_sec:
+                    remaining -= self._recycle(worker, results)
+
+        return results
+
+    def _wait(self, workers):
+        # type: (List[_Worker]) -> None
+        """
+        Waits until any of the workers sends result, or the earliest per item timeout.
+        """
+        timeout = max(0.0, min(worker.started_at for worker in workers) + self._timeout_sec - time.time())
+        if _wait_connections:
+            _wait_connections([worker.conn for worker in workers], timeout)
+        elif not any(worker.conn.poll() for worker in workers):
+            time.sleep(min(timeout, _POLL_INTERVAL_SEC))
+
+    def _receive(self, worker, results):
+        # type: (_Worker, List[Any]) -> int
+        """
+        Receives available results from the worker.
+        :return: Number of items received
+        """
+        count = 0
+        try:
+            while worker.pending and worker.conn.poll():
+                index, result, error = worker.conn.recv()
+                worker.pending.popleft()
+                worker.started_at = time.time()
+                results[index] = (result, WorkerError(error) if error else None)
+                count += 1
+        except EOFError:
+            # Worker died (e.g: killed by OOM killer). Blames the item it was on.
+            LOGGER.warning('Worker process exited with {}'.format(worker.process.exitcode))
+            count += self._recycle(worker, results, WorkerError('Worker process exited'))
+        return count
+
+    def _recycle(self, worker, results, error=None):
+        # type: (_Worker, List[Any], Optional[Exception]) -> int
+        """
+        Fails the item the worker is on, replaces the worker, and dispatches rest of its items to the new worker.
+        :return: Number of items failed
+        """
+        index, item = worker.pending[0]
+        LOGGER.warning('Restarting worker process that failed on item {}'.format(index))
+        unprocessed = worker.restart()
+        self.restart_count += 1
+
+        results[index] = (None, error or TimeoutError('Timed out after {} seconds'.format(self._timeout_sec)))
+        if len(unprocessed) > 1:
+            worker.send(unprocessed[1:])
+        return 1
+
+    def close(self):
+        # type: () -> None
+        for worker in self._workers:
+            worker.close()
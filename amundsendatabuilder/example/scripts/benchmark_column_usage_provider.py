@@ -0,0 +1,73 @@
+"""
+Benchmark of ColumnUsageProvider parse time, with LL prediction mode only and with SLL first, over a corpus of
+Presto queries in tests/unit/resources/presto_queries/queries.sql.
+
+Each mode runs in a fresh process, as ANTLR caches prediction (DFA) per process. The first pass over the corpus
+(cold cache) and the following passes (warm cache) are reported separately.
+
+Usage: python example/scripts/benchmark_column_usage_provider.py [num_passes]
+"""
+import os
+import re
+import sys
+import timeit
+from multiprocessing import Pool
+
+from databuilder.sql_parser.usage.presto.column_usage_provider import ColumnUsageProvider
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'tests', 'unit', 'resources', 'presto_queries',
+                           'queries.sql')
+
+num_passes = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+
+def load_corpus():
+    # type: () -> list
+    with open(CORPUS_PATH) as f:
+        lines = [line for line in f if not line.startswith('--')]
+    return [stmt.strip() for stmt in re.split(r';\s*$', ''.join(lines), flags=re.MULTILINE) if stmt.strip()]
+
+
+def run(sll_first):
+    # type: (bool) -> tuple
+    """
+    :return: Parse times of cold pass, and parse times of warm passes
+    """
+    corpus = load_corpus()
+    passes = []
+    for _ in range(num_passes):
+        times = []
+        for stmt in corpus:
+            start = timeit.default_timer()
+            try:
+                ColumnUsageProvider.get_columns(stmt, sll_first=sll_first)
+            except Exception:
+                # Statement is parsed, while the listener can fail to resolve columns of it
+                pass
+            times.append(timeit.default_timer() - start)
+        passes.append(times)
+    return passes[0], [t for times in passes[1:] for t in times]
+
+
+def percentile(values, p):
+    # type: (list, float) -> float
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def report(name, times):
+    # type: (str, list) -> None
+    print('{:>22}: p50 {:7.1f} ms, p90 {:7.1f} ms, p99 {:7.1f} ms, max {:7.1f} ms, total {:7.2f} sec'
+          .format(name, percentile(times, 50) * 1000, percentile(times, 90) * 1000, percentile(times, 99) * 1000,
+                  max(times) * 1000, sum(times)))
+
+
+if __name__ == '__main__':
+    print('{} statements, {} passes'.format(len(load_corpus()), num_passes))
+    for sll_first, name in ((False, 'LL'), (True, 'SLL first')):
+        pool = Pool(processes=1)
+        cold, warm = pool.apply(run, (sll_first,))
+        pool.close()
+        report('{} (cold)'.format(name), cold)
+        if warm:
+            report('{} (warm)'.format(name), warm)
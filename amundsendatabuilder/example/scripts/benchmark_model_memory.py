@@ -0,0 +1,48 @@
+"""
+Reports memory used per million model records, e.g. as held in memory by aggregate extractors.
+
+Usage: python example/scripts/benchmark_model_memory.py [num_records]
+"""
+import sys
+import tracemalloc
+
+from databuilder.models.table_column_usage import ColumnReader, TableColumnUsage
+from databuilder.models.table_elasticsearch_document import TableESDocument
+from databuilder.models.table_metadata import ColumnMetadata, TableMetadata
+from databuilder.models.user import User
+from databuilder.models.watermark import Watermark
+
+num_records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+MODELS = [
+    ('ColumnReader', lambda i: ColumnReader('hive', 'gold', 'test_schema', 'test_table{}'.format(i), '*',
+                                            'user{}@example.com'.format(i))),
+    ('TableColumnUsage', lambda i: TableColumnUsage(col_readers=[
+        ColumnReader('hive', 'gold', 'test_schema', 'test_table{}'.format(i), '*', 'user{}@example.com'.format(i))])),
+    ('ColumnMetadata', lambda i: ColumnMetadata('col{}'.format(i), 'description', 'varchar', i)),
+    ('TableMetadata', lambda i: TableMetadata('hive', 'gold', 'test_schema', 'test_table{}'.format(i),
+                                              'description')),
+    ('User', lambda i: User(email='user{}@example.com'.format(i))),
+    ('Watermark', lambda i: Watermark('2019-01-01', 'hive', 'test_schema', 'test_table{}'.format(i),
+                                      'ds=2019-01-01')),
+    ('TableESDocument', lambda i: TableESDocument('hive', 'gold', 'test_schema', 'test_table{}'.format(i),
+                                                  'key{}'.format(i), 'description', None, [], [], 0, 0, [])),
+]
+
+
+def measure(create):
+    # type: (...) -> int
+    # Includes the strings held by the records
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    records = [create(i) for i in range(num_records)]
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del records
+    return used
+
+
+if __name__ == '__main__':
+    for name, create in MODELS:
+        used = measure(create)
+        print('{:>18}: {:8.1f} MB per million records'.format(name, used * 1000000.0 / num_records / 1024 / 1024))
@@ -0,0 +1,52 @@
+"""
+Micro-benchmark of Neo4jCsvSerializable row validation modes, serializing TableMetadata with 1,000 columns.
+
+Usage: python example/scripts/benchmark_neo4j_csv_serde.py [num_tables] [num_columns]
+"""
+import sys
+import timeit
+
+from databuilder.models.neo4j_csv_serde import VALIDATION_MODE_CACHED, VALIDATION_MODE_STRICT, \
+    VALIDATION_MODE_TRUSTED, reset_validation, set_validation_mode
+from databuilder.models.table_metadata import ColumnMetadata, TableMetadata
+
+num_tables = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+num_columns = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+
+def create_tables():
+    # type: () -> list
+    return [TableMetadata('hive', 'gold', 'test_schema', 'test_table{}'.format(i), 'test table description',
+                          [ColumnMetadata('col{}'.format(j), 'column description', 'varchar', j, ['tag'])
+                           for j in range(num_columns)])
+            for i in range(num_tables)]
+
+
+def serialize(tables):
+    # type: (list) -> int
+    count = 0
+    for table in tables:
+        while table.next_node():
+            count += 1
+        while table.next_relation():
+            count += 1
+    return count
+
+
+def run(mode):
+    # type: (str) -> float
+    reset_validation()
+    set_validation_mode(mode)
+    tables = create_tables()
+    start = timeit.default_timer()
+    count = serialize(tables)
+    elapsed = timeit.default_timer() - start
+    print('{:>8}: {} rows in {:.3f} sec ({:.0f} rows/sec)'.format(mode, count, elapsed, count / elapsed))
+    return elapsed
+
+
+if __name__ == '__main__':
+    strict = run(VALIDATION_MODE_STRICT)
+    for mode in (VALIDATION_MODE_CACHED, VALIDATION_MODE_TRUSTED):
+        print('{:>8}: {:.2f}x faster than strict'.format(mode, strict / run(mode)))
+    reset_validation()
@@ -31,7 +31,10 @@ bigquery = [
     'google-auth>=1.0.0, <2.0.0dev'
 ]
 
-all_deps = requirements + kafka + cassandra + glue + snowflake + athena + bigquery
+# Zstandard compression of CSV files written by FsNeo4jCSVLoader
+zstd = ['zstandard>=0.15.0']
+
+all_deps = requirements + kafka + cassandra + glue + snowflake + athena + bigquery + zstd
 
 setup(
     name='amundsen-databuilder',
@@ -51,6 +54,7 @@ setup(
         'glue': glue,
         'snowflake': snowflake,
         'athena': athena,
-        'bigquery': bigquery
+        'bigquery': bigquery,
+        'zstd': zstd
     },
 )
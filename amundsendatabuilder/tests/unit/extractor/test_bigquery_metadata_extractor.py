@@ -1,8 +1,13 @@
+import json
 import logging
+import socket
+import time
 import unittest
 
+from googleapiclient.errors import HttpError
 from mock import patch, Mock
-from pyhocon import ConfigFactory
+from pyhocon import ConfigFactory, ConfigTree  # noqa: F401
+from typing import List  # noqa: F401
 
 from databuilder import Scoped
 from databuilder.extractor.bigquery_metadata_extractor import BigQueryMetadataExtractor
@@ -266,3 +271,189 @@ class TestBigQueryMetadataExtractor(unittest.TestCase):
 
         self.assertEquals(count, 1)
         self.assertEquals(table_name, 'date_range_')
+
+
+class MockConcurrentBigQueryClient():
+    """
+    Lists the tables per dataset, and gets the table by its id, where tables listed earlier take longer to get so
+    that they complete out of order with threads.
+    """
+    def __init__(self, dataset_ids, num_tables):
+        self.table_ids = ['table{}'.format(i) for i in range(num_tables)]
+        self.datasets_method = Mock()
+        self.datasets_method.list.return_value.execute.return_value = {'datasets': [
+            {'datasetReference': {'datasetId': dataset_id, 'projectId': 'your-project-here'}}
+            for dataset_id in dataset_ids]}
+        self.tables_method = Mock()
+        self.tables_method.list.side_effect = self._list_tables
+        self.tables_method.get.side_effect = self._get_table
+        self.http_ids = set()
+
+    def _list_tables(self, projectId, datasetId, **kwargs):
+        request = Mock()
+        request.execute.return_value = {'tables': [
+            {'tableReference': {'projectId': projectId, 'datasetId': datasetId, 'tableId': table_id}}
+            for table_id in self.table_ids]}
+        return request
+
+    def _get_table(self, projectId, datasetId, tableId):
+        def execute(http=None, num_retries=0):
+            self.http_ids.add(id(http))
+            time.sleep(0.01 * (len(self.table_ids) - self.table_ids.index(tableId)))
+            return {'type': 'TABLE', 'description': '{}.{}'.format(datasetId, tableId),
+                    'schema': {'fields': [{'name': 'col', 'type': 'STRING'}]}}
+
+        request = Mock()
+        request.execute.side_effect = execute
+        return request
+
+    def datasets(self):
+        return self.datasets_method
+
+    def tables(self):
+        return self.tables_method
+
+
+@patch('google.auth.default', return_value=(Mock(), None))
+@patch('databuilder.extractor.base_bigquery_extractor.build')
+class TestBigQueryMetadataExtractorConcurrent(unittest.TestCase):
+    def _get_conf(self, **kwargs):
+        # type: (...) -> ConfigTree
+        config_dict = {'extractor.bigquery_table_metadata.{}'.format(BigQueryMetadataExtractor.PROJECT_ID_KEY):
+                       'your-project-here'}
+        for key, value in kwargs.items():
+            config_dict['extractor.bigquery_table_metadata.{}'.format(key)] = value
+        return ConfigFactory.from_dict(config_dict)
+
+    def _extract_all(self, conf):
+        # type: (ConfigTree) -> List[TableMetadata]
+        extractor = BigQueryMetadataExtractor()
+        extractor.init(Scoped.get_scoped_conf(conf=conf, scope=extractor.get_scope()))
+        results = []
+        result = extractor.extract()
+        while result:
+            results.append(result)
+            result = extractor.extract()
+        extractor.close()
+        return results
+
+    def test_tables_in_listed_order(self, mock_build, mock_default):
+        client = MockConcurrentBigQueryClient(['ds0', 'ds1', 'ds2'], 6)
+        mock_build.return_value = client
+
+        results = self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.NUM_THREADS_KEY: 4}))
+
+        self.assertEqual([result.description for result in results],
+                         ['ds{}.table{}'.format(i, j) for i in range(3) for j in range(6)])
+        self.assertEqual([col.name for col in results[0].columns], ['col'])
+        # Each thread sends requests with its own HTTP client
+        self.assertNotIn(id(None), client.http_ids)
+        self.assertGreater(len(client.http_ids), 1)
+        self.assertLessEqual(len(client.http_ids), 4)
+
+    def test_sequential_by_default(self, mock_build, mock_default):
+        client = MockConcurrentBigQueryClient(['ds0', 'ds1'], 3)
+        mock_build.return_value = client
+
+        results = self._extract_all(self._get_conf())
+
+        self.assertEqual([result.description for result in results],
+                         ['ds{}.table{}'.format(i, j) for i in range(2) for j in range(3)])
+        self.assertEqual(client.http_ids, {id(None)})
+
+    @patch('databuilder.extractor.base_bigquery_extractor.time.sleep')
+    def test_num_retries(self, mock_sleep, mock_build, mock_default):
+        client = MockConcurrentBigQueryClient(['ds0'], 1)
+        mock_build.return_value = client
+        datasets = client.datasets_method.list.return_value.execute.return_value
+        client.datasets_method.list.return_value.execute.side_effect = [
+            HttpError(Mock(status=429), b''), HttpError(Mock(status=503), b''), datasets]
+
+        results = self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.NUM_RETRIES_KEY: 2}))
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(client.datasets_method.list.return_value.execute.call_count, 3)
+
+    @patch('databuilder.extractor.base_bigquery_extractor.time.sleep')
+    def test_retries_exhausted_or_not_retryable(self, mock_sleep, mock_build, mock_default):
+        client = MockConcurrentBigQueryClient(['ds0'], 1)
+        mock_build.return_value = client
+        execute = client.datasets_method.list.return_value.execute
+
+        execute.side_effect = HttpError(Mock(status=500), b'')
+        with self.assertRaises(HttpError):
+            self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.NUM_RETRIES_KEY: 2}))
+        self.assertEqual(execute.call_count, 3)
+
+        execute.reset_mock()
+        execute.side_effect = HttpError(Mock(status=403), b'')
+        with self.assertRaises(HttpError):
+            self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.NUM_RETRIES_KEY: 2}))
+        self.assertEqual(execute.call_count, 1)
+
+    @patch('databuilder.extractor.base_bigquery_extractor.time.sleep')
+    def test_retries_rate_limit_forbidden(self, mock_sleep, mock_build, mock_default):
+        client = MockConcurrentBigQueryClient(['ds0'], 1)
+        mock_build.return_value = client
+        execute = client.datasets_method.list.return_value.execute
+        datasets = execute.return_value
+
+        def forbidden(reason):
+            content = {'error': {'code': 403, 'errors': [{'reason': reason}]}}
+            return HttpError(Mock(status=403), json.dumps(content).encode('utf-8'))
+
+        execute.side_effect = [forbidden('rateLimitExceeded'), forbidden('userRateLimitExceeded'), datasets]
+        results = self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.NUM_RETRIES_KEY: 2}))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(execute.call_count, 3)
+
+        execute.reset_mock()
+        execute.side_effect = forbidden('accessDenied')
+        with self.assertRaises(HttpError):
+            self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.NUM_RETRIES_KEY: 2}))
+        self.assertEqual(execute.call_count, 1)
+
+    @patch('databuilder.extractor.base_bigquery_extractor.time.sleep')
+    def test_retries_transport_error(self, mock_sleep, mock_build, mock_default):
+        client = MockConcurrentBigQueryClient(['ds0'], 1)
+        mock_build.return_value = client
+        execute = client.datasets_method.list.return_value.execute
+        datasets = execute.return_value
+        execute.side_effect = [socket.timeout('timed out'), datasets]
+
+        with patch('databuilder.extractor.base_bigquery_extractor._RateLimiter.acquire') as mock_acquire:
+            results = self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.MAX_REQUESTS_PER_SEC_KEY: 10}))
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(execute.call_count, 2)
+        # Retry goes through the rate limiter
+        self.assertEqual(mock_acquire.call_count, 4)
+
+        execute.reset_mock()
+        execute.side_effect = socket.timeout('timed out')
+        with self.assertRaises(socket.timeout):
+            self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.NUM_RETRIES_KEY: 1}))
+        self.assertEqual(execute.call_count, 2)
+
+    def test_max_requests_per_sec(self, mock_build, mock_default):
+        mock_build.return_value = MockConcurrentBigQueryClient(['ds0'], 1)
+
+        start = time.time()
+        # Lists datasets, lists tables, and gets the table
+        self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.NUM_THREADS_KEY: 2,
+                                            BigQueryMetadataExtractor.MAX_REQUESTS_PER_SEC_KEY: 10}))
+
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    @patch('databuilder.extractor.base_bigquery_extractor.time.sleep')
+    def test_max_requests_per_sec_with_retries(self, mock_sleep, mock_build, mock_default):
+        client = MockConcurrentBigQueryClient(['ds0'], 1)
+        mock_build.return_value = client
+        datasets = client.datasets_method.list.return_value.execute.return_value
+        client.datasets_method.list.return_value.execute.side_effect = [HttpError(Mock(status=429), b''), datasets]
+
+        with patch('databuilder.extractor.base_bigquery_extractor._RateLimiter.acquire') as mock_acquire:
+            self._extract_all(self._get_conf(**{BigQueryMetadataExtractor.MAX_REQUESTS_PER_SEC_KEY: 10}))
+
+        # Lists datasets twice, lists tables, and gets the table
+        self.assertEqual(mock_acquire.call_count, 4)
@@ -1,10 +1,16 @@
 from mock import patch, Mock
 import base64
+import copy
+import json
+import re
+import socket
 import tempfile
+import threading
 import unittest
 import six
 import pytest
 
+from googleapiclient.errors import HttpError
 from pyhocon import ConfigFactory
 
 from databuilder import Scoped
@@ -360,3 +366,174 @@ class TestBigqueryUsageExtractor(unittest.TestCase):
         self.assertEqual(key.table, 'incidents_2008')
         self.assertEqual(key.email, 'your-user-here@test.com')
         self.assertEqual(value, 1)
+
+
+class MockSlicedLoggingClient():
+    """
+    Returns the pages per request, and records the body and fields of each request. A page can fail with
+    HttpError of the status, or with the given exception, for given number of times, shared by all slices.
+    """
+    def __init__(self, pages, failures=None):
+        self.pages = pages
+        self.failures = failures or {}
+        self.execute_count = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self.entries_method = Mock()
+        self.entries_method.list.side_effect = self._list
+
+    def _list(self, body, fields=None):
+        with self.lock:
+            self.requests.append((copy.deepcopy(body), fields))
+        request = Mock()
+        request.execute.side_effect = self._execute(body.get('pageToken'))
+        return request
+
+    def _execute(self, page_token):
+        def execute(**kwargs):
+            index = int(page_token) if page_token else 0
+            with self.lock:
+                self.execute_count += 1
+                status, count = self.failures.get(index, (None, 0))
+                if count:
+                    self.failures[index] = (status, count - 1)
+                    raise status if isinstance(status, Exception) else HttpError(Mock(status=status), b'')
+            return self.pages[index]
+
+        return execute
+
+    def entries(self):
+        return self.entries_method
+
+
+@patch('google.auth.default', return_value=(Mock(), None))
+@patch('databuilder.extractor.base_bigquery_extractor.build')
+class TestBigqueryUsageExtractorTimeSliced(unittest.TestCase):
+    def _get_conf(self, **kwargs):
+        config_dict = {
+            'extractor.bigquery_table_usage.{}'.format(BigQueryTableUsageExtractor.PROJECT_ID_KEY):
+                'your-project-here',
+            'extractor.bigquery_table_usage.{}'.format(BigQueryTableUsageExtractor.TIMESTAMP_KEY):
+                '2019-05-08T00:00:00Z',
+            'extractor.bigquery_table_usage.{}'.format(BigQueryTableUsageExtractor.END_TIMESTAMP_KEY):
+                '2019-05-09T00:00:00Z',
+        }
+        for key, value in kwargs.items():
+            config_dict['extractor.bigquery_table_usage.{}'.format(key)] = value
+        return ConfigFactory.from_dict(config_dict)
+
+    def _extract_all(self, conf):
+        extractor = BigQueryTableUsageExtractor()
+        extractor.init(Scoped.get_scoped_conf(conf=conf, scope=extractor.get_scope()))
+        results = []
+        result = extractor.extract()
+        while result:
+            results.append(result)
+            result = extractor.extract()
+        extractor.close()
+        return results
+
+    def test_merges_time_slices(self, mock_build, mock_default):
+        client = MockSlicedLoggingClient([CORRECT_DATA])
+        mock_build.return_value = client
+
+        results = self._extract_all(self._get_conf(**{BigQueryTableUsageExtractor.NUM_TIME_SLICES_KEY: 4,
+                                                      BigQueryTableUsageExtractor.NUM_THREADS_KEY: 2}))
+
+        self.assertEqual(len(results), 1)
+        key, value = results[0]
+        self.assertEqual(key.table, 'incidents_2008')
+        self.assertEqual(value, 4)
+
+        filters = sorted(body['filter'] for body, _ in client.requests)
+        self.assertEqual([re.findall(r'timestamp [<>]=? "([^"]+)"', f) for f in filters],
+                         [['2019-05-08T00:00:00Z', '2019-05-08T06:00:00Z'],
+                          ['2019-05-08T06:00:00Z', '2019-05-08T12:00:00Z'],
+                          ['2019-05-08T12:00:00Z', '2019-05-08T18:00:00Z'],
+                          ['2019-05-08T18:00:00Z', '2019-05-09T00:00:00Z']])
+        for body, fields in client.requests:
+            self.assertEqual(body['pageSize'], BigQueryTableUsageExtractor.DEFAULT_LOG_PAGE_SIZE)
+            self.assertEqual(fields, BigQueryTableUsageExtractor.ENTRY_FIELDS)
+
+    def test_defers_aggregation_to_extract(self, mock_build, mock_default):
+        client = MockSlicedLoggingClient([CORRECT_DATA])
+        mock_build.return_value = client
+
+        extractor = BigQueryTableUsageExtractor()
+        extractor.init(Scoped.get_scoped_conf(conf=self._get_conf(**{
+            BigQueryTableUsageExtractor.NUM_TIME_SLICES_KEY: 2}), scope=extractor.get_scope()))
+        self.assertEqual(client.requests, [])
+
+        key, value = extractor.extract()
+        self.assertEqual(value, 2)
+        self.assertEqual(len(client.requests), 2)
+
+    @patch('databuilder.extractor.base_bigquery_extractor.time.sleep')
+    @patch('databuilder.extractor.bigquery_usage_extractor.sleep')
+    def test_pages_with_retry(self, mock_delay, mock_sleep, mock_build, mock_default):
+        first_page = dict(CORRECT_DATA, nextPageToken='1')
+        # Second page fails more than the retries of a request
+        client = MockSlicedLoggingClient([first_page, CORRECT_DATA], failures={1: (429, 3)})
+        mock_build.return_value = client
+
+        results = self._extract_all(self._get_conf(**{BigQueryTableUsageExtractor.NUM_TIME_SLICES_KEY: 2,
+                                                      BigQueryTableUsageExtractor.NUM_RETRIES_KEY: 1}))
+
+        # Each slice reads the first page, and the second page once after retry
+        self.assertEqual(results[0][1], 4)
+        mock_delay.assert_called_once_with(BigQueryTableUsageExtractor.DELAY_TIME)
+
+    @patch('databuilder.extractor.base_bigquery_extractor.time.sleep')
+    @patch('databuilder.extractor.bigquery_usage_extractor.sleep')
+    def test_pages_with_retries_exhausted(self, mock_delay, mock_sleep, mock_build, mock_default):
+        client = MockSlicedLoggingClient([CORRECT_DATA], failures={0: (500, 100)})
+        mock_build.return_value = client
+
+        with self.assertRaises(HttpError):
+            self._extract_all(self._get_conf(**{BigQueryTableUsageExtractor.NUM_TIME_SLICES_KEY: 2,
+                                                BigQueryTableUsageExtractor.NUM_RETRIES_KEY: 1}))
+
+        # A slice gives up after 2 attempts of the request, for each of 2 attempts of the page
+        self.assertEqual(client.execute_count, 4)
+
+    @patch('databuilder.extractor.bigquery_usage_extractor.sleep')
+    def test_pages_with_error_not_retried(self, mock_delay, mock_build, mock_default):
+        client = MockSlicedLoggingClient([CORRECT_DATA], failures={0: (400, 100)})
+        mock_build.return_value = client
+
+        with self.assertRaises(HttpError):
+            self._extract_all(self._get_conf(**{BigQueryTableUsageExtractor.NUM_TIME_SLICES_KEY: 2}))
+
+        self.assertEqual(client.execute_count, 1)
+        mock_delay.assert_not_called()
+
+    @patch('databuilder.extractor.base_bigquery_extractor.time.sleep')
+    @patch('databuilder.extractor.bigquery_usage_extractor.sleep')
+    def test_pages_with_transport_and_quota_errors(self, mock_delay, mock_sleep, mock_build, mock_default):
+        quota_error = HttpError(Mock(status=403), json.dumps(
+            {'error': {'code': 403, 'errors': [{'reason': 'rateLimitExceeded'}]}}).encode('utf-8'))
+        for error in [socket.timeout('timed out'), quota_error]:
+            # Page fails more than the retries of a request
+            client = MockSlicedLoggingClient([CORRECT_DATA], failures={0: (error, 2)})
+            mock_build.return_value = client
+            mock_delay.reset_mock()
+
+            results = self._extract_all(self._get_conf(**{BigQueryTableUsageExtractor.NUM_RETRIES_KEY: 1}))
+
+            self.assertEqual(results[0][1], 1)
+            self.assertEqual(client.execute_count, 3)
+            mock_delay.assert_called_once_with(BigQueryTableUsageExtractor.DELAY_TIME)
+
+    def test_short_window(self, mock_build, mock_default):
+        client = MockSlicedLoggingClient([NO_ENTRIES])
+        mock_build.return_value = client
+
+        results = self._extract_all(self._get_conf(**{
+            BigQueryTableUsageExtractor.END_TIMESTAMP_KEY: '2019-05-08T00:00:02Z',
+            BigQueryTableUsageExtractor.NUM_TIME_SLICES_KEY: 4}))
+
+        self.assertEqual(results, [])
+        filters = sorted(body['filter'] for body, _ in client.requests)
+        self.assertEqual([re.findall(r'timestamp [<>]=? "([^"]+)"', f) for f in filters],
+                         [['2019-05-08T00:00:00Z', '2019-05-08T00:00:01Z'],
+                          ['2019-05-08T00:00:01Z', '2019-05-08T00:00:02Z']])
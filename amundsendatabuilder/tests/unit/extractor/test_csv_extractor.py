@@ -1,3 +1,7 @@
+import gzip
+import os
+import shutil
+import tempfile
 import unittest
 
 from pyhocon import ConfigFactory  # noqa: F401
@@ -35,3 +39,25 @@ class TestCsvExtractor(unittest.TestCase):
         self.assertEquals(result.schema_name, 'test_schema')
         self.assertEquals(result.table_name, 'test_table1')
         self.assertEquals(result.table_desc, '1st test table')
+
+    def test_extraction_from_compressed_file(self):
+        # type: () -> None
+        """
+        Test Extraction from gzip compressed CSV file
+        """
+        temp_dir_path = tempfile.mkdtemp()
+        try:
+            file_location = os.path.join(temp_dir_path, 'sample_col.csv.gz')
+            with open('example/sample_data/sample_col.csv', 'rb') as f_in, gzip.open(file_location, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+
+            conf = ConfigFactory.from_dict({CsvExtractor.FILE_LOCATION: file_location}).with_fallback(
+                Scoped.get_scoped_conf(conf=self.conf, scope='extractor.csv'))
+            extractor = CsvExtractor()
+            extractor.init(conf)
+
+            result = extractor.extract()
+            self.assertEquals(result.name, 'col1')
+            self.assertEquals(result.table_name, 'test_table1')
+        finally:
+            shutil.rmtree(temp_dir_path)
@@ -1,3 +1,4 @@
+import json
 import unittest
 
 from mock import patch
@@ -117,4 +118,4 @@ class TestNeo4jExtractor(unittest.TestCase):
             result_obj = extractor.extract()
 
             self.assertIsInstance(result_obj, TableESDocument)
-            self.assertDictEqual(vars(result_obj), result_dict)
+            self.assertDictEqual(json.loads(result_obj.to_json()), result_dict)
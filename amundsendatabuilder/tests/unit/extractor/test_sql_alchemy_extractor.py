@@ -1,6 +1,6 @@
 import unittest
 
-from mock import patch
+from mock import MagicMock, patch
 from pyhocon import ConfigTree, ConfigFactory  # noqa: F401
 from typing import Any  # noqa: F401
 
@@ -93,6 +93,66 @@ class TestSqlAlchemyExtractor(unittest.TestCase):
         self.assertIsInstance(result, TableMetadataResult)
         self.assertEqual(result.name, 'test_table')
 
+    @patch.object(SQLAlchemyExtractor, '_get_connection')
+    def test_extraction_in_batch(self, mock_method):
+        # type: (Any, Any) -> None
+        """
+        Test Extraction in batch
+        """
+        extractor = SQLAlchemyExtractor()
+        extractor.results = ['test_result', 'test_result2', 'test_result3']
+        extractor.init(Scoped.get_scoped_conf(conf=self.conf,
+                                              scope=extractor.get_scope()))
+
+        self.assertEqual(extractor.extract_batch(2), ['test_result', 'test_result2'])
+        self.assertEqual(extractor.extract_batch(2), ['test_result3'])
+        self.assertEqual(extractor.extract_batch(2), [])
+
+    @patch.object(SQLAlchemyExtractor, '_get_connection')
+    def test_extraction_with_stream_results(self, mock_method):
+        # type: (Any, Any) -> None
+        """
+        Test Extraction streaming result via server-side cursor
+        """
+        config_dict = {
+            'extractor.sqlalchemy.conn_string': 'TEST_CONNECTION',
+            'extractor.sqlalchemy.extract_sql': 'SELECT 1 FROM TEST_TABLE;',
+            'extractor.sqlalchemy.stream_results': True,
+            'extractor.sqlalchemy.fetch_size': 2,
+            'extractor.sqlalchemy.model_class':
+                'tests.unit.extractor.test_sql_alchemy_extractor.TableMetadataResult'
+        }
+        self.conf = ConfigFactory.from_dict(config_dict)
+
+        rows = [dict(database='test_database',
+                     schema='test_schema',
+                     name='test_table{}'.format(i),
+                     description='test_description',
+                     column_name='test_column_name',
+                     column_type='test_column_type',
+                     column_comment='test_column_comment',
+                     owner='test_owner') for i in range(3)]
+        results = MagicMock()
+        results.fetchmany.side_effect = [rows[:2], rows[2:], []]
+        connection = mock_method.return_value
+        connection.execution_options.return_value.execute.return_value = results
+
+        extractor = SQLAlchemyExtractor()
+        extractor.init(Scoped.get_scoped_conf(conf=self.conf,
+                                              scope=extractor.get_scope()))
+
+        connection.execution_options.assert_called_with(stream_results=True)
+        # Nothing is fetched until records are extracted
+        self.assertFalse(results.fetchmany.called)
+
+        result = extractor.extract()
+        self.assertIsInstance(result, TableMetadataResult)
+        self.assertEqual(result.name, 'test_table0')
+        results.fetchmany.assert_called_once_with(2)
+
+        self.assertEqual([r.name for r in extractor.extract_batch(5)], ['test_table1', 'test_table2'])
+        self.assertIsNone(extractor.extract())
+
 
 class TableMetadataResult:
     """
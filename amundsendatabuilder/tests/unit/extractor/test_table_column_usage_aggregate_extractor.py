@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 from mock import patch, MagicMock  # noqa: F401
@@ -5,11 +8,11 @@ from pyhocon import ConfigFactory
 import pytest
 import six
 
-if six.PY2:
-    from databuilder.extractor.table_column_usage_aggregate_extractor import TblColUsgAggExtractor, RAW_EXTRACTOR
-    from databuilder.models.table_column_usage import TableColumnUsage, ColumnReader
-    from databuilder.transformer.regex_str_replace_transformer import RegexStrReplaceTransformer
-    from databuilder.transformer.sql_to_table_col_usage_transformer import SqlToTblColUsageTransformer
+from databuilder.extractor.table_column_usage_aggregate_extractor import TblColUsgAggExtractor, RAW_EXTRACTOR, \
+    SPILL_THRESHOLD, NUM_PARTITIONS, SPILL_DIR, CHUNK_SIZE
+from databuilder.models.table_column_usage import TableColumnUsage, ColumnReader
+from databuilder.transformer.regex_str_replace_transformer import RegexStrReplaceTransformer
+from databuilder.transformer.sql_to_table_col_usage_transformer import SqlToTblColUsageTransformer
 
 
 @pytest.mark.skipif(
@@ -62,5 +65,89 @@ class TestTblColUsgAggExtractor(unittest.TestCase):
             self.assertEqual(expected.__repr__(), actual.__repr__())
 
 
+class TestTblColUsgAggExtractorExternal(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.spill_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        # type: () -> None
+        shutil.rmtree(self.spill_dir)
+
+    def _extract_all(self, col_readers, conf_dict):
+        # type: (list, dict) -> list
+        with patch.object(SqlToTblColUsageTransformer, 'init'),\
+                patch.object(SqlToTblColUsageTransformer, 'transform') as mock_sql_transform:
+
+            raw_extractor = MagicMock()
+            raw_extractor.get_scope.return_value = 'foo'
+            raw_extractor.extract.side_effect = ['sql'] * len(col_readers) + [None]
+            mock_sql_transform.side_effect = [TableColumnUsage(col_readers=[col_reader])
+                                              for col_reader in col_readers]
+
+            conf_dict[RAW_EXTRACTOR] = raw_extractor
+            extractor = TblColUsgAggExtractor()
+            extractor.init(ConfigFactory.from_dict(conf_dict))
+
+            records = []
+            record = extractor.extract()
+            while record:
+                records.append(record)
+                record = extractor.extract()
+            extractor.close()
+            return records
+
+    @staticmethod
+    def _create_col_readers():
+        # type: () -> list
+        # 10 tables read by 3 users, twice each
+        return [ColumnReader(database='database', cluster='gold', schema='test_schema',
+                             table='test_table{}'.format(i % 10), column='*',
+                             user_email='user{}@example.com'.format(i % 3), read_count=i % 2 + 1)
+                for i in range(60)]
+
+    @staticmethod
+    def _to_counts(records):
+        # type: (list) -> dict
+        counts = {}  # type: dict
+        for record in records:
+            for col_reader in record.col_readers:
+                key = (col_reader.table, col_reader.user_email)
+                assert key not in counts
+                counts[key] = col_reader.read_count
+        return counts
+
+    def test_aggregate_with_spill(self):
+        # type: () -> None
+        expected = self._to_counts(self._extract_all(self._create_col_readers(), {}))
+        self.assertEqual(len(expected), 30)
+        self.assertEqual(sum(expected.values()), 90)
+
+        actual = self._extract_all(self._create_col_readers(), {SPILL_THRESHOLD: 7,
+                                                                NUM_PARTITIONS: 4,
+                                                                SPILL_DIR: self.spill_dir})
+        self.assertEqual(self._to_counts(actual), expected)
+        # Spill files are removed once merged
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def test_aggregate_with_chunk_size(self):
+        # type: () -> None
+        records = self._extract_all(self._create_col_readers(), {CHUNK_SIZE: 8})
+        self.assertEqual([len(record.col_readers) for record in records], [8, 8, 8, 6])
+        self.assertEqual(sum(self._to_counts(records).values()), 90)
+
+        records = self._extract_all(self._create_col_readers(), {SPILL_THRESHOLD: 7,
+                                                                 NUM_PARTITIONS: 4,
+                                                                 SPILL_DIR: self.spill_dir,
+                                                                 CHUNK_SIZE: 3})
+        self.assertTrue(all(len(record.col_readers) <= 3 for record in records))
+        self.assertEqual(len(self._to_counts(records)), 30)
+
+    def test_no_usage(self):
+        # type: () -> None
+        self.assertEqual(self._extract_all([], {SPILL_THRESHOLD: 7, SPILL_DIR: self.spill_dir}), [])
+
+
 if __name__ == '__main__':
     unittest.main()
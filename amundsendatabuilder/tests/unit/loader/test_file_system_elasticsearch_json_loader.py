@@ -152,3 +152,30 @@ class TestFSElasticsearchJSONLoader(unittest.TestCase):
         ] * 5
 
         self._check_results_helper(expected=expected)
+
+    def test_loading_in_batch(self):
+        # type: () -> None
+        """
+        Test Loading functionality with batch of objects
+        """
+        loader = FSElasticsearchJSONLoader()
+        loader.init(conf=Scoped.get_scoped_conf(conf=self.conf,
+                                                scope=loader.get_scope()))
+
+        data = [TableESDocument(database='test_database',
+                                cluster='test_cluster',
+                                schema_name='test_schema',
+                                name='test_table{}'.format(i),
+                                key='test_table_key{}'.format(i),
+                                last_updated_epoch=123456789,
+                                description='test_description',
+                                column_names=['test_col1', 'test_col2'],
+                                column_descriptions=['test_comment1', 'test_comment2'],
+                                total_usage=10,
+                                unique_usage=5,
+                                tags=['test_tag1', 'test_tag2']) for i in range(3)]
+
+        loader.load_batch(data)
+        loader.close()
+
+        self._check_results_helper(expected=[d.to_json() for d in data])
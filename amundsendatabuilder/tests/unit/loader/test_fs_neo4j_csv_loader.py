@@ -1,5 +1,6 @@
 import collections
 import csv
+import json
 import logging
 import os
 import unittest
@@ -11,6 +12,8 @@ from typing import Dict, Iterable, Any, Callable  # noqa: F401
 
 from databuilder.job.base_job import Job
 from databuilder.loader.file_system_neo4j_csv_loader import FsNeo4jCSVLoader
+from databuilder.publisher.neo4j_csv_publisher import MANIFEST_FILE_NAME
+from databuilder.utils.compression import open_file
 from tests.unit.models.test_neo4j_csv_serde import Movie, Actor, City
 from operator import itemgetter
 
@@ -56,13 +59,93 @@ class TestFsNeo4jCSVLoader(unittest.TestCase):
                                               itemgetter('START_KEY', 'END_KEY'))
         self.assertEqual(expected_relations, actual_relations)
 
+    def test_load_batch(self):
+        # type: () -> None
+        actors = [Actor('Tom Cruise'), Actor('Meg Ryan')]
+        cities = [City('San Diego'), City('Oakland')]
+        movies = [Movie('Top Gun', actors, cities), Movie('Sleepless in Seattle', actors[1:], cities[:1])]
+
+        loader = FsNeo4jCSVLoader()
+        loader.init(self._conf)
+        loader.load_batch(movies)
+        loader.close()
+
+        node_dir = self._conf.get_string(FsNeo4jCSVLoader.NODE_DIR_PATH)
+        actual_nodes = self._get_csv_rows(node_dir, itemgetter('KEY'))
+        self.assertEqual([node['KEY'] for node in actual_nodes if node['LABEL'] == 'Movie'],
+                         ['movie://Sleepless in Seattle', 'movie://Top Gun'])
+        self.assertEqual(len([node for node in actual_nodes if node['LABEL'] == 'Actor']), 3)
+
+        with open(join(node_dir, MANIFEST_FILE_NAME), 'r') as f:
+            self.assertEqual(json.load(f)['files']['Movie_3.csv']['row_count'], 2)
+
+        actual_relations = self._get_csv_rows(self._conf.get_string(FsNeo4jCSVLoader.RELATION_DIR_PATH),
+                                              itemgetter('START_KEY', 'END_KEY'))
+        self.assertEqual(len(actual_relations), 6)
+
+    def test_manifest(self):
+        # type: () -> None
+        actors = [Actor('Tom Cruise'), Actor('Meg Ryan')]
+        cities = [City('San Diego'), City('Oakland')]
+        movie = Movie('Top Gun', actors, cities)
+
+        loader = FsNeo4jCSVLoader()
+        loader.init(self._conf)
+        loader.load(movie)
+        loader.close()
+
+        node_dir = self._conf.get_string(FsNeo4jCSVLoader.NODE_DIR_PATH)
+        with open(join(node_dir, MANIFEST_FILE_NAME), 'r') as f:
+            node_manifest = json.load(f)['files']
+
+        self.assertEqual(set(node_manifest.keys()), {'Actor_3.csv', 'City_3.csv', 'Movie_3.csv'})
+        actor_entry = node_manifest['Actor_3.csv']
+        self.assertEqual(actor_entry['labels'], ['Actor'])
+        self.assertEqual(set(actor_entry['headers']), {'KEY', 'LABEL', 'name'})
+        self.assertEqual(actor_entry['row_count'], 2)
+        self.assertEqual(actor_entry['byte_size'], os.path.getsize(join(node_dir, 'Actor_3.csv')))
+
+        relation_dir = self._conf.get_string(FsNeo4jCSVLoader.RELATION_DIR_PATH)
+        with open(join(relation_dir, MANIFEST_FILE_NAME), 'r') as f:
+            relation_manifest = json.load(f)['files']
+
+        self.assertEqual(relation_manifest['Movie_Actor_ACTOR.csv']['labels'], ['Movie', 'Actor'])
+        self.assertEqual(relation_manifest['Movie_Actor_ACTOR.csv']['row_count'], 2)
+
+    def test_load_with_compression(self):
+        # type: () -> None
+        actors = [Actor('Tom Cruise'), Actor('Meg Ryan')]
+        cities = [City('San Diego'), City('Oakland')]
+        movie = Movie('Top Gun', actors, cities)
+
+        loader = FsNeo4jCSVLoader()
+        loader.init(ConfigFactory.from_dict({FsNeo4jCSVLoader.COMPRESSION: 'gzip',
+                                             FsNeo4jCSVLoader.WRITE_BUFFER_SIZE: 1024 * 1024})
+                    .with_fallback(self._conf))
+        loader.load(movie)
+        loader.close()
+
+        node_dir = self._conf.get_string(FsNeo4jCSVLoader.NODE_DIR_PATH)
+        self.assertEqual(sorted(f for f in listdir(node_dir) if f != MANIFEST_FILE_NAME),
+                         ['Actor_3.csv.gz', 'City_3.csv.gz', 'Movie_3.csv.gz'])
+
+        expected_node_path = '{}/../resources/fs_neo4j_csv_loader/nodes'\
+            .format(os.path.join(os.path.dirname(__file__)))
+        self.assertEqual(self._get_csv_rows(expected_node_path, itemgetter('KEY')),
+                         self._get_csv_rows(node_dir, itemgetter('KEY')))
+
+        with open(join(node_dir, MANIFEST_FILE_NAME), 'r') as f:
+            actor_entry = json.load(f)['files']['Actor_3.csv.gz']
+        self.assertEqual(actor_entry['row_count'], 2)
+        self.assertEqual(actor_entry['byte_size'], os.path.getsize(join(node_dir, 'Actor_3.csv.gz')))
+
     def _get_csv_rows(self, path, sorting_key_getter):
         # type: (str, Callable) -> Iterable[Dict[str, Any]]
-        files = [join(path, f) for f in listdir(path) if isfile(join(path, f))]
+        files = [join(path, f) for f in listdir(path) if isfile(join(path, f)) and f != MANIFEST_FILE_NAME]
 
         result = []
         for f in files:
-            with open(f, 'r') as f_input:
+            with open_file(f, 'r') as f_input:
                 reader = csv.DictReader(f_input)
                 for row in reader:
                     result.append(collections.OrderedDict(sorted(row.items())))
@@ -1,12 +1,13 @@
 import unittest
 
+from mock import patch
 from typing import Union, Dict, Any, Iterable  # noqa: F401
 
 from databuilder.models.neo4j_csv_serde import (  # noqa: F401
     NODE_KEY, NODE_LABEL, RELATION_START_KEY, RELATION_START_LABEL,
     RELATION_END_KEY, RELATION_END_LABEL, RELATION_TYPE,
     RELATION_REVERSE_TYPE)
-from databuilder.models.neo4j_csv_serde import Neo4jCsvSerializable
+from databuilder.models.neo4j_csv_serde import Neo4jCsvSerializable, reset_validation, set_validation_mode
 
 
 class TestSerialize(unittest.TestCase):
@@ -55,6 +56,60 @@ class TestSerialize(unittest.TestCase):
         self.assertEqual(expected, actual)
 
 
+class TestValidation(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        reset_validation()
+
+    def tearDown(self):
+        # type: () -> None
+        reset_validation()
+
+    def _serialize(self, movie):
+        # type: (Movie) -> None
+        while movie.next_node():
+            pass
+        while movie.next_relation():
+            pass
+
+    def test_cached(self):
+        # type: () -> None
+        movie = Movie('Top Gun', [Actor('Tom Cruise'), Actor('Meg Ryan')], [City('San Diego'), City('Oakland')])
+        with patch.object(Neo4jCsvSerializable, '_validate', autospec=True) as mock_validate:
+            self._serialize(movie)
+
+        # Once per shape: Movie, Actor, City nodes, and Movie-Actor, Movie-City relations
+        self.assertEqual(mock_validate.call_count, 5)
+
+    def test_cached_invalid(self):
+        # type: () -> None
+        movie = Movie('Top Gun', [], [])
+        movie._node_iter = iter([{NODE_KEY: 'movie://Top Gun', NODE_LABEL: 'Movie', 'name': 'Top Gun'},
+                                 {NODE_KEY: 'movie://Cars', NODE_LABEL: 'MOVIE', 'name': 'Cars'}])
+        self.assertRaises(RuntimeError, self._serialize, movie)
+
+    def test_strict(self):
+        # type: () -> None
+        set_validation_mode('strict')
+        movie = Movie('Top Gun', [Actor('Tom Cruise'), Actor('Meg Ryan')], [City('San Diego'), City('Oakland')])
+        with patch.object(Neo4jCsvSerializable, '_validate', autospec=True) as mock_validate:
+            self._serialize(movie)
+
+        self.assertEqual(mock_validate.call_count, 9)
+
+    def test_trusted(self):
+        # type: () -> None
+        set_validation_mode('trusted')
+        movie = Movie('Top Gun', [], [])
+        movie._node_iter = iter([{NODE_KEY: 'movie://Cars', NODE_LABEL: 'MOVIE', 'name': 'Cars'}])
+        self._serialize(movie)
+
+    def test_unsupported_mode(self):
+        # type: () -> None
+        self.assertRaises(ValueError, set_validation_mode, 'lenient')
+
+
 class Movie(Neo4jCsvSerializable):
     LABEL = 'Movie'
     KEY_FORMAT = 'movie://{}'
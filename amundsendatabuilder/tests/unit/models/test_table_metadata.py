@@ -2,6 +2,7 @@ import copy
 import unittest
 
 from databuilder.models.table_metadata import ColumnMetadata, TableMetadata
+from databuilder.utils.dedup_cache import KeyHashSetDedupCache, reset_dedup_cache, set_dedup_cache
 
 
 class TestTableMetadata(unittest.TestCase):
@@ -9,8 +10,14 @@ class TestTableMetadata(unittest.TestCase):
         # type: () -> None
         super(TestTableMetadata, self).setUp()
 
+    def tearDown(self):
+        # type: () -> None
+        reset_dedup_cache()
+
     def test_serialize(self):
         # type: () -> None
+        # Dedup cache is installed by the job
+        set_dedup_cache(KeyHashSetDedupCache())
         self.table_metadata = TableMetadata('hive', 'gold', 'test_schema1', 'test_table1', 'test_table1', [
             ColumnMetadata('test_id1', 'description of test_table1', 'bigint', 0),
             ColumnMetadata('test_id2', 'description of test_id2', 'bigint', 1),
@@ -117,22 +124,60 @@ class TestTableMetadata(unittest.TestCase):
 
         self.assertEqual(self.expected_rels, actual)
 
-        # 2nd record should not show already serialized database, cluster, and schema
-        node_row = self.table_metadata2.next_node()
+        # 2nd record is identical, so all of its rows are already serialized in the job
+        self.assertIsNone(self.table_metadata2.next_node())
+        self.assertIsNone(self.table_metadata2.next_relation())
+
+        # 3rd record in the same schema should not show already serialized database, cluster, and schema
+        self.table_metadata3 = TableMetadata('hive', 'gold', 'test_schema1', 'test_table1', 'test_table1', [
+            ColumnMetadata('test_id1', 'description of test_table1', 'bigint', 0),
+            ColumnMetadata('test_id2', 'description of test_id2', 'bigint', 1),
+            ColumnMetadata('is_active', None, 'boolean', 2),
+            ColumnMetadata('source', 'description of source', 'varchar', 3),
+            ColumnMetadata('etl_created_at', 'description of etl_created_at', 'timestamp', 4),
+            ColumnMetadata('ds', None, 'varchar', 5)], is_view=True)
+        self.expected_nodes_deduped[0]['is_view:UNQUOTED'] = True
+
+        node_row = self.table_metadata3.next_node()
         actual = []
         while node_row:
             actual.append(node_row)
-            node_row = self.table_metadata2.next_node()
+            node_row = self.table_metadata3.next_node()
 
-        self.assertEqual(self.expected_nodes_deduped, actual)
+        self.assertEqual(self.expected_nodes_deduped[:1], actual)
+        self.assertIsNone(self.table_metadata3.next_relation())
 
-        relation_row = self.table_metadata2.next_relation()
-        actual = []
-        while relation_row:
-            actual.append(relation_row)
-            relation_row = self.table_metadata2.next_relation()
+    def test_lazy_iterators(self):
+        # type: () -> None
+        table_metadata = TableMetadata('hive', 'gold', 'test_schema1', 'test_table1', 'test_table1', [
+            ColumnMetadata('test_id1', 'description of test_table1', 'bigint', 0)])
+
+        # No per instance dict, and iterators are created on first use
+        self.assertFalse(hasattr(table_metadata, '__dict__'))
+        self.assertIsNone(table_metadata._node_iterator)
+        self.assertIsNone(table_metadata._relation_iterator)
 
-        self.assertEqual(self.expected_rels_deduped, actual)
+        self.assertEqual(table_metadata.next_node()['LABEL'], 'Table')
+        self.assertIsNotNone(table_metadata._node_iterator)
+        self.assertIsNone(table_metadata._relation_iterator)
+
+    def test_serialize_without_dedup_cache(self):
+        # type: () -> None
+        table_metadata = TableMetadata('hive', 'gold', 'test_schema1', 'test_table1', 'test_table1', [
+            ColumnMetadata('test_id1', 'description of test_table1', 'bigint', 0)])
+        table_metadata2 = TableMetadata('hive', 'gold', 'test_schema1', 'test_table1', 'test_table1', [
+            ColumnMetadata('test_id1', 'description of test_table1', 'bigint', 0)])
+
+        # Outside of a job, only database, cluster, and schema are deduped
+        for metadata, expected_labels in (
+                (table_metadata, ['Table', 'Description', 'Column', 'Description', 'Database', 'Cluster', 'Schema']),
+                (table_metadata2, ['Table', 'Description', 'Column', 'Description'])):
+            node_row = metadata.next_node()
+            actual = []
+            while node_row:
+                actual.append(node_row['LABEL'])
+                node_row = metadata.next_node()
+            self.assertEqual(actual, expected_labels)
 
     def test_table_attributes(self):
         # type: () -> None
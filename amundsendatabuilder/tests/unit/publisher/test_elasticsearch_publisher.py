@@ -1,3 +1,4 @@
+import hashlib
 import json
 from mock import MagicMock, mock_open, patch
 import six
@@ -6,7 +7,12 @@ import unittest
 from pyhocon import ConfigFactory
 
 from databuilder import Scoped
-from databuilder.publisher.elasticsearch_publisher import ElasticsearchPublisher
+from databuilder.publisher.elasticsearch_publisher import ElasticsearchPublisher, _content_hash
+
+
+def _with_content_hash(doc):
+    # type: (dict) -> dict
+    return dict(doc, content_hash=_content_hash(doc))
 
 
 class TestElasticsearchPublisher(unittest.TestCase):
@@ -28,6 +34,7 @@ class TestElasticsearchPublisher(unittest.TestCase):
                        'publisher.elasticsearch.alias': self.test_es_alias,
                        'publisher.elasticsearch.doc_type': self.test_doc_type}
 
+        self.config_dict = config_dict
         self.conf = ConfigFactory.from_dict(config_dict)
 
     def test_publish_with_no_data(self):
@@ -124,3 +131,229 @@ class TestElasticsearchPublisher(unittest.TestCase):
                 {'actions': [{"add": {"index": self.test_es_new_index, "alias": self.test_es_alias}},
                              {"remove_index": {"index": 'test_old_index'}}]}
             )
+
+    def _publish_in_chunks(self, mock_data, bulk_responses, thread_count=1):
+        # type: (str, list, int) -> ElasticsearchPublisher
+        self.mock_es_client.indices.get_alias.return_value = {}
+        self.mock_es_client.bulk.side_effect = bulk_responses
+        config_dict = {'publisher.elasticsearch.bulk_chunk_size': 2,
+                       'publisher.elasticsearch.bulk_thread_count': thread_count,
+                       'publisher.elasticsearch.bulk_max_retries': 1}
+        config_dict.update(self.config_dict)
+        conf = ConfigFactory.from_dict(config_dict)
+
+        target = 'builtins.open'
+        if six.PY2:
+            target = '__builtin__.open'
+        with patch(target, mock_open(read_data=mock_data)), patch('time.sleep') as mock_sleep:
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=conf,
+                                                       scope=publisher.get_scope()))
+            try:
+                publisher.publish()
+            finally:
+                self.sleep_count = mock_sleep.call_count
+        return publisher
+
+    def test_publish_in_chunks(self):
+        # type: () -> None
+        """
+        Test Publish functionality streaming data with multiple bulk requests
+        """
+        docs = [json.dumps({'key': 'key{}'.format(i)}) for i in range(5)]
+        self._publish_in_chunks('\n'.join(docs) + '\n', [{'errors': False}] * 3, thread_count=2)
+
+        action = json.dumps({'index': {'_index': self.test_es_new_index, '_type': self.test_doc_type}})
+        bodies = sorted(args[0] for args, _ in self.mock_es_client.bulk.call_args_list)
+        self.assertEqual(bodies, ['{0}\n{1}\n{0}\n{2}\n'.format(action, docs[0], docs[1]),
+                                  '{0}\n{1}\n{0}\n{2}\n'.format(action, docs[2], docs[3]),
+                                  '{0}\n{1}\n'.format(action, docs[4])])
+
+        self.mock_es_client.indices.update_aliases.assert_called_once_with(
+            {'actions': [{"add": {"index": self.test_es_new_index, "alias": self.test_es_alias}}]}
+        )
+
+    def test_publish_in_chunks_retry_rejected(self):
+        # type: () -> None
+        """
+        Test Publish functionality retrying documents rejected with 429
+        """
+        docs = [json.dumps({'key': 'key{}'.format(i)}) for i in range(2)]
+        self._publish_in_chunks('\n'.join(docs),
+                                [{'errors': True, 'items': [{'index': {'status': 201}},
+                                                            {'index': {'status': 429}}]},
+                                 {'errors': False}])
+
+        self.assertEqual(self.mock_es_client.bulk.call_count, 2)
+        action = json.dumps({'index': {'_index': self.test_es_new_index, '_type': self.test_doc_type}})
+        self.assertEqual(self.mock_es_client.bulk.call_args[0][0], '{}\n{}\n'.format(action, docs[1]))
+        self.assertEqual(self.sleep_count, 1)
+        self.mock_es_client.indices.update_aliases.assert_called_once()
+
+    def test_publish_in_chunks_failure(self):
+        # type: () -> None
+        """
+        Test Publish functionality failing before alias swap when a document is failed
+        """
+        docs = [json.dumps({'key': 'key{}'.format(i)}) for i in range(2)]
+        with self.assertRaises(Exception):
+            self._publish_in_chunks('\n'.join(docs),
+                                    [{'errors': True, 'items': [{'index': {'status': 201}},
+                                                                {'index': {'status': 400,
+                                                                           'error': 'mapper_parsing_exception'}}]}])
+
+        self.mock_es_client.indices.update_aliases.assert_not_called()
+
+        # Rejected documents fail once retries are exhausted
+        self.mock_es_client.reset_mock()
+        rejected = {'errors': True, 'items': [{'index': {'status': 429}}, {'index': {'status': 429}}]}
+        with self.assertRaises(Exception):
+            self._publish_in_chunks('\n'.join(docs), [rejected, rejected])
+
+        self.assertEqual(self.mock_es_client.bulk.call_count, 2)
+        self.mock_es_client.indices.update_aliases.assert_not_called()
+
+    def test_publish_with_index_build_profile(self):
+        # type: () -> None
+        """
+        Test Publish functionality building new index without replica and refresh
+        """
+        mock_data = json.dumps({'KEY_DOESNOT_MATTER': 'NO_VALUE'})
+        self.mock_es_client.indices.get_alias.return_value = {'test_old_index': 'DOES_NOT_MATTER'}
+        self.mock_es_client.cluster.health.return_value = {'status': 'green', 'timed_out': False}
+
+        config_dict = {'publisher.elasticsearch.index_build_profile': True,
+                       'publisher.elasticsearch.mapping': json.dumps({'settings': {'index': {'number_of_replicas': 2,
+                                                                                             'number_of_shards': 5}},
+                                                                      'mappings': {}})}
+        config_dict.update(self.config_dict)
+        conf = ConfigFactory.from_dict(config_dict)
+
+        target = 'builtins.open'
+        if six.PY2:
+            target = '__builtin__.open'
+        with patch(target, mock_open(read_data=mock_data)):
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=conf,
+                                                       scope=publisher.get_scope()))
+            publisher.publish()
+
+        self.mock_es_client.indices.create.assert_called_once_with(
+            index=self.test_es_new_index,
+            body={'settings': {'index': {'number_of_shards': 5},
+                               'number_of_replicas': 0,
+                               'refresh_interval': '-1'},
+                  'mappings': {}})
+        self.mock_es_client.indices.forcemerge.assert_called_once_with(index=self.test_es_new_index,
+                                                                       max_num_segments=1,
+                                                                       request_timeout=3600)
+        self.mock_es_client.indices.put_settings.assert_called_once_with(
+            index=self.test_es_new_index,
+            body={'index': {'number_of_replicas': 2, 'refresh_interval': None}})
+        self.mock_es_client.cluster.health.assert_called_once()
+        self.mock_es_client.indices.update_aliases.assert_called_once()
+
+        # Alias is not swapped if new index does not become green
+        self.mock_es_client.reset_mock()
+        self.mock_es_client.cluster.health.return_value = {'status': 'yellow', 'timed_out': True}
+        with patch(target, mock_open(read_data=mock_data)):
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=conf,
+                                                       scope=publisher.get_scope()))
+            self.assertRaises(Exception, publisher.publish)
+        self.mock_es_client.indices.update_aliases.assert_not_called()
+
+    def test_publish_incremental(self):
+        # type: () -> None
+        """
+        Test Publish functionality sending only changes against the index behind alias
+        """
+        docs = [{'key': 'unchanged', 'name': 'a'},
+                {'key': 'changed', 'name': 'b'},
+                {'key': 'new', 'name': 'd'}]
+        unchanged_hash = hashlib.sha1(json.dumps(docs[0], sort_keys=True).encode('utf-8')).hexdigest()
+        live_hits = [{'_id': 'id1', '_source': {'key': 'unchanged', 'content_hash': unchanged_hash}},
+                     {'_id': 'id2', '_source': {'key': 'changed', 'content_hash': 'stale'}},
+                     {'_id': 'id3', '_source': {'key': 'removed', 'content_hash': 'foo'}},
+                     {'_id': 'id4', '_source': {}}]
+        self.mock_es_client.indices.get_alias.return_value = {'test_old_index': 'DOES_NOT_MATTER'}
+        self.mock_es_client.bulk.return_value = {'errors': False}
+
+        config_dict = {'publisher.elasticsearch.incremental': True}
+        config_dict.update(self.config_dict)
+        conf = ConfigFactory.from_dict(config_dict)
+
+        target = 'builtins.open'
+        if six.PY2:
+            target = '__builtin__.open'
+        with patch(target, mock_open(read_data='\n'.join(json.dumps(doc) for doc in docs))), \
+                patch('databuilder.publisher.elasticsearch_publisher.scan') as mock_scan:
+            mock_scan.return_value = iter(live_hits)
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=conf,
+                                                       scope=publisher.get_scope()))
+            publisher.publish()
+
+        self.assertEqual(mock_scan.call_args[1]['index'], self.test_es_alias)
+        self.mock_es_client.indices.create.assert_not_called()
+        self.mock_es_client.indices.update_aliases.assert_not_called()
+
+        self.mock_es_client.bulk.assert_called_once()
+        lines = [json.loads(line) for line in self.mock_es_client.bulk.call_args[0][0].splitlines()]
+        self.assertEqual(lines[0], {'index': {'_index': self.test_es_alias, '_type': self.test_doc_type,
+                                              '_id': 'id2'}})
+        self.assertEqual(lines[1]['name'], 'b')
+        self.assertIn('content_hash', lines[1])
+        self.assertEqual(lines[2], {'index': {'_index': self.test_es_alias, '_type': self.test_doc_type}})
+        self.assertEqual(lines[3]['key'], 'new')
+        self.assertEqual(lines[4:], [{'delete': {'_index': self.test_es_alias, '_type': self.test_doc_type,
+                                                 '_id': doc_id}} for doc_id in ('id3', 'id4')])
+
+    def test_publish_incremental_without_live_index(self):
+        # type: () -> None
+        """
+        Test Publish functionality building new index when there's no index behind alias
+        """
+        mock_data = json.dumps({'key': 'new'})
+        self.mock_es_client.indices.get_alias.return_value = {}
+
+        config_dict = {'publisher.elasticsearch.incremental': True}
+        config_dict.update(self.config_dict)
+        conf = ConfigFactory.from_dict(config_dict)
+
+        target = 'builtins.open'
+        if six.PY2:
+            target = '__builtin__.open'
+        with patch(target, mock_open(read_data=mock_data)):
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=conf,
+                                                       scope=publisher.get_scope()))
+            publisher.publish()
+
+        self.mock_es_client.indices.create.assert_called_once()
+        self.mock_es_client.indices.update_aliases.assert_called_once()
+        # Content hash is stored, so that next incremental publish only indexes the changes
+        self.assertEqual(self.mock_es_client.bulk.call_args[0][0][1], _with_content_hash({'key': 'new'}))
+
+    def test_publish_with_content_hash(self):
+        # type: () -> None
+        """
+        Test Publish functionality building new index with content hash, for incremental publish to follow
+        """
+        mock_data = json.dumps({'key': 'new'})
+        self.mock_es_client.indices.get_alias.return_value = {}
+
+        config_dict = {'publisher.elasticsearch.content_hash_field': 'content_hash'}
+        config_dict.update(self.config_dict)
+        conf = ConfigFactory.from_dict(config_dict)
+
+        target = 'builtins.open'
+        if six.PY2:
+            target = '__builtin__.open'
+        with patch(target, mock_open(read_data=mock_data)):
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=conf,
+                                                       scope=publisher.get_scope()))
+            publisher.publish()
+
+        self.assertEqual(self.mock_es_client.bulk.call_args[0][0][1], _with_content_hash({'key': 'new'}))
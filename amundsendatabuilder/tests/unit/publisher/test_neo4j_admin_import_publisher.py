@@ -0,0 +1,136 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+from pyhocon import ConfigFactory
+
+from databuilder.publisher import neo4j_csv_publisher
+from databuilder.publisher.neo4j_admin_import_publisher import Neo4jAdminImportPublisher, _ImportFileWriter
+
+
+class TestNeo4jAdminImportPublisher(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self._resource_path = '{}/../resources/csv_publisher' \
+            .format(os.path.join(os.path.dirname(__file__)))
+        self._temp_dir = tempfile.mkdtemp()
+        self._import_dir = os.path.join(self._temp_dir, 'import')
+
+        # Node directory with a duplicated key across files
+        self._node_dir = os.path.join(self._temp_dir, 'nodes')
+        shutil.copytree('{}/nodes'.format(self._resource_path), self._node_dir)
+        with open(os.path.join(self._node_dir, 'test_table_dup.csv'), 'w') as f:
+            f.write('"KEY","name","LABEL"\n'
+                    '"presto://gold.test_schema1/test_table1","test_table1","Table"\n')
+
+        # Relation directory with a relation to non-existing node
+        self._relation_dir = os.path.join(self._temp_dir, 'relations')
+        shutil.copytree('{}/relations'.format(self._resource_path), self._relation_dir)
+        with open(os.path.join(self._relation_dir, 'test_edge_missing.csv'), 'w') as f:
+            f.write('"START_LABEL","START_KEY","END_LABEL","END_KEY","TYPE","REVERSE_TYPE"\n'
+                    '"Table","presto://gold.test_schema1/test_table1","Column","no_such_column","COLUMN",'
+                    '"BELONG_TO_TABLE"\n')
+
+    def tearDown(self):
+        # type: () -> None
+        shutil.rmtree(self._temp_dir)
+
+    def _create_publisher(self, command=''):
+        # type: (str) -> Neo4jAdminImportPublisher
+        conf = ConfigFactory.from_dict(
+            {neo4j_csv_publisher.NODE_FILES_DIR: self._node_dir,
+             neo4j_csv_publisher.RELATION_FILES_DIR: self._relation_dir,
+             neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo',
+             Neo4jAdminImportPublisher.IMPORT_DIR: self._import_dir,
+             Neo4jAdminImportPublisher.NEO4J_ADMIN_COMMAND: command})
+        publisher = Neo4jAdminImportPublisher()
+        publisher.init(conf)
+        return publisher
+
+    def _read_csv(self, file_name):
+        # type: (str) -> list
+        with open(os.path.join(self._import_dir, file_name), 'r') as f:
+            return list(csv.reader(f))
+
+    def test_publish(self):
+        # type: () -> None
+        with patch('subprocess.check_call') as mock_check_call:
+            self._create_publisher(command='/neo4j/bin/neo4j-admin').publish()
+
+        self.assertEqual(self._read_csv('nodes_0_Column_header.csv'),
+                         [['key:ID(Column)', ':LABEL', 'name', 'order_pos:long', 'type', 'published_tag',
+                           'publisher_last_updated_epoch_ms:long']])
+        column_rows = self._read_csv('nodes_0_Column.csv')
+        self.assertEqual(len(column_rows), 2)
+        self.assertEqual(column_rows[0][:6],
+                         ['presto://gold.test_schema1/test_table1/test_id1', 'Column', 'test_id1', '1', 'bigint',
+                          'foo'])
+
+        self.assertEqual(len(self._read_csv('nodes_1_Table.csv')), 2)
+        # Duplicated table key is skipped, therefore no file for it
+        self.assertFalse(os.path.exists(os.path.join(self._import_dir, 'nodes_2_Table.csv')))
+
+        self.assertEqual(self._read_csv('relationships_1_Table_Column_COLUMN_header.csv'),
+                         [[':START_ID(Table)', ':END_ID(Column)', ':TYPE', 'published_tag',
+                           'publisher_last_updated_epoch_ms:long']])
+        self.assertEqual(len(self._read_csv('relationships_1_Table_Column_COLUMN.csv')), 2)
+        reverse_rows = self._read_csv('relationships_1_Column_Table_BELONG_TO_TABLE.csv')
+        self.assertEqual(reverse_rows[0][:3], ['presto://gold.test_schema1/test_table1/test_id1',
+                                               'presto://gold.test_schema1/test_table1',
+                                               'BELONG_TO_TABLE'])
+        # Relation to non-existing node is skipped, therefore no file for it
+        self.assertFalse(os.path.exists(os.path.join(self._import_dir,
+                                                     'relationships_0_Table_Column_COLUMN.csv')))
+
+        command = mock_check_call.call_args[0][0]
+        self.assertEqual(command[:5], ['/neo4j/bin/neo4j-admin', 'import', '--database=graph.db',
+                                       '--id-type=STRING', '--multiline-fields=true'])
+        self.assertEqual(len([arg for arg in command if arg.startswith('--nodes=')]), 2)
+        self.assertEqual(len([arg for arg in command if arg.startswith('--relationships=')]), 2)
+
+    def test_publish_without_command(self):
+        # type: () -> None
+        with patch('subprocess.check_call') as mock_check_call:
+            self._create_publisher().publish()
+
+        self.assertFalse(mock_check_call.called)
+        self.assertTrue(os.path.exists(os.path.join(self._import_dir, 'nodes_0_Column.csv')))
+
+    def test_publish_conversion_failure(self):
+        # type: () -> None
+        writers = []
+        init = _ImportFileWriter.__init__
+        write = _ImportFileWriter.write
+        delete_dir = shutil.rmtree
+
+        def create_writer(writer, *args, **kwargs):
+            init(writer, *args, **kwargs)
+            writers.append(writer)
+
+        def write_or_fail(writer, id_values, record_dict, suffix_values):
+            # Fails on reverse relation, after import files of the relation are opened
+            if id_values[-1] == 'BELONG_TO_TABLE':
+                raise ValueError('Failed to write')
+            write(writer, id_values, record_dict, suffix_values)
+
+        def rmtree(path):
+            # All import files are closed before the directory is deleted
+            self.assertTrue(writers)
+            self.assertTrue(all(writer._file.closed for writer in writers))
+            delete_dir(path)
+
+        with patch.object(_ImportFileWriter, '__init__', autospec=True, side_effect=create_writer), \
+                patch.object(_ImportFileWriter, 'write', autospec=True, side_effect=write_or_fail), \
+                patch('shutil.rmtree', side_effect=rmtree) as mock_rmtree:
+            self.assertRaises(ValueError, self._create_publisher().publish)
+
+        mock_rmtree.assert_called_once_with(self._import_dir)
+        self.assertFalse(os.path.exists(self._import_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
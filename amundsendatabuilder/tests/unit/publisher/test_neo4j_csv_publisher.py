@@ -1,14 +1,19 @@
+import gzip
+import json
 import logging
 import os
+import shutil
+import tempfile
 import unittest
 import uuid
 
 from mock import patch, MagicMock
+from neo4j.exceptions import TransientError
 from neo4j.v1 import GraphDatabase
 from pyhocon import ConfigFactory
 
 from databuilder.publisher import neo4j_csv_publisher
-from databuilder.publisher.neo4j_csv_publisher import Neo4jCsvPublisher
+from databuilder.publisher.neo4j_csv_publisher import Neo4jCsvPublisher, _CsvFileReader
 
 
 class TestPublish(unittest.TestCase):
@@ -51,6 +56,311 @@ class TestPublish(unittest.TestCase):
             # 2 node files, 1 relation file
             self.assertEqual(mock_commit.call_count, 1)
 
+    def test_publisher_resume_from_checkpoint(self):
+        # type: () -> None
+        temp_dir = tempfile.mkdtemp()
+        checkpoint_file = os.path.join(temp_dir, 'checkpoint.json')
+        try:
+            with patch.object(GraphDatabase, 'driver') as mock_driver:
+                mock_session = MagicMock()
+                mock_driver.return_value.session.return_value = mock_session
+
+                mock_transaction = MagicMock()
+                mock_session.begin_transaction.return_value = mock_transaction
+
+                mock_run = MagicMock()
+                mock_transaction.run = mock_run
+
+                conf = ConfigFactory.from_dict(
+                    {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                     neo4j_csv_publisher.NODE_FILES_DIR: '{}/nodes'.format(self._resource_path),
+                     neo4j_csv_publisher.RELATION_FILES_DIR: '{}/relations'.format(self._resource_path),
+                     neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                     neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                     neo4j_csv_publisher.NEO4J_TRANSCATION_SIZE: 2,
+                     neo4j_csv_publisher.NEO4J_CHECKPOINT_FILE: checkpoint_file,
+                     neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo'}
+                )
+
+                # Fails on the first relation, after node files are committed
+                mock_run.side_effect = [MagicMock()] * 4 + [Exception('Connection lost')]
+                publisher = Neo4jCsvPublisher()
+                publisher.init(conf)
+                self.assertRaises(Exception, publisher.publish)
+
+                with open(checkpoint_file, 'r') as f:
+                    checkpoint = json.load(f)
+                self.assertEqual(checkpoint['publish_tag'], 'foo')
+                self.assertEqual(len(checkpoint['files']), 2)
+                for node_file, entry in checkpoint['files'].items():
+                    # Both records of node file are committed, and it resumes from the end of the file
+                    self.assertEqual(entry, {'base': 0, 'offset': 2, 'position': os.path.getsize(node_file)})
+
+                # Resumes with relation file only
+                mock_run.reset_mock()
+                mock_run.side_effect = None
+                publisher = Neo4jCsvPublisher()
+                publisher.init(conf)
+                publisher.publish()
+
+                self.assertEqual(mock_run.call_count, 2)
+                for _, kwargs in mock_run.call_args_list:
+                    self.assertIn('start_key', kwargs['parameters'])
+                self.assertFalse(os.path.exists(checkpoint_file))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_publisher_resume_from_checkpoint_position(self):
+        # type: () -> None
+        temp_dir = tempfile.mkdtemp()
+        checkpoint_file = os.path.join(temp_dir, 'checkpoint.json')
+        relation_file = '{}/relations/test_edge_short.csv'.format(self._resource_path)
+        try:
+            with open(relation_file, 'rb') as f:
+                header_size = len(f.readline())
+                first_record_end = header_size + len(f.readline())
+
+            with open(checkpoint_file, 'w') as f:
+                # Pre-processing is done and the first relation is merged
+                json.dump({'publish_tag': 'foo',
+                           'files': {relation_file: {'base': 2, 'offset': 3, 'position': first_record_end}}}, f)
+
+            with patch.object(GraphDatabase, 'driver') as mock_driver:
+                mock_session = MagicMock()
+                mock_driver.return_value.session.return_value = mock_session
+
+                mock_transaction = MagicMock()
+                mock_session.begin_transaction.return_value = mock_transaction
+
+                mock_run = MagicMock()
+                mock_transaction.run = mock_run
+
+                mock_preprocessor = MagicMock()
+                mock_preprocessor.is_perform_preprocess.return_value = MagicMock(return_value=True)
+                mock_preprocessor.preprocess_cypher.return_value = ('MATCH (f:Foo) RETURN f', {})
+
+                conf = ConfigFactory.from_dict(
+                    {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                     neo4j_csv_publisher.RELATION_FILES_DIR: '{}/relations'.format(self._resource_path),
+                     neo4j_csv_publisher.RELATION_PREPROCESSOR: mock_preprocessor,
+                     neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                     neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                     neo4j_csv_publisher.NEO4J_CHECKPOINT_FILE: checkpoint_file,
+                     neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo'}
+                )
+                publisher = Neo4jCsvPublisher()
+                publisher.init(conf)
+                publisher.publish()
+
+                mock_preprocessor.preprocess_cypher.assert_not_called()
+                self.assertEqual(mock_run.call_count, 1)
+                self.assertTrue(mock_run.call_args[1]['parameters']['end_key'].endswith('test_id2'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_csv_file_reader_resume(self):
+        # type: () -> None
+        temp_dir = tempfile.mkdtemp()
+        content = b'"KEY","DESCRIPTION"\n"a","foo"\n"b","multi\nline"\n"c","bar"\n'
+        try:
+            plain_file = os.path.join(temp_dir, 'records.csv')
+            with open(plain_file, 'wb') as f:
+                f.write(content)
+            gzip_file = os.path.join(temp_dir, 'records.csv.gz')
+            with gzip.open(gzip_file, 'wb') as f:
+                f.write(content)
+
+            for file_path in [plain_file, gzip_file]:
+                reader = _CsvFileReader(file_path)
+                positions = []
+                records = []
+                for record in reader:
+                    records.append(record)
+                    positions.append(reader.position)
+                self.assertEqual([r['KEY'] for r in records], ['a', 'b', 'c'])
+                self.assertEqual(records[1]['DESCRIPTION'], 'multi\nline')
+                self.assertEqual(positions[-1], len(content))
+
+                # Resumes right after the first record
+                reader = _CsvFileReader(file_path, positions[0])
+                resumed = []
+                for record in reader:
+                    resumed.append((record, reader.position))
+                self.assertEqual(resumed, list(zip(records[1:], positions[1:])))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_publisher_unwind_batch(self):
+        # type: () -> None
+        with patch.object(GraphDatabase, 'driver') as mock_driver:
+            mock_session = MagicMock()
+            mock_driver.return_value.session.return_value = mock_session
+
+            mock_transaction = MagicMock()
+            mock_session.begin_transaction.return_value = mock_transaction
+
+            mock_run = MagicMock()
+            mock_transaction.run = mock_run
+            mock_commit = MagicMock()
+            mock_transaction.commit = mock_commit
+
+            publisher = Neo4jCsvPublisher()
+
+            conf = ConfigFactory.from_dict(
+                {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                 neo4j_csv_publisher.NODE_FILES_DIR: '{}/nodes'.format(self._resource_path),
+                 neo4j_csv_publisher.RELATION_FILES_DIR: '{}/relations'.format(self._resource_path),
+                 neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                 neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                 neo4j_csv_publisher.NEO4J_UNWIND_BATCH_SIZE: 2,
+                 neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo'}
+            )
+            publisher.init(conf)
+            publisher.publish()
+
+            # 2 node files with 2 rows each, 1 relation file with 2 rows
+            self.assertEqual(mock_run.call_count, 3)
+            self.assertEqual(mock_commit.call_count, 1)
+
+            params_list = [kwargs['parameters'] for _, kwargs in mock_run.call_args_list]
+            for params in params_list:
+                self.assertEqual(params['publish_tag'], 'foo')
+                self.assertEqual(len(params['batch']), 2)
+
+            batch_rows = [row for params in params_list for row in params['batch']]
+            self.assertIn({'KEY': 'presto://gold.test_schema1/test_table1/test_id1',
+                           'props': {'name': 'test_id1', 'order_pos': 1, 'type': 'bigint'}}, batch_rows)
+            self.assertIn({'START_KEY': 'presto://gold.test_schema1/test_table1',
+                           'END_KEY': 'presto://gold.test_schema1/test_table1/test_id2',
+                           'props': {}}, batch_rows)
+
+    def test_create_indices_from_manifest(self):
+        # type: () -> None
+        temp_dir = tempfile.mkdtemp()
+        try:
+            node_dir = os.path.join(temp_dir, 'nodes')
+            shutil.copytree('{}/nodes'.format(self._resource_path), node_dir)
+            # Manifest only has test_column.csv, therefore test_table.csv should be scanned
+            with open(os.path.join(node_dir, neo4j_csv_publisher.MANIFEST_FILE_NAME), 'w') as f:
+                json.dump({'files': {'test_column.csv': {'labels': ['FromManifest'],
+                                                         'headers': ['KEY', 'LABEL'],
+                                                         'row_count': 2,
+                                                         'byte_size': 100}}}, f)
+
+            with patch.object(GraphDatabase, 'driver') as mock_driver:
+                mock_session = MagicMock()
+                mock_driver.return_value.session.return_value = mock_session
+                mock_session.__enter__.return_value = mock_session
+
+                publisher = Neo4jCsvPublisher()
+                conf = ConfigFactory.from_dict(
+                    {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                     neo4j_csv_publisher.NODE_FILES_DIR: node_dir,
+                     neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                     neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                     neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo'}
+                )
+                publisher.init(conf)
+                # Manifest is not a node file
+                self.assertEqual(len(publisher._node_files), 2)
+
+                publisher._create_indices()
+
+                self.assertEqual(publisher.labels, {'FromManifest', 'Table'})
+                stmts = [args[0] for args, _ in mock_session.run.call_args_list]
+                self.assertEqual(stmts, [
+                    'CREATE CONSTRAINT ON (node:FromManifest) ASSERT node.key IS UNIQUE',
+                    'CREATE CONSTRAINT ON (node:Table) ASSERT node.key IS UNIQUE'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_create_node_unwind_statement(self):
+        # type: () -> None
+        publisher = Neo4jCsvPublisher()
+        publisher.create_only_nodes = {'Column'}
+
+        stmt = publisher.create_node_unwind_statement('Table')
+        self.assertIn('UNWIND $batch AS row', stmt)
+        self.assertIn('MERGE (node:Table {key: row.KEY})', stmt)
+        self.assertIn('ON MATCH SET node += row.props', stmt)
+
+        stmt = publisher.create_node_unwind_statement('Column')
+        self.assertNotIn('ON MATCH SET', stmt)
+
+    def test_create_merge_statement(self):
+        # type: () -> None
+        publisher = Neo4jCsvPublisher()
+        publisher.create_only_nodes = set()
+        publisher.publish_tag = 'foo'
+
+        stmt1, params1 = publisher.create_node_merge_statement(
+            {'KEY': 'key1', 'LABEL': 'Column', 'name': "it's", 'sort_order:UNQUOTED': '1'})
+        stmt2, params2 = publisher.create_node_merge_statement(
+            {'KEY': 'key2', 'LABEL': 'Column', 'name': 'bar', 'sort_order:UNQUOTED': '2'})
+
+        # Statement does not change per row so that Neo4j can reuse the query plan
+        self.assertEqual(stmt1, stmt2)
+        self.assertIn('MERGE (node:Column {key: $key})', stmt1)
+        self.assertEqual(params1, {'key': 'key1',
+                                   'props': {'name': "it's", 'sort_order': 1},
+                                   'publish_tag': 'foo'})
+
+        stmt, params = publisher.create_relationship_merge_statement(
+            {'START_LABEL': 'Table', 'START_KEY': 'table_key', 'END_LABEL': 'Column', 'END_KEY': 'col_key',
+             'TYPE': 'COLUMN', 'REVERSE_TYPE': 'BELONG_TO_TABLE', 'read_count:UNQUOTED': '10'})
+        self.assertIn('MATCH (n1:Table {key: $start_key})', stmt)
+        self.assertIn('MERGE (n1)-[r1:COLUMN]->(n2)-[r2:BELONG_TO_TABLE]->(n1)', stmt)
+        self.assertEqual(params, {'start_key': 'table_key',
+                                  'end_key': 'col_key',
+                                  'props': {'read_count': 10},
+                                  'publish_tag': 'foo'})
+
+    def test_parse_unquoted_value(self):
+        # type: () -> None
+        self.assertEqual(neo4j_csv_publisher.parse_unquoted_value('True'), True)
+        self.assertEqual(neo4j_csv_publisher.parse_unquoted_value('false'), False)
+        self.assertEqual(neo4j_csv_publisher.parse_unquoted_value('3'), 3)
+        self.assertEqual(neo4j_csv_publisher.parse_unquoted_value('1.5'), 1.5)
+        self.assertEqual(neo4j_csv_publisher.parse_unquoted_value('"1"'), '1')
+        self.assertIsNone(neo4j_csv_publisher.parse_unquoted_value(''))
+
+    def test_publisher_parallel(self):
+        # type: () -> None
+        with patch.object(GraphDatabase, 'driver') as mock_driver, \
+                patch('time.sleep'):
+            mock_session = MagicMock()
+            mock_driver.return_value.session.return_value = mock_session
+
+            mock_transaction = MagicMock()
+            mock_transaction.closed.return_value = False
+            mock_session.begin_transaction.return_value = mock_transaction
+
+            # Fails once with deadlock, which should be retried
+            mock_run = MagicMock(side_effect=[TransientError('deadlock')] + [MagicMock()] * 6)
+            mock_transaction.run = mock_run
+            mock_commit = MagicMock()
+            mock_transaction.commit = mock_commit
+
+            publisher = Neo4jCsvPublisher()
+
+            conf = ConfigFactory.from_dict(
+                {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                 neo4j_csv_publisher.NODE_FILES_DIR: '{}/nodes'.format(self._resource_path),
+                 neo4j_csv_publisher.RELATION_FILES_DIR: '{}/relations'.format(self._resource_path),
+                 neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                 neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                 neo4j_csv_publisher.NEO4J_PUBLISH_PARALLELISM: 2,
+                 neo4j_csv_publisher.JOB_PUBLISH_TAG: '{}'.format(uuid.uuid4())}
+            )
+            publisher.init(conf)
+            publisher.publish()
+
+            self.assertEqual(mock_run.call_count, 7)
+            self.assertTrue(mock_transaction.rollback.called)
+
+            # One commit per file
+            self.assertEqual(mock_commit.call_count, 3)
+
     def test_preprocessor(self):
         # type: () -> None
         with patch.object(GraphDatabase, 'driver') as mock_driver:
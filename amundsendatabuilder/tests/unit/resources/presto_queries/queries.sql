@@ -0,0 +1,180 @@
+-- Corpus of Presto queries shaped after dashboard, ad hoc, and ETL queries in query logs.
+-- Statements are separated by a semicolon at the end of a line.
+SELECT * FROM core.rides WHERE ds = '2019-06-01' LIMIT 100;
+
+SELECT ride_id, driver_id, passenger_id, fare_usd FROM core.rides WHERE ds >= '2019-06-01' AND region = 'sfo';
+
+SELECT r.region, count(*) AS rides, sum(r.fare_usd) AS revenue
+FROM core.rides r
+WHERE r.ds BETWEEN '2019-06-01' AND '2019-06-30'
+GROUP BY 1
+ORDER BY 3 DESC;
+
+SELECT r.ride_id, d.driver_name, p.passenger_name
+FROM core.rides r
+JOIN core.drivers d ON r.driver_id = d.driver_id
+LEFT JOIN core.passengers p ON r.passenger_id = p.passenger_id
+WHERE r.ds = '2019-06-01';
+
+SELECT region, ds, rides, avg(rides) OVER (PARTITION BY region ORDER BY ds ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS rides_7d
+FROM (
+    SELECT region, ds, count(*) AS rides
+    FROM core.rides
+    WHERE ds >= '2019-05-01'
+    GROUP BY region, ds
+) daily;
+
+WITH active_drivers AS (
+    SELECT driver_id, count(DISTINCT ds) AS active_days
+    FROM core.driver_sessions
+    WHERE ds >= '2019-06-01'
+    GROUP BY driver_id
+    HAVING count(DISTINCT ds) >= 5
+), driver_rides AS (
+    SELECT driver_id, count(*) AS rides, sum(fare_usd) AS revenue
+    FROM core.rides
+    WHERE ds >= '2019-06-01'
+    GROUP BY driver_id
+)
+SELECT a.driver_id, a.active_days, r.rides, r.revenue, r.revenue / a.active_days AS revenue_per_day
+FROM active_drivers a
+JOIN driver_rides r ON a.driver_id = r.driver_id
+ORDER BY revenue_per_day DESC
+LIMIT 1000;
+
+SELECT CASE WHEN fare_usd < 10 THEN 'low' WHEN fare_usd < 30 THEN 'medium' ELSE 'high' END AS fare_bucket,
+       count(*) AS rides,
+       approx_percentile(duration_sec, 0.5) AS p50_duration,
+       approx_percentile(duration_sec, 0.9) AS p90_duration
+FROM core.rides
+WHERE ds = '2019-06-01'
+GROUP BY 1;
+
+SELECT passenger_id FROM core.passengers WHERE passenger_id IN (SELECT passenger_id FROM core.rides WHERE ds = '2019-06-01' AND fare_usd > 100);
+
+SELECT p.passenger_id, p.signup_date
+FROM core.passengers p
+WHERE NOT EXISTS (SELECT 1 FROM core.rides r WHERE r.passenger_id = p.passenger_id AND r.ds >= '2019-01-01');
+
+INSERT INTO analytics.daily_region_rides
+SELECT region, count(*) AS rides, sum(fare_usd) AS revenue, '2019-06-01' AS ds
+FROM core.rides
+WHERE ds = '2019-06-01'
+GROUP BY region;
+
+CREATE TABLE analytics.tmp_high_value_passengers AS
+SELECT passenger_id, sum(fare_usd) AS total_fare
+FROM core.rides
+WHERE ds >= '2019-01-01'
+GROUP BY passenger_id
+HAVING sum(fare_usd) > 1000;
+
+SELECT date_trunc('week', from_iso8601_date(ds)) AS week, region, count(DISTINCT driver_id) AS drivers
+FROM core.driver_sessions
+WHERE ds >= '2019-01-01'
+GROUP BY 1, 2
+ORDER BY 1, 2;
+
+SELECT e.event_name, count(*) AS events
+FROM events.app_events e
+CROSS JOIN UNNEST(e.properties) AS t (property_key, property_value)
+WHERE e.ds = '2019-06-01' AND t.property_key = 'screen'
+GROUP BY 1;
+
+SELECT region, rides FROM analytics.daily_region_rides WHERE ds = '2019-06-01'
+UNION ALL
+SELECT region, rides FROM analytics.daily_region_rides_backfill WHERE ds = '2019-06-01';
+
+SELECT d.driver_id,
+       max(CASE WHEN s.status = 'online' THEN s.duration_sec ELSE 0 END) AS max_online,
+       sum(CASE WHEN s.status = 'on_ride' THEN s.duration_sec ELSE 0 END) AS total_on_ride,
+       sum(CASE WHEN s.status = 'idle' THEN s.duration_sec ELSE 0 END) AS total_idle,
+       count(DISTINCT CASE WHEN s.status = 'on_ride' THEN s.ds END) AS ride_days
+FROM core.drivers d
+JOIN core.driver_sessions s ON d.driver_id = s.driver_id
+WHERE s.ds BETWEEN '2019-06-01' AND '2019-06-30' AND d.region IN ('sfo', 'nyc', 'sea', 'lax', 'chi', 'bos')
+GROUP BY d.driver_id;
+
+SELECT *
+FROM (
+    SELECT ride_id, passenger_id, fare_usd, row_number() OVER (PARTITION BY passenger_id ORDER BY fare_usd DESC) AS rn
+    FROM core.rides
+    WHERE ds = '2019-06-01'
+) ranked
+WHERE rn <= 3;
+
+SELECT coalesce(a.region, b.region) AS region, a.rides AS rides_this_week, b.rides AS rides_last_week,
+       CAST(a.rides AS double) / nullif(b.rides, 0) - 1 AS wow_growth
+FROM (SELECT region, count(*) AS rides FROM core.rides WHERE ds BETWEEN '2019-06-08' AND '2019-06-14' GROUP BY region) a
+FULL OUTER JOIN (SELECT region, count(*) AS rides FROM core.rides WHERE ds BETWEEN '2019-06-01' AND '2019-06-07' GROUP BY region) b
+ON a.region = b.region;
+
+SELECT json_extract_scalar(payload, '$.experiment') AS experiment, json_extract_scalar(payload, '$.variant') AS variant, count(*) AS exposures
+FROM events.experiment_exposures
+WHERE ds = '2019-06-01' AND json_extract_scalar(payload, '$.platform') IN ('ios', 'android')
+GROUP BY 1, 2;
+
+SELECT ride_id FROM core.rides WHERE ds = '2019-06-01' AND ride_id IN (101, 102, 103, 104, 105, 106, 107, 108, 109, 110, 111, 112, 113, 114, 115, 116, 117, 118, 119, 120, 121, 122, 123, 124, 125, 126, 127, 128, 129, 130, 131, 132, 133, 134, 135, 136, 137, 138, 139, 140);
+
+WITH base AS (
+    SELECT r.ride_id, r.region, r.fare_usd, r.duration_sec, p.segment, d.tenure_bucket
+    FROM core.rides r
+    JOIN core.passengers p ON r.passenger_id = p.passenger_id
+    JOIN core.drivers d ON r.driver_id = d.driver_id
+    WHERE r.ds BETWEEN '2019-06-01' AND '2019-06-30'
+), by_segment AS (
+    SELECT region, segment, count(*) AS rides, avg(fare_usd) AS avg_fare
+    FROM base
+    GROUP BY region, segment
+), by_tenure AS (
+    SELECT region, tenure_bucket, count(*) AS rides, avg(duration_sec) AS avg_duration
+    FROM base
+    GROUP BY region, tenure_bucket
+)
+SELECT s.region, s.segment, s.rides, s.avg_fare, t.tenure_bucket, t.rides AS tenure_rides, t.avg_duration
+FROM by_segment s
+JOIN by_tenure t ON s.region = t.region
+ORDER BY s.region, s.segment, t.tenure_bucket;
+
+SELECT region, array_agg(DISTINCT driver_id) AS drivers, map_agg(driver_id, fare_usd) AS fares
+FROM core.rides
+WHERE ds = '2019-06-01'
+GROUP BY region;
+
+SELECT count(*) FROM core.rides WHERE ds = '2019-06-01';
+
+SELECT r.ride_id, r.fare_usd, f.fee_usd, r.fare_usd - f.fee_usd AS net_usd
+FROM core.rides r
+JOIN finance.fees f ON r.ride_id = f.ride_id AND f.ds = r.ds
+WHERE r.ds = '2019-06-01' AND (r.region = 'sfo' OR r.region = 'nyc') AND NOT (f.fee_type = 'refund');
+
+SELECT passenger_id, ds, fare_usd,
+       sum(fare_usd) OVER (PARTITION BY passenger_id ORDER BY ds) AS cumulative_fare,
+       lag(fare_usd, 1) OVER (PARTITION BY passenger_id ORDER BY ds) AS previous_fare,
+       lead(fare_usd, 1) OVER (PARTITION BY passenger_id ORDER BY ds) AS next_fare
+FROM core.rides
+WHERE ds >= '2019-06-01';
+
+SELECT s.region, s.ds, s.supply_hours, d.demand_requests, d.demand_requests / nullif(s.supply_hours, 0) AS requests_per_supply_hour
+FROM (
+    SELECT region, ds, sum(duration_sec) / 3600.0 AS supply_hours
+    FROM core.driver_sessions
+    WHERE ds >= '2019-06-01' AND status IN ('online', 'on_ride')
+    GROUP BY region, ds
+) s
+JOIN (
+    SELECT region, ds, count(*) AS demand_requests
+    FROM events.ride_requests
+    WHERE ds >= '2019-06-01'
+    GROUP BY region, ds
+) d ON s.region = d.region AND s.ds = d.ds
+ORDER BY s.region, s.ds;
+
+SELECT t.ride_id, t.fare_usd FROM core.rides t WHERE t.ds = '2019-06-01' AND t.fare_usd > (SELECT avg(fare_usd) FROM core.rides WHERE ds = '2019-06-01');
+
+SELECT region, ds FROM core.rides GROUP BY GROUPING SETS ((region), (ds), (region, ds));
+
+SELECT x.region, x.rides, y.drivers, z.passengers
+FROM (SELECT region, count(*) AS rides FROM core.rides WHERE ds = '2019-06-01' GROUP BY region) x
+JOIN (SELECT region, count(DISTINCT driver_id) AS drivers FROM core.rides WHERE ds = '2019-06-01' GROUP BY region) y ON x.region = y.region
+JOIN (SELECT region, count(DISTINCT passenger_id) AS passengers FROM core.rides WHERE ds = '2019-06-01' GROUP BY region) z ON x.region = z.region;
@@ -1,7 +1,7 @@
 import logging
 import unittest
 
-from mock import patch
+from mock import patch, MagicMock
 from neo4j.v1 import GraphDatabase
 from pyhocon import ConfigFactory
 
@@ -92,6 +92,135 @@ class TestRemoveStaleData(unittest.TestCase):
             targets = {'foo', 'bar'}
             task._validate_staleness_pct(total_records=total_records, stale_records=stale_records, types=targets)
 
+    def _create_task(self, use_apoc=False, create_index=True):
+        # type: (bool, bool) -> Neo4jStalenessRemovalTask
+        task = Neo4jStalenessRemovalTask()
+        job_config = ConfigFactory.from_dict({
+            'job.identifier': 'remove_stale_data_job',
+            '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.NEO4J_END_POINT_KEY):
+                'foobar',
+            '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.NEO4J_USER):
+                'foo',
+            '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.NEO4J_PASSWORD):
+                'bar',
+            '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.STALENESS_MAX_PCT):
+                5,
+            '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.TARGET_NODES):
+                ['Table'],
+            '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.TARGET_RELATIONS):
+                ['COLUMN'],
+            '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.USE_APOC_PERIODIC_ITERATE):
+                use_apoc,
+            '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.CREATE_PUBLISHED_TAG_INDEX):
+                create_index,
+            neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo'
+        })
+        task.init(job_config)
+        return task
+
+    def _run(self, task, counts):
+        # type: (Neo4jStalenessRemovalTask, list) -> list
+        """
+        Runs the task where each Cypher query returns a record from counts in order and returns executed statements
+        """
+        records = iter(counts)
+        statements = []
+
+        def execute(statement, param_dict={}):
+            statements.append(' '.join(statement.split()))
+            result = MagicMock()
+            result.single.return_value = next(records, {'count': 0, 'failedBatches': 0, 'errorMessages': {}})
+            return result
+
+        with patch.object(task, '_execute_cypher_query', side_effect=execute):
+            task.run()
+        return statements
+
+    def test_run(self):
+        # type: () -> None
+        with patch.object(GraphDatabase, 'driver'):
+            task = self._create_task()
+            statements = self._run(task, [None,  # index creation
+                                          {'count': 1000}, {'count': 990},  # total and fresh Table
+                                          {'count': 2000}, {'count': 20},  # total and stale COLUMN
+                                          {'count': 8}, {'count': 0},  # stale Table with published_tag
+                                          {'count': 2}, {'count': 0},  # stale Table without published_tag
+                                          {'count': 20}, {'count': 0}])  # stale COLUMN
+
+        self.assertEqual(statements[0], 'CREATE INDEX ON :Table(published_tag)')
+        self.assertEqual(statements[1], 'MATCH (n:Table) RETURN count(n) as count')
+        self.assertEqual(statements[2], 'MATCH (n:Table) WHERE n.published_tag = $published_tag '
+                                        'RETURN count(n) as count')
+        self.assertEqual(statements[3], 'MATCH ()-[r:COLUMN]->() RETURN count(r) as count')
+        self.assertTrue(statements[5].startswith('MATCH (n:Table) WHERE n.published_tag < $published_tag '
+                                                 'OR n.published_tag > $published_tag WITH n LIMIT $batch_size'))
+        self.assertTrue(statements[7].startswith('MATCH (n:Table) WHERE NOT EXISTS(n.published_tag)'))
+        self.assertTrue(statements[9].startswith('MATCH ()-[r:COLUMN]->()'))
+        self.assertEqual(len(statements), 11)
+
+    def test_default_config(self):
+        # type: () -> None
+        with patch.object(GraphDatabase, 'driver'):
+            task = Neo4jStalenessRemovalTask()
+            job_config = ConfigFactory.from_dict({
+                'job.identifier': 'remove_stale_data_job',
+                '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.NEO4J_END_POINT_KEY):
+                    'foobar',
+                '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.NEO4J_USER):
+                    'foo',
+                '{}.{}'.format(task.get_scope(), neo4j_staleness_removal_task.NEO4J_PASSWORD):
+                    'bar',
+                neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo'
+            })
+            task.init(job_config)
+
+        self.assertEqual(task.batch_size, 100)
+        self.assertFalse(task.create_published_tag_index)
+        self.assertFalse(task.use_apoc_periodic_iterate)
+
+    def test_run_without_index(self):
+        # type: () -> None
+        with patch.object(GraphDatabase, 'driver'):
+            task = self._create_task(create_index=False)
+            statements = self._run(task, [{'count': 1000}, {'count': 990},
+                                          {'count': 2000}, {'count': 20}])
+
+        self.assertFalse([s for s in statements if s.startswith('CREATE INDEX')])
+        self.assertEqual(statements[0], 'MATCH (n:Table) RETURN count(n) as count')
+
+    def test_run_over_threshold(self):
+        # type: () -> None
+        with patch.object(GraphDatabase, 'driver'):
+            task = self._create_task()
+            # 10% of Table is stale
+            self.assertRaises(Exception, self._run, task, [None, {'count': 1000}, {'count': 900}])
+
+    def test_run_with_apoc(self):
+        # type: () -> None
+        with patch.object(GraphDatabase, 'driver'):
+            task = self._create_task(use_apoc=True)
+            statements = self._run(task, [None,
+                                          {'count': 1000}, {'count': 990},
+                                          {'count': 2000}, {'count': 20},
+                                          {'count': 10, 'failedBatches': 0, 'errorMessages': {}},
+                                          {'count': 20, 'failedBatches': 0, 'errorMessages': {}}])
+
+        self.assertEqual(len(statements), 7)
+        self.assertIn('CALL apoc.periodic.iterate', statements[5])
+        self.assertIn("'DETACH DELETE n'", statements[5])
+        self.assertIn("'MATCH ()-[r:COLUMN]->()", statements[6])
+        self.assertIn("'DELETE r'", statements[6])
+
+    def test_run_with_apoc_failure(self):
+        # type: () -> None
+        with patch.object(GraphDatabase, 'driver'):
+            task = self._create_task(use_apoc=True)
+            self.assertRaises(Exception, self._run, task,
+                              [None,
+                               {'count': 1000}, {'count': 990},
+                               {'count': 2000}, {'count': 20},
+                               {'count': 10, 'failedBatches': 1, 'errorMessages': {'LockClientStopped': 1}}])
+
 
 if __name__ == '__main__':
     unittest.main()
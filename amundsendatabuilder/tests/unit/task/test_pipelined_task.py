@@ -0,0 +1,131 @@
+import unittest
+
+from mock import MagicMock
+from pyhocon import ConfigFactory, ConfigTree  # noqa: F401
+from typing import Any  # noqa: F401
+
+from databuilder.extractor.base_extractor import Extractor
+from databuilder.loader.base_loader import Loader
+from databuilder.task.pipelined_task import PipelinedTask
+from databuilder.transformer.base_transformer import Transformer
+
+
+class TestPipelinedTask(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.conf = ConfigFactory.from_dict({'task.queue_size': 2,
+                                             'task.progress_report_frequency': 10})
+
+    def test_run(self):
+        # type: () -> None
+        loader = ListLoader()
+        task = PipelinedTask(extractor=RangeExtractor(100), loader=loader, transformer=SkipOddTransformer())
+        task.init(self.conf)
+        task.run()
+
+        self.assertEqual(loader.records, list(range(0, 100, 2)))
+        self.assertEqual(task.stage_metrics['extractor'].count, 100)
+        self.assertEqual(task.stage_metrics['transformer'].count, 100)
+        self.assertEqual(task.stage_metrics['loader'].count, 50)
+        self.assertTrue(loader.closed)
+
+    def test_run_failure(self):
+        # type: () -> None
+        extractor = RangeExtractor(1000)
+        extractor.close = MagicMock()
+        loader = ListLoader()
+        transformer = SkipOddTransformer(fail_on=10)
+        transformer.close = MagicMock()
+
+        task = PipelinedTask(extractor=extractor, loader=loader, transformer=transformer)
+        task.init(self.conf)
+        self.assertRaises(ValueError, task.run)
+
+        # Extractor is stopped by back pressure and failure
+        self.assertLess(task.stage_metrics['extractor'].count, 1000)
+        self.assertEqual(loader.records, list(range(0, 10, 2)))
+        self.assertTrue(extractor.close.called)
+        self.assertTrue(transformer.close.called)
+        self.assertTrue(loader.closed)
+
+    def test_run_loader_failure(self):
+        # type: () -> None
+        loader = ListLoader(fail_on=4)
+        task = PipelinedTask(extractor=RangeExtractor(1000), loader=loader)
+        task.init(self.conf)
+        self.assertRaises(ValueError, task.run)
+        self.assertEqual(loader.records, [0, 1, 2, 3])
+        self.assertTrue(loader.closed)
+
+
+class RangeExtractor(Extractor):
+    def __init__(self, size):
+        # type: (int) -> None
+        self._size = size
+
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        self._iter = iter(range(self._size))
+
+    def extract(self):
+        # type: () -> Any
+        # Wrapped in list as 0 is regarded as end of records
+        try:
+            return [next(self._iter)]
+        except StopIteration:
+            return None
+
+    def get_scope(self):
+        # type: () -> str
+        return 'extractor.range'
+
+
+class SkipOddTransformer(Transformer):
+    def __init__(self, fail_on=None):
+        # type: (Any) -> None
+        self._fail_on = fail_on
+
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        pass
+
+    def transform(self, record):
+        # type: (Any) -> Any
+        if record[0] == self._fail_on:
+            raise ValueError('Failed on {}'.format(record))
+        return record if record[0] % 2 == 0 else None
+
+    def get_scope(self):
+        # type: () -> str
+        return 'transformer.skip_odd'
+
+
+class ListLoader(Loader):
+    def __init__(self, fail_on=None):
+        # type: (Any) -> None
+        self._fail_on = fail_on
+        self.records = []  # type: list
+        self.closed = False
+
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        pass
+
+    def load(self, record):
+        # type: (Any) -> None
+        if record[0] == self._fail_on:
+            raise ValueError('Failed on {}'.format(record))
+        self.records.append(record[0])
+
+    def close(self):
+        # type: () -> None
+        self.closed = True
+
+    def get_scope(self):
+        # type: () -> str
+        return 'loader.list'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -112,6 +112,75 @@ class TestJobStatsd(unittest.TestCase):
             self.assertEqual(mock_statsd.return_value.incr.call_count, 1)
 
 
+class TestJobBatch(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.temp_dir_path = tempfile.mkdtemp()
+        self.dest_file_name = '{}/superhero.json'.format(self.temp_dir_path)
+        self.conf = ConfigFactory.from_dict(
+            {'loader.superhero.dest_file': self.dest_file_name,
+             'task.batch_size': 1})
+
+    def tearDown(self):
+        # type: () -> None
+        shutil.rmtree(self.temp_dir_path)
+
+    def test_job(self):
+        # type: () -> None
+        loader = BatchSuperHeroLoader()
+        task = DefaultTask(BatchSuperHeroExtractor(), loader, transformer=SuperHeroReverseNameTransformer())
+
+        job = DefaultJob(self.conf, task)
+        job.launch()
+
+        expected_list = ['{"hero": "Super man", "name": "tneK kralC"}',
+                         '{"hero": "Bat man", "name": "enyaW ecurB"}']
+        with open(self.dest_file_name, 'r') as file:
+            for expected in expected_list:
+                actual = file.readline().rstrip('\n')
+                self.assertEqual(expected, actual)
+            self.assertFalse(file.readline())
+
+        # Two batches of 1 record. Last empty batch is not loaded
+        self.assertEqual(loader.batch_count, 2)
+
+    def test_job_without_batch_support(self):
+        # type: () -> None
+        loader = BatchSuperHeroLoader()
+        task = DefaultTask(SuperHeroExtractor(), loader)
+
+        job = DefaultJob(self.conf, task)
+        job.launch()
+
+        self.assertEqual(loader.batch_count, 0)
+
+    def test_job_batch_disabled_by_default(self):
+        # type: () -> None
+        loader = BatchSuperHeroLoader()
+        task = DefaultTask(BatchSuperHeroExtractor(), loader)
+
+        job = DefaultJob(ConfigFactory.from_dict({'loader.superhero.dest_file': self.dest_file_name}), task)
+        job.launch()
+
+        self.assertEqual(loader.batch_count, 0)
+
+    def test_job_same_output_with_and_without_batch(self):
+        # type: () -> None
+        outputs = []
+        for batch_size in (0, 1, 2, 1000):
+            conf = ConfigFactory.from_dict({'loader.superhero.dest_file': self.dest_file_name,
+                                            'task.batch_size': batch_size})
+            task = DefaultTask(BatchSuperHeroExtractor(), BatchSuperHeroLoader(),
+                               transformer=SuperHeroReverseNameTransformer())
+            DefaultJob(conf, task).launch()
+            with open(self.dest_file_name, 'r') as file:
+                outputs.append(file.read())
+
+        self.assertTrue(outputs[0])
+        self.assertEqual(outputs, [outputs[0]] * 4)
+
+
 class SuperHeroExtractor(Extractor):
     def __init__(self):
         # type: () -> None
@@ -187,5 +256,24 @@ class SuperHeroLoader(Loader):
         return 'loader.superhero'
 
 
+class BatchSuperHeroExtractor(SuperHeroExtractor):
+    def extract_batch(self, batch_size):
+        # type: (int) -> Any
+        return super(BatchSuperHeroExtractor, self).extract_batch(batch_size)
+
+
+class BatchSuperHeroLoader(SuperHeroLoader):
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        super(BatchSuperHeroLoader, self).init(conf)
+        self.batch_count = 0
+
+    def load_batch(self, records):
+        # type: (Any) -> None
+        self.batch_count += 1
+        for record in records:
+            self.load(record)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyhocon import ConfigTree, ConfigFactory  # noqa: F401
+from typing import Any, List  # noqa: F401
+
+from databuilder.extractor.base_extractor import Extractor
+from databuilder.job.parallel_job import ParallelJob, where_clause_shard_func
+from databuilder.loader.file_system_neo4j_csv_loader import FsNeo4jCSVLoader
+from databuilder.models.table_metadata import TableMetadata
+from databuilder.publisher.base_publisher import Publisher
+from databuilder.publisher.neo4j_csv_publisher import list_files
+from databuilder.task.task import DefaultTask
+
+
+class TestParallelJob(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.temp_dir_path = tempfile.mkdtemp()
+        self.node_dir = os.path.join(self.temp_dir_path, 'nodes')
+        self.relation_dir = os.path.join(self.temp_dir_path, 'relations')
+        self.conf = ConfigFactory.from_dict(
+            {'job.num_shards': 3,
+             'loader.filesystem_csv_neo4j.node_dir_path': self.node_dir,
+             'loader.filesystem_csv_neo4j.relationship_dir_path': self.relation_dir,
+             'publisher.file_listing.node_dir_path': self.node_dir})
+
+    def tearDown(self):
+        # type: () -> None
+        shutil.rmtree(self.temp_dir_path)
+
+    def test_job(self):
+        # type: () -> None
+        publisher = FileListingPublisher()
+        job = ParallelJob(conf=self.conf,
+                          task_factory=create_task,
+                          shard_func=where_clause_shard_func('extractor.sharded_table.where_clause_suffix',
+                                                             'MOD(id, {num_shards}) = {shard_index}'),
+                          publisher=publisher)
+        job.launch()
+
+        self.assertEqual(sorted(set(os.path.basename(os.path.dirname(f)) for f in publisher.files)),
+                         ['shard_0', 'shard_1', 'shard_2'])
+
+        self.assertEqual(len(publisher.table_rows), 10)
+
+        # Directories are deleted after publish
+        self.assertFalse(os.path.exists(self.node_dir))
+        self.assertFalse(os.path.exists(self.relation_dir))
+
+
+def create_task():
+    # type: () -> DefaultTask
+    return DefaultTask(extractor=ShardedTableExtractor(), loader=FsNeo4jCSVLoader())
+
+
+class ShardedTableExtractor(Extractor):
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        where_clause = conf.get_string('where_clause_suffix')
+        num_shards, shard_index = [int(s) for s in where_clause[len('MOD(id, '):].split(') = ')]
+        self._iter = iter([TableMetadata('hive', 'gold', 'test_schema', 'test_table{}'.format(i), None)
+                           for i in range(10) if i % num_shards == shard_index])
+
+    def extract(self):
+        # type: () -> Any
+        try:
+            return next(self._iter)
+        except StopIteration:
+            return None
+
+    def get_scope(self):
+        # type: () -> str
+        return 'extractor.sharded_table'
+
+
+class FileListingPublisher(Publisher):
+    def init(self, conf):
+        # type: (ConfigTree) -> None
+        self._node_dir = conf.get_string('node_dir_path')
+        self.files = []  # type: List[str]
+
+    def publish_impl(self):
+        # type: () -> None
+        self.files = list_files(self._node_dir)
+        self.table_rows = []  # type: List[str]
+        for table_file in [f for f in self.files if os.path.basename(f).startswith('Table_')]:
+            with open(table_file, 'r') as f:
+                self.table_rows.extend(f.readlines()[1:])
+
+    def get_scope(self):
+        # type: () -> str
+        return 'publisher.file_listing'
+
+
+if __name__ == '__main__':
+    unittest.main()
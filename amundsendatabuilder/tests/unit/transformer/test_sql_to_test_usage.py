@@ -7,9 +7,8 @@ from pyhocon import ConfigFactory
 
 from databuilder.extractor.hive_table_metadata_extractor import HiveTableMetadataExtractor
 from databuilder.models.table_metadata import TableMetadata, ColumnMetadata
-if six.PY2:
-    from databuilder.models.table_column_usage import TableColumnUsage, ColumnReader
-    from databuilder.transformer.sql_to_table_col_usage_transformer import SqlToTblColUsageTransformer
+from databuilder.models.table_column_usage import TableColumnUsage, ColumnReader
+from databuilder.transformer.sql_to_table_col_usage_transformer import SqlToTblColUsageTransformer
 
 
 @pytest.mark.skipif(
@@ -50,6 +49,121 @@ class TestSqlToTblColUsageTransformer(unittest.TestCase):
             self.assertEqual(expected.__repr__(), actual.__repr__())
 
 
+class TestSqlToTblColUsageTransformerParallel(unittest.TestCase):
+
+    def test_transform_batch(self):
+        # type: () -> None
+        config = ConfigFactory.from_dict({
+            SqlToTblColUsageTransformer.DATABASE_NAME: 'database',
+            SqlToTblColUsageTransformer.USER_EMAIL_ATTRIBUTE_NAME: 'email',
+            SqlToTblColUsageTransformer.SQL_STATEMENT_ATTRIBUTE_NAME: 'statement',
+            SqlToTblColUsageTransformer.NUM_WORKERS: 2,
+            SqlToTblColUsageTransformer.DISPATCH_CHUNK_SIZE: 2,
+            SqlToTblColUsageTransformer.ENABLE_PREFILTER: False
+        })
+
+        with patch.object(HiveTableMetadataExtractor, 'extract') as mock_extract,\
+                patch.object(HiveTableMetadataExtractor, 'init'):
+            mock_extract.side_effect = [
+                TableMetadata('hive', 'gold', 'test_schema1', 'test_table1', 'test_table1', [
+                    ColumnMetadata('test_id1', 'description of test_table1', 'bigint', 0)]), None]
+
+            transformer = SqlToTblColUsageTransformer()
+            transformer.init(config)
+            self.assertEqual(transformer.get_batch_size(), 4)
+
+            records = [Foo(email='user{}@example.com'.format(i),
+                           statement='SELECT foo, bar FROM test_schema{}.test_table{}'.format(i, i))
+                       for i in range(5)]
+            records.insert(2, Foo(email='john@example.com', statement='NOT A SQL STATEMENT'))
+            try:
+                actual = transformer.transform_batch(records)
+                single = transformer.transform(Foo(email='john@example.com',
+                                                   statement='SELECT foo FROM test_table1'))
+            finally:
+                transformer.close()
+
+            self.assertEqual(len(actual), 6)
+            self.assertIsNone(actual[2])
+            for i, usage in enumerate(actual[:2] + actual[3:]):
+                expected = TableColumnUsage(col_readers=[
+                    ColumnReader(database='database', cluster='gold', schema='test_schema{}'.format(i),
+                                 table='test_table{}'.format(i), column='*',
+                                 user_email='user{}@example.com'.format(i))])
+                self.assertEqual(repr(expected), repr(usage))
+
+            expected = TableColumnUsage(col_readers=[
+                ColumnReader(database='database', cluster='gold', schema='test_schema1', table='test_table1',
+                             column='*', user_email='john@example.com')])
+            self.assertEqual(repr(expected), repr(single))
+
+    def test_transform_with_parse_cache(self):
+        # type: () -> None
+        for num_workers in (1, 2):
+            config = ConfigFactory.from_dict({
+                SqlToTblColUsageTransformer.DATABASE_NAME: 'database',
+                SqlToTblColUsageTransformer.USER_EMAIL_ATTRIBUTE_NAME: 'email',
+                SqlToTblColUsageTransformer.SQL_STATEMENT_ATTRIBUTE_NAME: 'statement',
+                SqlToTblColUsageTransformer.NUM_WORKERS: num_workers,
+                SqlToTblColUsageTransformer.ENABLE_PREFILTER: False
+            })
+
+            with patch.object(HiveTableMetadataExtractor, 'extract') as mock_extract, \
+                    patch.object(HiveTableMetadataExtractor, 'init'):
+                mock_extract.side_effect = [None]
+
+                transformer = SqlToTblColUsageTransformer()
+                transformer.init(config)
+                records = [Foo(email='user{}@example.com'.format(i),
+                               statement="SELECT foo FROM test_schema1.test_table1 WHERE ds = '2019-01-0{}'"
+                               .format(i))
+                           for i in range(1, 4)]
+                try:
+                    actual = transformer.transform_batch(records[:2]) + [transformer.transform(records[2])]
+                    parse_cache = transformer._parse_cache
+                finally:
+                    transformer.close()
+
+                for i, usage in enumerate(actual, 1):
+                    expected = TableColumnUsage(col_readers=[
+                        ColumnReader(database='database', cluster='gold', schema='test_schema1',
+                                     table='test_table1', column='*', user_email='user{}@example.com'.format(i))])
+                    self.assertEqual(repr(expected), repr(usage))
+                # Parsed once
+                self.assertEqual(parse_cache.hit_count, 2 if num_workers == 1 else 1)
+
+    def test_transform_with_prefilter(self):
+        # type: () -> None
+        config = ConfigFactory.from_dict({
+            SqlToTblColUsageTransformer.DATABASE_NAME: 'database',
+            SqlToTblColUsageTransformer.USER_EMAIL_ATTRIBUTE_NAME: 'email',
+            SqlToTblColUsageTransformer.SQL_STATEMENT_ATTRIBUTE_NAME: 'statement'
+        })
+
+        with patch.object(HiveTableMetadataExtractor, 'extract') as mock_extract, \
+                patch.object(HiveTableMetadataExtractor, 'init'), \
+                patch.object(SqlToTblColUsageTransformer, 'no_select_counts', 0), \
+                patch.object(SqlToTblColUsageTransformer, 'simple_select_counts', 0):
+            mock_extract.side_effect = [None]
+
+            transformer = SqlToTblColUsageTransformer()
+            transformer.init(config)
+            try:
+                actual = transformer.transform_batch([
+                    Foo(email='john@example.com', statement='SHOW TABLES'),
+                    Foo(email='john@example.com', statement='SELECT foo FROM test_schema1.test_table1'),
+                    Foo(email='john@example.com', statement='SELECT count(*) FROM test_schema1.test_table1')])
+            finally:
+                transformer.close()
+
+            self.assertEqual((SqlToTblColUsageTransformer.no_select_counts,
+                              SqlToTblColUsageTransformer.simple_select_counts), (1, 1))
+            expected = TableColumnUsage(col_readers=[
+                ColumnReader(database='database', cluster='gold', schema='test_schema1', table='test_table1',
+                             column='*', user_email='john@example.com')])
+            self.assertEqual([None, repr(expected), None], [usage and repr(usage) for usage in actual])
+
+
 class Foo(object):
     def __init__(self, email, statement):
         # type: (str, str) -> None
@@ -0,0 +1,48 @@
+import os
+import re
+import unittest
+
+from mock import patch
+
+from databuilder.sql_parser.usage.presto.antlr_generated.SqlBaseParser import SqlBaseParser
+from databuilder.sql_parser.usage.presto.column_usage_provider import ColumnUsageProvider
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'resources', 'presto_queries', 'queries.sql')
+
+
+def _get_columns(stmt, sll_first):
+    # type: (str, bool) -> str
+    try:
+        return repr(ColumnUsageProvider.get_columns(stmt, sll_first=sll_first))
+    except Exception as e:
+        return 'Failed: {}'.format(e)
+
+
+class TestColumnUsageProviderTwoStage(unittest.TestCase):
+
+    def test_same_as_ll(self):
+        # type: () -> None
+        with open(CORPUS_PATH) as f:
+            lines = [line for line in f if not line.startswith('--')]
+        corpus = [stmt for stmt in re.split(r';\s*$', ''.join(lines), flags=re.MULTILINE) if stmt.strip()]
+        self.assertGreater(len(corpus), 20)
+
+        for stmt in corpus:
+            self.assertEqual(_get_columns(stmt, sll_first=True), _get_columns(stmt, sll_first=False), stmt)
+
+    def test_fall_back_to_ll(self):
+        # type: () -> None
+        original = SqlBaseParser.singleStatement
+        with patch.object(SqlBaseParser, 'singleStatement', autospec=True, side_effect=original) as mock_parse:
+            self.assertEqual(_get_columns('SELECT foo FROM bar', sll_first=True),
+                             "[Column(name='FOO', table=Table(name='BAR', schema=None, alias=None), col_alias=None)]")
+            self.assertEqual(mock_parse.call_count, 1)
+
+            # Syntax error fails SLL, and LL recovers from it
+            stmt = 'SELECT foo FROM bar WHERE'
+            self.assertEqual(_get_columns(stmt, sll_first=True), _get_columns(stmt, sll_first=False))
+            self.assertEqual(mock_parse.call_count, 1 + 2 + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from databuilder.sql_parser.usage.presto.column_usage_provider import ColumnUsageProvider
+from databuilder.sql_parser.usage.presto.statement_prefilter import prefilter, NO_SELECT, SIMPLE_SELECT
+
+
+class TestStatementPrefilter(unittest.TestCase):
+
+    def _assert_same_as_parser(self, stmt, expected_kind):
+        # type: (str, str) -> None
+        kind, columns = prefilter(stmt)
+        self.assertEqual(kind, expected_kind, stmt)
+        self.assertEqual(repr(columns), repr(ColumnUsageProvider.get_columns(stmt)), stmt)
+
+    def test_no_select(self):
+        # type: () -> None
+        for stmt in ['SHOW TABLES',
+                     'DESCRIBE test_schema.test_table',
+                     'CREATE TABLE foo (id bigint)',
+                     'DROP TABLE foo',
+                     'SET SESSION query_max_run_time = \'1h\'',
+                     "INSERT INTO foo VALUES (1, 'select'), (2, 'bar')",
+                     'DELETE FROM foo WHERE id = 1',
+                     'TABLE foo']:
+            self._assert_same_as_parser(stmt, NO_SELECT)
+
+    def test_simple_select(self):
+        # type: () -> None
+        for stmt in ['SELECT * FROM test_schema.test_table',
+                     'select foo, bar from test_table;',
+                     'SELECT DISTINCT foo AS f, bar b FROM test_table WHERE x = 1 GROUP BY 1, 2 ORDER BY f LIMIT 10',
+                     'SELECT t.foo, t.* FROM hive.test_schema.test_table AS t',
+                     'SELECT test_table.foo, bar FROM test_table',
+                     'SELECT "Foo" FROM "test_schema"."test_table" "t"',
+                     "SELECT foo -- comment\n FROM test_table /* comment */ WHERE ds = 'select'",
+                     'SELECT selected_at FROM test_table']:
+            self._assert_same_as_parser(stmt, SIMPLE_SELECT)
+
+    def test_full_parse(self):
+        # type: () -> None
+        for stmt in ['SELECT count(*) FROM test_table',
+                     'SELECT foo FROM test_table t JOIN test_table2 u ON t.id = u.id',
+                     'SELECT foo FROM test_table, test_table2',
+                     'SELECT foo FROM test_table WHERE id IN (SELECT id FROM test_table2)',
+                     'WITH t AS (SELECT foo FROM test_table) SELECT foo FROM t',
+                     'INSERT INTO foo SELECT bar FROM test_table',
+                     'EXPLAIN SELECT foo FROM test_table',
+                     'SELECT u.foo FROM test_table t',
+                     'SELECT date FROM test_table',
+                     'SELECT foo FROM test_table TABLESAMPLE BERNOULLI (10)',
+                     "SELECT foo FROM test_table WHERE ds = 'unterminated"]:
+            self.assertEqual(prefilter(stmt), (None, None), stmt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from databuilder.sql_parser.usage.parse_cache import ParseCache, get_fingerprint
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_get_fingerprint(self):
+        # type: () -> None
+        expected = 'select foo, bar from test_table1 where ds = ? and id in (?, ?)'
+        self.assertEqual(get_fingerprint("SELECT foo, bar FROM test_table1 WHERE ds = '2019-01-01' AND id IN (1, 2)"),
+                         expected)
+        self.assertEqual(get_fingerprint("""select foo,   bar
+                                            -- comment
+                                            from test_table1 /* another
+                                             comment */ where ds = 'it''s' and id in (10, 2.5e3);"""),
+                         expected)
+
+    def test_get_fingerprint_keeps_identifiers(self):
+        # type: () -> None
+        self.assertEqual(get_fingerprint('SELECT "Foo 1", t.col2 FROM schema1.table_2019 t'),
+                         'select "foo 1", t.col2 from schema1.table_2019 t')
+        self.assertNotEqual(get_fingerprint('SELECT foo FROM table1'), get_fingerprint('SELECT foo FROM table2'))
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        # type: () -> None
+        shutil.rmtree(self.temp_dir)
+
+    def test_lru(self):
+        # type: () -> None
+        cache = ParseCache(max_size=2)
+        key1 = ParseCache.get_key("SELECT foo FROM bar WHERE ds = '2019-01-01'")
+        self.assertEqual(key1, ParseCache.get_key("select foo from bar where ds = '2019-01-02'"))
+
+        self.assertIsNone(cache.get(key1))
+        cache.put(key1, ['foo'])
+        cache.put('key2', [])
+        self.assertEqual(cache.get(key1), ['foo'])
+        # key2 is the least recently used
+        cache.put('key3', ['bar'])
+        self.assertIsNone(cache.get('key2'))
+        self.assertEqual(cache.get('key3'), ['bar'])
+
+        self.assertEqual((cache.hit_count, cache.miss_count), (2, 2))
+        self.assertEqual(cache.get_hit_rate(), 0.5)
+        cache.close()
+
+    def test_persist(self):
+        # type: () -> None
+        path = os.path.join(self.temp_dir, 'parse_cache')
+        cache = ParseCache(max_size=10, path=path)
+        cache.put('key1', ['foo'])
+        cache.close()
+
+        cache = ParseCache(max_size=10, path=path)
+        self.assertEqual(cache.get('key1'), ['foo'])
+        self.assertEqual(cache.get('key1'), ['foo'])
+        self.assertIsNone(cache.get('key2'))
+        self.assertEqual((cache.hit_count, cache.disk_hit_count, cache.miss_count), (2, 1, 1))
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from databuilder.utils.compression import open_file
+
+
+class TestOpenFile(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.temp_dir = tempfile.mkdtemp()
+        self.content = '"KEY","NAME"\n"a","foo"\n"b","bar"\n'
+
+    def tearDown(self):
+        # type: () -> None
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_and_read(self):
+        # type: () -> None
+        for extension in ['', '.gz']:
+            for buffer_size in [-1, 0, 1, 2, 1024]:
+                path = os.path.join(self.temp_dir, 'test_{}.csv{}'.format(buffer_size, extension))
+                with open_file(path, 'w', buffer_size) as f:
+                    f.write(self.content)
+
+                with open_file(path, 'r') as f:
+                    self.assertEqual(f.read(), self.content)
+
+                with open_file(path, 'rb') as f:
+                    self.assertEqual(f.read(), self.content.encode('utf-8'))
+
+    def test_write_buffer(self):
+        # type: () -> None
+        path = os.path.join(self.temp_dir, 'test.csv')
+        f = open_file(path, 'w', 1024)
+        f.write(self.content)
+        # Not flushed per line
+        self.assertEqual(os.path.getsize(path), 0)
+        f.close()
+        self.assertEqual(os.path.getsize(path), len(self.content))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+from mock import MagicMock
+from pyhocon import ConfigFactory
+
+from databuilder.job.job import DefaultJob
+from databuilder.models.neo4j_csv_serde import _hash_row
+from databuilder.models.table_metadata import TableMetadata
+from databuilder.utils.dedup_cache import BloomFilterDedupCache, KeyHashSetDedupCache, LruDedupCache, \
+    NoopDedupCache, create_dedup_cache, get_dedup_cache
+
+
+class TestDedupCache(unittest.TestCase):
+
+    def test_key_hash_set(self):
+        # type: () -> None
+        cache = KeyHashSetDedupCache()
+        cache.init(ConfigFactory.from_dict({}))
+
+        self.assertEqual([cache.add(h) for h in [1, 2, 1, 3, 2]], [True, True, False, True, False])
+        self.assertEqual(cache.added_count, 3)
+        self.assertEqual(cache.duplicate_count, 2)
+
+    def test_lru(self):
+        # type: () -> None
+        cache = LruDedupCache()
+        cache.init(ConfigFactory.from_dict({LruDedupCache.MAX_SIZE: 2}))
+
+        self.assertEqual([cache.add(h) for h in [1, 2, 1, 3]], [True, True, False, True])
+        # 2 is evicted as least recently used, where 1 is still cached
+        self.assertTrue(cache.add(2))
+        self.assertFalse(cache.add(3))
+
+    def test_bloom_filter(self):
+        # type: () -> None
+        cache = BloomFilterDedupCache()
+        cache.init(ConfigFactory.from_dict({BloomFilterDedupCache.CAPACITY: 1000,
+                                            BloomFilterDedupCache.FALSE_POSITIVE_RATE: 0.01}))
+
+        new_count = sum(cache.add(hash(('row', i))) for i in range(1000))
+        # Small number of new rows can be regarded as duplicate by false positive
+        self.assertGreater(new_count, 950)
+        self.assertFalse(any(cache.add(hash(('row', i))) for i in range(1000)))
+
+    def test_create_dedup_cache(self):
+        # type: () -> None
+        cache = create_dedup_cache(ConfigFactory.from_dict({}))
+        # Bounded by default
+        self.assertIsInstance(cache, LruDedupCache)
+        self.assertEqual(cache._max_size, 100000)
+
+        cache = create_dedup_cache(ConfigFactory.from_dict(
+            {'job.dedup_cache.class_name': 'databuilder.utils.dedup_cache.LruDedupCache',
+             'job.dedup_cache.max_size': 10}))
+        self.assertIsInstance(cache, LruDedupCache)
+        self.assertEqual(cache._max_size, 10)
+
+    def test_job_scoped(self):
+        # type: () -> None
+        serialized = []
+
+        def run():
+            # type: () -> None
+            for _ in range(2):
+                table = TableMetadata('hive', 'gold', 'test_schema', 'test_table', None)
+                node = table.next_node()
+                while node:
+                    serialized.append(node)
+                    node = table.next_node()
+
+        task = MagicMock()
+        task.run.side_effect = run
+        DefaultJob(conf=ConfigFactory.from_dict({}), task=task).launch()
+
+        # Second table is deduped in the job
+        self.assertEqual([node['LABEL'] for node in serialized], ['Table', 'Database', 'Cluster', 'Schema'])
+        # Cache is discarded after the job
+        self.assertIsInstance(get_dedup_cache(), NoopDedupCache)
+
+    def test_hash_row(self):
+        # type: () -> None
+        # Built-in hash of -1 and -2 is the same
+        self.assertNotEqual(_hash_row({'KEY': -1, 'LABEL': 'Node'}), _hash_row({'KEY': -2, 'LABEL': 'Node'}))
+        self.assertEqual(_hash_row({'KEY': 'a', 'LABEL': 'Node'}), _hash_row({'LABEL': 'Node', 'KEY': 'a'}))
+        self.assertEqual(_hash_row({'KEY': 'a', 'tags': ['x']}), _hash_row({'KEY': 'a', 'tags': ['x']}))
+
+
+if __name__ == '__main__':
+    unittest.main()
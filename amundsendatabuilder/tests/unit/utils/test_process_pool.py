@@ -0,0 +1,65 @@
+import time
+import unittest
+from multiprocessing import TimeoutError
+
+from databuilder.utils.process_pool import OrderedProcessPool, WorkerError
+
+
+def _square(item):
+    # type: (int) -> int
+    if item < 0:
+        raise ValueError('negative item: {}'.format(item))
+    if item == 13:
+        # Hangs
+        time.sleep(60)
+    return item * item
+
+
+class TestOrderedProcessPool(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.pool = OrderedProcessPool(_square, num_workers=3, timeout_sec=1, chunk_size=4)
+
+    def tearDown(self):
+        # type: () -> None
+        self.pool.close()
+
+    def test_map(self):
+        # type: () -> None
+        items = list(range(12)) + [20, 30]
+        self.assertEqual(self.pool.map(items), [(item * item, None) for item in items])
+        # Pool is reused
+        self.assertEqual(self.pool.map([5]), [(25, None)])
+        self.assertEqual(self.pool.map([]), [])
+
+    def test_map_with_error(self):
+        # type: () -> None
+        results = self.pool.map([1, -1, 2])
+        self.assertEqual(results[0], (1, None))
+        self.assertIsNone(results[1][0])
+        self.assertIsInstance(results[1][1], WorkerError)
+        self.assertIn('negative item: -1', str(results[1][1]))
+        self.assertEqual(results[2], (4, None))
+        self.assertEqual(self.pool.restart_count, 0)
+
+    def test_map_with_timeout(self):
+        # type: () -> None
+        items = list(range(10, 30))
+        results = self.pool.map(items)
+
+        self.assertIsNone(results[3][0])
+        self.assertIsInstance(results[3][1], TimeoutError)
+        # Rest of the items including the ones after hung item in the same chunk are processed
+        self.assertEqual([result for i, result in enumerate(results) if i != 3],
+                         [(item * item, None) for item in items if item != 13])
+        self.assertEqual(self.pool.restart_count, 1)
+
+    def test_invalid_args(self):
+        # type: () -> None
+        self.assertRaises(ValueError, OrderedProcessPool, _square, 0, 1)
+        self.assertRaises(ValueError, OrderedProcessPool, _square, 1, 1, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()